@@ -6,4 +6,127 @@ dotenv.load_dotenv()
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
\ No newline at end of file
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Detection model
+# INFERENCE_BACKEND selects which weights are served: 'ultralytics' (.pt via torch) or 'onnx' (ONNX Runtime, CPU)
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'ultralytics').lower()
+PT_MODEL_PATH = os.getenv('PT_MODEL_PATH', os.path.join(BASE_DIR, 'services/models/cauliflower_model.pt'))
+ONNX_MODEL_PATH = os.getenv('ONNX_MODEL_PATH', os.path.join(BASE_DIR, 'services/models/cauliflower_model.onnx'))
+MODEL_PATH = os.getenv('MODEL_PATH', ONNX_MODEL_PATH if INFERENCE_BACKEND == 'onnx' else PT_MODEL_PATH)
+# INT8 variant produced by Training/quantize.py; served instead of the FP32 ONNX model when
+# its report shows no class losing more than INT8_MAX_MAP_DROP mAP50
+ONNX_INT8_MODEL_PATH = os.getenv('ONNX_INT8_MODEL_PATH', os.path.join(BASE_DIR, 'services/models/cauliflower_model.int8.onnx'))
+USE_INT8_MODEL = os.getenv('USE_INT8_MODEL', 'true').lower() == 'true'
+INT8_MAX_MAP_DROP = float(os.getenv('INT8_MAX_MAP_DROP', '0.01'))
+# ONNX Runtime thread pools; 0 means let the runtime decide
+ONNX_INTRA_OP_THREADS = int(os.getenv('ONNX_INTRA_OP_THREADS', '0'))
+ONNX_INTER_OP_THREADS = int(os.getenv('ONNX_INTER_OP_THREADS', '0'))
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', 'true').lower() == 'true'
+# How detections from overlapping tiles are merged: 'nms' (class-aware), 'soft_nms' or 'wbf'
+MERGE_STRATEGY = os.getenv('MERGE_STRATEGY', 'nms')
+MERGE_IOU_THRESHOLD = float(os.getenv('MERGE_IOU_THRESHOLD', '0.45'))
+# Detection confidence at or above which severity is reported as High / Medium
+SEVERITY_HIGH_THRESHOLD = float(os.getenv('SEVERITY_HIGH_THRESHOLD', '0.85'))
+SEVERITY_MEDIUM_THRESHOLD = float(os.getenv('SEVERITY_MEDIUM_THRESHOLD', '0.65'))
+# Tiling for /api/detect: 'exhaustive' runs every tile; 'vegetation' only tiles covering at
+# least ADAPTIVE_MIN_COVERAGE plant-coloured area; 'coarse' only tiles over boxes that one
+# downscaled pass over the whole image finds at ADAPTIVE_COARSE_CONF
+TILING_MODE = os.getenv('TILING_MODE', 'exhaustive')
+ADAPTIVE_MIN_COVERAGE = float(os.getenv('ADAPTIVE_MIN_COVERAGE', '0.02'))
+ADAPTIVE_COARSE_CONF = float(os.getenv('ADAPTIVE_COARSE_CONF', '0.05'))
+# Largest tile grid per image (0 = unlimited, the default); when set, bigger images are
+# detected at a reduced resolution, but never below TILING_MIN_SCALE of their original size
+TILING_MAX_TILES = int(os.getenv('TILING_MAX_TILES', '0'))
+TILING_MIN_SCALE = float(os.getenv('TILING_MIN_SCALE', '0.25'))
+# Number of tiles sent through the model in a single forward pass
+TILE_BATCH_SIZE = int(os.getenv('TILE_BATCH_SIZE', '8'))
+
+# Cross-request dynamic batching of tiles for /api/detect
+DYNAMIC_BATCHING_ENABLED = os.getenv('DYNAMIC_BATCHING_ENABLED', 'true').lower() == 'true'
+DYNAMIC_BATCH_MAX_SIZE = int(os.getenv('DYNAMIC_BATCH_MAX_SIZE', '16'))
+DYNAMIC_BATCH_MAX_WAIT_MS = float(os.getenv('DYNAMIC_BATCH_MAX_WAIT_MS', '5'))
+
+# Detection worker pool; requests beyond workers + queue get 503 with Retry-After
+DETECT_MAX_WORKERS = int(os.getenv('DETECT_MAX_WORKERS', '4'))
+DETECT_MAX_QUEUE = int(os.getenv('DETECT_MAX_QUEUE', '16'))
+DETECT_RETRY_AFTER_SECONDS = int(os.getenv('DETECT_RETRY_AFTER_SECONDS', '2'))
+
+# Largest image accepted by the multipart and raw-body upload endpoints
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(25 * 1024 * 1024)))
+
+# /api/detect/batch: images accepted per request (archive members included), and images of
+# one batch being read or detected at once, which bounds its memory use
+BATCH_MAX_IMAGES = int(os.getenv('BATCH_MAX_IMAGES', '1000'))
+BATCH_MAX_IN_FLIGHT = int(os.getenv('BATCH_MAX_IN_FLIGHT', '4'))
+
+# Detection result cache, keyed by image content, tuning parameters and model version.
+# The disk tier is disabled unless DETECT_CACHE_DISK_DIR is set.
+DETECT_CACHE_ENABLED = os.getenv('DETECT_CACHE_ENABLED', 'true').lower() == 'true'
+DETECT_CACHE_MEMORY_BYTES = int(os.getenv('DETECT_CACHE_MEMORY_BYTES', str(256 * 1024 * 1024)))
+DETECT_CACHE_DISK_DIR = os.getenv('DETECT_CACHE_DISK_DIR', '')
+DETECT_CACHE_DISK_TTL_SECONDS = float(os.getenv('DETECT_CACHE_DISK_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Raw per-tile predictions, kept in memory per image so changing conf_threshold, IoU or
+# severity bands re-merges them instead of re-running the model. While the cache is enabled
+# they are collected down to RAW_CONF_FLOOR (or the request's conf_threshold if lower), so the
+# threshold can be lowered to the floor too; raise the floor to decode and merge fewer boxes.
+RAW_CACHE_ENABLED = os.getenv('RAW_CACHE_ENABLED', 'true').lower() == 'true'
+RAW_CACHE_MEMORY_BYTES = int(os.getenv('RAW_CACHE_MEMORY_BYTES', str(256 * 1024 * 1024)))
+RAW_CONF_FLOOR = float(os.getenv('RAW_CONF_FLOOR', '0.05'))
+
+# Debug-only request profiling for /api/detect. When enabled, every PROFILE_EVERY_N-th
+# request (0 = none) and any request with the X-Profile header is run under cProfile.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILE_EVERY_N = int(os.getenv('PROFILE_EVERY_N', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '50'))
+
+# Annotated images. DEFAULT_RENDER_MODE is 'eager' (drawn and saved with the response),
+# 'lazy' (drawn on the first GET of image_url) or 'none' (detections only).
+DEFAULT_RENDER_MODE = os.getenv('DEFAULT_RENDER_MODE', 'eager')
+# Uploads kept for lazy rendering, and rendered images kept so repeat views are not redrawn
+RENDER_SOURCE_MEMORY_BYTES = int(os.getenv('RENDER_SOURCE_MEMORY_BYTES', str(256 * 1024 * 1024)))
+RENDER_OUTPUT_MEMORY_BYTES = int(os.getenv('RENDER_OUTPUT_MEMORY_BYTES', str(128 * 1024 * 1024)))
+
+# Encoding of annotated images: 'jpeg', 'webp' or 'png'; quality applies to jpeg/webp (1-100)
+PROCESSED_IMAGE_FORMAT = os.getenv('PROCESSED_IMAGE_FORMAT', 'jpeg')
+PROCESSED_IMAGE_QUALITY = int(os.getenv('PROCESSED_IMAGE_QUALITY', '85'))
+# Longest side of the thumbnail returned alongside each annotated image
+THUMBNAIL_MAX_DIM = int(os.getenv('THUMBNAIL_MAX_DIM', '256'))
+# Disk budget and lifetime of eagerly rendered images under static/processed_images
+PROCESSED_IMAGE_MAX_BYTES = int(os.getenv('PROCESSED_IMAGE_MAX_BYTES', str(1024 * 1024 * 1024)))
+PROCESSED_IMAGE_TTL_SECONDS = int(os.getenv('PROCESSED_IMAGE_TTL_SECONDS', str(7 * 24 * 3600)))
+PROCESSED_IMAGE_SWEEP_SECONDS = int(os.getenv('PROCESSED_IMAGE_SWEEP_SECONDS', '300'))
+
+# Video mode (/api/detect/video): the model runs on every VIDEO_FRAME_STRIDE-th frame and an
+# IoU tracker links its boxes across frames. A track ends after VIDEO_TRACK_MAX_MISSED sampled
+# frames without a match and is reported if seen on at least VIDEO_MIN_TRACK_HITS of them.
+VIDEO_FRAME_STRIDE = int(os.getenv('VIDEO_FRAME_STRIDE', '5'))
+VIDEO_TRACK_IOU = float(os.getenv('VIDEO_TRACK_IOU', '0.3'))
+VIDEO_TRACK_MAX_MISSED = int(os.getenv('VIDEO_TRACK_MAX_MISSED', '3'))
+VIDEO_MIN_TRACK_HITS = int(os.getenv('VIDEO_MIN_TRACK_HITS', '2'))
+# Sampled frames decoded ahead of inference, and the largest video or frame upload
+VIDEO_PREFETCH_FRAMES = int(os.getenv('VIDEO_PREFETCH_FRAMES', '4'))
+MAX_VIDEO_BYTES = int(os.getenv('MAX_VIDEO_BYTES', str(1024 * 1024 * 1024)))
+MAX_VIDEO_FRAMES = int(os.getenv('MAX_VIDEO_FRAMES', '10000'))
+
+# Plant metrics time series (/api/plant-metrics). Each metric keeps its last
+# TIMESERIES_RAW_CAPACITY readings plus per-minute and per-hour rollups (31 days and 2
+# years by default). Memory-mapped under TIMESERIES_DIR if set, in memory otherwise.
+TIMESERIES_DIR = os.getenv('TIMESERIES_DIR', '')
+TIMESERIES_RAW_CAPACITY = int(os.getenv('TIMESERIES_RAW_CAPACITY', '100000'))
+TIMESERIES_MINUTE_CAPACITY = int(os.getenv('TIMESERIES_MINUTE_CAPACITY', str(31 * 24 * 60)))
+TIMESERIES_HOUR_CAPACITY = int(os.getenv('TIMESERIES_HOUR_CAPACITY', str(2 * 366 * 24)))
+# Metrics with no readings yet are filled with simulated values on /api/plant-metrics, and
+# fresh simulated values are pushed to live subscribers every PLANT_METRICS_SIMULATE_INTERVAL seconds
+PLANT_METRICS_SIMULATE = os.getenv('PLANT_METRICS_SIMULATE', 'true').lower() == 'true'
+PLANT_METRICS_SIMULATE_INTERVAL = float(os.getenv('PLANT_METRICS_SIMULATE_INTERVAL', '5'))
+# Live metric push (/api/plant-metrics/stream and /ws): default and fastest per-client update
+# interval in seconds, subscriber cap, seconds a client may take to accept one message before
+# its stream is ended, and seconds between keepalives on an idle stream
+METRICS_PUSH_INTERVAL = float(os.getenv('METRICS_PUSH_INTERVAL', '1.0'))
+METRICS_PUSH_MIN_INTERVAL = float(os.getenv('METRICS_PUSH_MIN_INTERVAL', '0.1'))
+METRICS_PUSH_MAX_SUBSCRIBERS = int(os.getenv('METRICS_PUSH_MAX_SUBSCRIBERS', '10000'))
+METRICS_PUSH_SEND_TIMEOUT = float(os.getenv('METRICS_PUSH_SEND_TIMEOUT', '10'))
+METRICS_PUSH_KEEPALIVE = float(os.getenv('METRICS_PUSH_KEEPALIVE', '15'))
@@ -0,0 +1,176 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from starlette.datastructures import UploadFile
+import asyncio
+import zipfile
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple
+from app.config import BATCH_MAX_IMAGES, BATCH_MAX_IN_FLIGHT
+from app.routes.detection import error_response, run_detection
+from app.schemas.detection import BatchItemResponse, BatchParams, BatchSummary, DetectionParams
+from app.services.executor import detection_executor
+from app.utils.uploads import archive_images, is_archive, read_archive_member, read_form_to_disk, read_upload
+
+router = APIRouter()
+
+# (file name, coroutine function returning the image bytes)
+ImageSource = Tuple[str, Callable[[], Awaitable[bytes]]]
+
+async def run_when_free(fn, *args):
+    """Like submit_detection, but waits for a free executor slot instead of failing with 503.
+
+    Batches are bulk work: they should queue behind interactive requests, not be rejected.
+    """
+    job = await detection_executor.submit_when_free(fn, *args)
+    return await asyncio.wrap_future(job)
+
+def upload_source(upload: UploadFile) -> ImageSource:
+    return upload.filename or "upload.jpg", lambda: read_upload(upload)
+
+def archive_sources(archive: zipfile.ZipFile) -> List[ImageSource]:
+    # Members are read one at a time by detect_batch, so sharing the ZipFile is safe
+    return [
+        (info.filename, lambda info=info: asyncio.to_thread(read_archive_member, archive, info))
+        for info in archive_images(archive)
+    ]
+
+async def detect_item(index: int, file_name: str, image_bytes: bytes, params: DetectionParams) -> BatchItemResponse:
+    try:
+        result = await run_when_free(run_detection, image_bytes, params)
+    except Exception as e:
+        return BatchItemResponse(index=index, file_name=file_name, **error_response(e).model_dump())
+    return BatchItemResponse(
+        index=index,
+        file_name=file_name,
+        success=True,
+        message="Disease detection completed successfully",
+        **result._asdict()
+    )
+
+def read_error(index: int, file_name: str, e: Exception) -> BatchItemResponse:
+    message = e.detail if isinstance(e, HTTPException) else str(e)
+    return BatchItemResponse(
+        index=index, file_name=file_name, success=False, message=f"Error reading image: {message}", processing_time=0
+    )
+
+async def detect_batch(sources: List[ImageSource], params: DetectionParams) -> AsyncIterator[BaseModel]:
+    """Yield one BatchItemResponse per image as each finishes, then a BatchSummary.
+
+    At most BATCH_MAX_IN_FLIGHT images are decoded into memory and being detected at any
+    time; the next image is not read from its spooled upload until one finishes.
+    """
+    start_time = datetime.now()
+    pending = set()
+    succeeded = failed = 0
+
+    def count(item: BatchItemResponse) -> BatchItemResponse:
+        nonlocal succeeded, failed
+        if item.success:
+            succeeded += 1
+        else:
+            failed += 1
+        return item
+
+    try:
+        for index, (file_name, read) in enumerate(sources):
+            while len(pending) >= BATCH_MAX_IN_FLIGHT:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield count(task.result())
+            try:
+                image_bytes = await read()
+            except Exception as e:
+                yield count(read_error(index, file_name, e))
+                continue
+            pending.add(asyncio.create_task(detect_item(index, file_name, image_bytes, params)))
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield count(task.result())
+    finally:
+        # Client went away: drop what has not started (jobs already running finish in the background)
+        for task in pending:
+            task.cancel()
+
+    yield BatchSummary(
+        total=succeeded + failed,
+        succeeded=succeeded,
+        failed=failed,
+        processing_time=(datetime.now() - start_time).total_seconds()
+    )
+
+def ndjson_line(item: BaseModel) -> str:
+    return item.model_dump_json(by_alias=True) + "\n"
+
+def sse_event(item: BaseModel) -> str:
+    event = "done" if isinstance(item, BatchSummary) else "result"
+    return f"event: {event}\ndata: {item.model_dump_json(by_alias=True)}\n\n"
+
+@router.post(
+    "/detect/batch",
+    openapi_extra={"requestBody": {"content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}}
+    }}}}}
+)
+async def detect_disease_batch(request: Request, params: BatchParams = Query()):
+    """Detect diseases in many images, streaming each result as soon as it is ready.
+
+    The body is multipart/form-data with any number of file parts (images, or .zip archives
+    of images); tuning knobs are query parameters and apply to every image. Results are
+    NDJSON lines, or server-sent events with format=sse or Accept: text/event-stream, in
+    completion order; match them to inputs by index. The last line or event is a summary.
+    """
+    # Parsed here rather than by FastAPI, which closes uploaded files before a streamed body is sent.
+    # The whole body is received before detection starts, with every part spooled to disk.
+    form = await read_form_to_disk(request, BATCH_MAX_IMAGES)
+    archives: List[zipfile.ZipFile] = []
+
+    async def close():
+        for archive in archives:
+            archive.close()
+        await form.close()
+
+    try:
+        sources: List[ImageSource] = []
+        for _, value in form.multi_items():
+            if not isinstance(value, UploadFile):
+                continue
+            if is_archive(value):
+                archive = await asyncio.to_thread(zipfile.ZipFile, value.file)
+                archives.append(archive)
+                sources.extend(archive_sources(archive))
+            else:
+                sources.append(upload_source(value))
+    except zipfile.BadZipFile:
+        await close()
+        raise HTTPException(status_code=400, detail="Invalid zip archive")
+    except BaseException:
+        await close()
+        raise
+
+    if not sources:
+        await close()
+        raise HTTPException(status_code=400, detail="No images in request")
+    if len(sources) > BATCH_MAX_IMAGES:
+        await close()
+        raise HTTPException(status_code=413, detail=f"Batch exceeds the {BATCH_MAX_IMAGES} image limit")
+
+    sse = params.format == 'sse' or "text/event-stream" in request.headers.get("accept", "")
+    encode = sse_event if sse else ndjson_line
+
+    async def stream():
+        try:
+            async for item in detect_batch(sources, params):
+                yield encode(item)
+        finally:
+            await close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
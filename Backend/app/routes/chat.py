@@ -5,6 +5,7 @@ from groq import Groq
 import json
 from pydantic import BaseModel
 from app.config import GROQ_API_KEY
+from app.services.telemetry import external_call
 
 router = APIRouter()
 
@@ -36,23 +37,25 @@ def get_groq_response(messages: List[Dict], system_message: str) -> Tuple[str, s
         Tuple[str, str]: (thinking_process, response)
     """
     try:
-        completion = client.chat.completions.create(
-            model="deepseek-r1-distill-llama-70b",
-            messages=[
-                {"role": "system", "content": system_message},
-                *messages
-            ],
-            temperature=0.7,
-            max_tokens=4096,
-            top_p=0.95,
-            stream=True,
-            stop=None
-        )
-
-        response_text = ""
-        for chunk in completion:
-            chunk_content = chunk.choices[0].delta.content or ""
-            response_text += chunk_content
+        # Timed until the stream is fully consumed, not just until the first chunk
+        with external_call("groq", "chat_completion"):
+            completion = client.chat.completions.create(
+                model="deepseek-r1-distill-llama-70b",
+                messages=[
+                    {"role": "system", "content": system_message},
+                    *messages
+                ],
+                temperature=0.7,
+                max_tokens=4096,
+                top_p=0.95,
+                stream=True,
+                stop=None
+            )
+
+            response_text = ""
+            for chunk in completion:
+                chunk_content = chunk.choices[0].delta.content or ""
+                response_text += chunk_content
 
         # Split the response into thinking process and actual response
         parts = response_text.split("</think>")
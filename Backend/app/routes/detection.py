@@ -1,66 +1,375 @@
-from fastapi import APIRouter, HTTPException
-import cv2
-import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+import asyncio
 from datetime import datetime
-import os
 import base64
-from app.schemas.detection import DetectionResponse, ImageUpload
-
-from app.config import BASE_DIR
+import time
+import numpy as np
+from typing import Dict, List, Literal, NamedTuple, Optional, Tuple
+from app.schemas.detection import (
+    DetectionParams, DetectionResponse, ImageFileUpload, ImageUpload, RequeryParams
+)
+from app.services.registry import registry
+from app.services.cache import CachedPredictions, CachedResult, cache_key, image_id, raw_cache, result_cache
+from app.services.executor import detection_executor, QueueFullError
+from app.services.image_store import image_store
+from app.services.predict import TiledPredictor
+from app.services.profiling import request_profiler
+from app.services.render import RenderSource, annotation_renderer
+from app.services.singleflight import detection_flights
+from app.services.telemetry import current_breakdown, record_stage, stage
+from app.services.tiling import TilingPlan, tiling_policy, to_original
+from app.config import (
+    DYNAMIC_BATCHING_ENABLED, DETECT_RETRY_AFTER_SECONDS, RAW_CONF_FLOOR, THUMBNAIL_MAX_DIM
+)
+from app.utils.image_info import ImageInfo, image_info
+from app.utils.uploads import form_schema, read_form_model, read_request_body, read_upload
 
 router = APIRouter()
 
-# Create a directory for storing processed images
-UPLOAD_DIR = "static/processed_images"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Clients send this header (any value) to have their request profiled when profiling is enabled
+PROFILE_HEADER = "x-profile"
 
-@router.post("/detect", response_model=DetectionResponse)
-async def detect_disease(image_data: ImageUpload):
-    try:
-        from app.services.predict import TiledPredictor
-        predictor = TiledPredictor(
-            model_path=os.path.join(BASE_DIR, 'services/models/cauliflower_model.pt'),
-            tile_size=image_data.tile_size,
-            overlap=image_data.overlap,
-            conf_threshold=image_data.conf_threshold
+class DetectionResult(NamedTuple):
+    detections: List[Dict]
+    image_url: Optional[str]
+    thumbnail_url: Optional[str]
+    processing_time: float
+    cached: bool = False
+    image_id: Optional[str] = None
+    profile_id: Optional[str] = None
+    tiles_total: Optional[int] = None
+    tiles_skipped: Optional[int] = None
+    plan: Optional[Dict] = None
+    coalesced: bool = False
+
+def result_key(image_hash: str, params: DetectionParams, **extra) -> str:
+    # Keyed on the tile budget rather than the plan, whose working resolution needs the image
+    # size; the plan a result was detected with is stored with it
+    return cache_key(
+        image_hash,
+        registry.model_version(),
+        tile_size=params.tile_size,
+        overlap=params.overlap,
+        tiling=params.tiling,
+        max_tiles=params.max_tiles,
+        latency_budget_ms=params.latency_budget_ms,
+        conf_threshold=params.conf_threshold,
+        merge_strategy=params.merge_strategy,
+        iou_threshold=params.iou_threshold,
+        severity_high=params.severity_high,
+        severity_medium=params.severity_medium,
+        **extra
+    )
+
+def render_key(image_hash: str, params: DetectionParams, working_shape: Tuple[int, int]) -> str:
+    # A latency budget can plan the same request at another resolution later, with other boxes
+    return result_key(image_hash, params, working_shape=tuple(working_shape))
+
+def raw_key(image_hash: str, params: DetectionParams) -> str:
+    # Only the tiling changes what the model sees; everything else is applied in finalize().
+    # The working resolution is checked against the entry instead, so requery can find it.
+    return cache_key(
+        image_hash, registry.model_version(), tile_size=params.tile_size, overlap=params.overlap, tiling=params.tiling
+    )
+
+def cached_predictions(image_hash: str, params: DetectionParams,
+                       plan: Optional[TilingPlan] = None) -> Optional[CachedPredictions]:
+    """Raw predictions for this image and tiling, if collected at a floor low enough for params.
+
+    Without a plan, the one params give for the cached image's size is used.
+    """
+    if raw_cache is None:
+        return None
+    entry = raw_cache.get(raw_key(image_hash, params))
+    if entry is None or entry.raw.conf_floor > params.conf_threshold:
+        return None
+    plan = plan or plan_tiling(ImageInfo(*entry.raw.image_shape, format='other'), params)
+    if (entry.raw.working_shape or entry.raw.image_shape) != plan.working_shape:
+        return None
+    return entry
+
+def plan_tiling(info: ImageInfo, params: DetectionParams) -> TilingPlan:
+    seconds_per_tile = registry.get_predictor().seconds_per_tile if params.latency_budget_ms else None
+    return tiling_policy.plan_for(info, params, seconds_per_tile)
+
+def render_url(render_id: str, max_dim: Optional[int] = None) -> str:
+    url = f"/api/detect/render/{render_id}"
+    return f"{url}?max_dim={max_dim}" if max_dim else url
+
+def stored_rendering(render_id: str, max_dim: Optional[int] = None, decoded: Optional[np.ndarray] = None) -> str:
+    """URL of the annotated image in the image store, drawing and saving it unless already there."""
+    file_name = annotation_renderer.file_name(render_id, max_dim)
+    url = image_store.lookup(file_name)
+    if url is None:
+        # The store is the cache for these, so skip the in-memory output cache
+        rendered = annotation_renderer.render(render_id, max_dim, decoded, cache_output=False)
+        with stage("save"):
+            url = image_store.put(file_name, rendered.image)
+    return url
+
+def finalize(predictor, raw, params: DetectionParams) -> List[Dict]:
+    return predictor.finalize(
+        raw,
+        conf_threshold=params.conf_threshold,
+        merge_strategy=params.merge_strategy,
+        iou_threshold=params.iou_threshold,
+        severity_high=params.severity_high,
+        severity_medium=params.severity_medium
+    )
+
+def publish_annotation(render_id: str, image_bytes: bytes, detections: List[Dict], params: DetectionParams,
+                       image_shape: Optional[Tuple[int, int]] = None,
+                       decoded: Optional[np.ndarray] = None) -> Tuple[Optional[str], Optional[str]]:
+    """Make the annotated image and its thumbnail available the way params.render asks.
+
+    Returns their URLs (None for render=none). decoded is the full-size upload if already
+    decoded; it is drawn on in place.
+    """
+    if params.render == 'none':
+        return None, None
+    annotation_renderer.register(render_id, RenderSource(image_bytes, detections, image_shape))
+    if params.render == 'lazy':
+        return render_url(render_id, params.preview_max_dim), render_url(render_id, THUMBNAIL_MAX_DIM)
+    # The thumbnail comes second: it decodes the upload again at reduced scale rather than reuse decoded
+    image_url = stored_rendering(render_id, params.preview_max_dim, decoded)
+    return image_url, stored_rendering(render_id, THUMBNAIL_MAX_DIM)
+
+def run_detection(image_bytes: bytes, params: DetectionParams, image_hash: Optional[str] = None,
+                  use_cache: bool = True, batched: bool = True) -> DetectionResult:
+    """Decode, predict and publish the annotated image. Blocking; runs on the detection executor.
+
+    use_cache=False ignores cached results and raw predictions (fresh results are still stored,
+    and annotated images already in the image store are reused);
+    batched=False runs tiles on this thread instead of through the cross-request scheduler.
+    """
+    start_time = datetime.now()
+    image_hash = image_hash or image_id(image_bytes)
+    key = result_key(image_hash, params)
+
+    # Repeat uploads of the same photo skip decoding and inference entirely, whatever the format
+    cached = result_cache.get(key) if result_cache is not None and use_cache else None
+    if cached is not None and cached.plan is not None:
+        image_url, thumbnail_url = publish_annotation(
+            render_key(image_hash, params, cached.plan['working_shape']), image_bytes, cached.detections, params,
+            cached.image_shape
+        )
+        return DetectionResult(
+            cached.detections, image_url, thumbnail_url, (datetime.now() - start_time).total_seconds(), True, image_hash,
+            tiles_total=cached.tiles_total, tiles_skipped=cached.tiles_skipped, plan=cached.plan
         )
 
-        # Decode base64 image
-        image_bytes = base64.b64decode(image_data.file_content)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    predictor = registry.get_predictor()
+    # Plan the working resolution from the header; formats without a readable size are planned below
+    info = image_info(image_bytes)
+    plan = plan_tiling(info, params) if info is not None else None
+    decoded = None  # full-size upload, if decoded
+    # Same image and tiling with only thresholds changed: re-merge instead of re-running the model,
+    # without decoding (render=eager decodes the upload itself to draw on)
+    entry = cached_predictions(image_hash, params, plan) if use_cache else None
+    if entry is not None:
+        raw = entry.raw
+        plan = plan or plan_tiling(ImageInfo(*raw.image_shape, format='other'), params)
+    else:
+        # Process the image at the planned resolution; the upload stays in memory from here on.
+        # Without a reduced-scale JPEG decode, one full-size decode serves both inference
+        # (resized) and drawing the annotated image.
+        if plan is None or plan.decode_factor == 1:
+            decoded = TiledPredictor.decode(image_bytes)
+            plan = plan or plan_tiling(ImageInfo(*decoded.shape[:2], format='other'), params)
+        working_img = tiling_policy.decode(image_bytes, plan) if decoded is None else tiling_policy.fit(decoded, plan)
+        # Tiles from concurrent requests share model batches through the scheduler
+        tile_runner = registry.get_scheduler().infer_batch if DYNAMIC_BATCHING_ENABLED and batched else None
+        # Cached raw predictions go down to the floor, so a lower threshold later can reuse them
+        conf_floor = params.conf_threshold if raw_cache is None else min(RAW_CONF_FLOOR, params.conf_threshold)
+        raw = to_original(predictor.collect_predictions(
+            working_img, params.tile_size, params.overlap, conf_floor, tile_runner, params.tiling
+        ), plan)
+        if raw_cache is not None:
+            raw_cache.put(raw_key(image_hash, params), CachedPredictions(raw, image_bytes))
+
+    detections = finalize(predictor, raw, params)
+    image_url, thumbnail_url = publish_annotation(
+        render_key(image_hash, params, plan.working_shape), image_bytes, detections, params, raw.image_shape, decoded
+    )
+    if result_cache is not None:
+        result_cache.put(key, CachedResult(detections, raw.image_shape, raw.tiles_total, raw.tiles_skipped, plan.as_dict()))
+
+    # Calculate processing time
+    processing_time = (datetime.now() - start_time).total_seconds()
 
-        if image is None:
-            raise HTTPException(status_code=400, detail="Invalid image data")
+    return DetectionResult(
+        detections, image_url, thumbnail_url, processing_time, False, image_hash,
+        tiles_total=raw.tiles_total, tiles_skipped=raw.tiles_skipped, plan=plan.as_dict()
+    )
 
-        # Save the original image temporarily
-        temp_path = os.path.join(UPLOAD_DIR, f"temp_{image_data.file_name}")
-        cv2.imwrite(temp_path, image)
+def run_profiled_detection(image_bytes: bytes, params: DetectionParams, image_hash: Optional[str] = None) -> DetectionResult:
+    """run_detection under cProfile.
 
-        # Process the image
-        start_time = datetime.now()
-        processed_image, detections = predictor.predict(temp_path)
-        
-        # Save processed image
-        output_filename = f"processed_{image_data.file_name}"
-        output_path = os.path.join(UPLOAD_DIR, output_filename)
-        cv2.imwrite(output_path, processed_image)
+    Caches and the batch scheduler are bypassed so the profile covers the whole pipeline,
+    model included, on this thread. Runs unprofiled if another profile is in progress.
+    """
+    with request_profiler.profile() as profile_id:
+        profiled = profile_id is not None
+        result = run_detection(image_bytes, params, image_hash, use_cache=not profiled, batched=not profiled)
+    return result._replace(profile_id=profile_id)
 
-        # Calculate processing time
-        processing_time = (datetime.now() - start_time).total_seconds()
+def run_requery(entry: CachedPredictions, params: RequeryParams) -> DetectionResult:
+    """Re-filter and re-merge cached raw predictions; only decodes the image to redraw it."""
+    start_time = datetime.now()
+    predictor = registry.get_predictor()
+    detections = finalize(predictor, entry.raw, params)
+    plan = plan_tiling(ImageInfo(*entry.raw.image_shape, format='other'), params)
+    image_url, thumbnail_url = publish_annotation(
+        render_key(params.image_id, params, plan.working_shape), entry.image, detections, params, entry.raw.image_shape
+    )
+    processing_time = (datetime.now() - start_time).total_seconds()
+    return DetectionResult(
+        detections, image_url, thumbnail_url, processing_time, True, params.image_id,
+        tiles_total=entry.raw.tiles_total, tiles_skipped=entry.raw.tiles_skipped, plan=plan.as_dict()
+    )
+
+async def submit_detection(fn, *args):
+    """Run a blocking detection job off the event loop, shedding load when the executor is full."""
+    try:
+        job = detection_executor.submit(fn, *args)
+    except QueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Detection service is busy, please retry shortly",
+            headers={"Retry-After": str(DETECT_RETRY_AFTER_SECONDS)}
+        )
+    return await asyncio.wrap_future(job)
+
+def error_response(e: Exception) -> DetectionResponse:
+    return DetectionResponse(
+        success=False,
+        message=f"Error processing image: {str(e)}",
+        detections=[],
+        processing_time=0
+    )
+
+async def detection_response(fn, *args, flight_key: Optional[str] = None) -> DetectionResponse:
+    try:
+        # CPU-bound work never runs on the event loop; see run_detection
+        if flight_key is None:
+            result = await submit_detection(fn, *args)
+        else:
+            # Identical requests already in flight share that computation
+            start = time.perf_counter()
+            result, coalesced = await detection_flights.join(flight_key, lambda: submit_detection(fn, *args))
+            if coalesced:
+                # The stages ran for the first request; this one only waited for them
+                waited = time.perf_counter() - start
+                record_stage("coalesced_wait", waited)
+                result = result._replace(processing_time=waited, coalesced=True)
 
         return DetectionResponse(
             success=True,
             message="Disease detection completed successfully",
-            detections=detections,
-            image_url=f"/static/processed_images/{output_filename}",
-            processing_time=processing_time
+            timings=current_breakdown(),
+            **result._asdict()
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
-        return DetectionResponse(
-            success=False,
-            message=f"Error processing image: {str(e)}",
-            detections=[],
-            processing_time=0
-        ) 
\ No newline at end of file
+        return error_response(e)
+
+async def coalesced_detection(image_bytes: bytes, params: DetectionParams, request: Request) -> DetectionResponse:
+    """Run detection, sharing one computation between concurrent identical requests (double-clicks, retries)."""
+    # hashlib releases the GIL, so hashing a large upload does not stall the event loop
+    image_hash = await asyncio.to_thread(image_id, image_bytes)
+    if request_profiler.should_profile(PROFILE_HEADER in request.headers):
+        return await detection_response(run_profiled_detection, image_bytes, params, image_hash)
+    # Same image and same options (render options included, as they change the URLs returned)
+    flight_key = f"{image_hash}:{params.model_dump_json(include=set(DetectionParams.model_fields))}"
+    return await detection_response(run_detection, image_bytes, params, image_hash, flight_key=flight_key)
+
+@router.post("/detect", response_model=DetectionResponse)
+async def detect_disease(image_data: ImageUpload, request: Request):
+    try:
+        # Decode base64 image
+        with stage("b64decode"):
+            image_bytes = await asyncio.to_thread(base64.b64decode, image_data.file_content)
+    except ValueError as e:
+        return error_response(e)
+    return await coalesced_detection(image_bytes, image_data, request)
+
+@router.post("/detect/upload", response_model=DetectionResponse, openapi_extra=form_schema(ImageFileUpload))
+async def detect_disease_upload(request: Request):
+    """multipart/form-data variant of /detect: the image is a file part, tuning knobs are form fields."""
+    # Parsed here rather than with Form(), so an oversized file is rejected while it arrives
+    upload, form = await read_form_model(request, ImageFileUpload)
+    try:
+        image_bytes = await read_upload(upload.file)
+    finally:
+        await form.close()
+    return await coalesced_detection(image_bytes, upload, request)
+
+@router.post(
+    "/detect/raw",
+    response_model=DetectionResponse,
+    openapi_extra={"requestBody": {"content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}}}}
+)
+async def detect_disease_raw(request: Request, params: DetectionParams = Query()):
+    """application/octet-stream variant of /detect: the body is the image, tuning knobs are query parameters."""
+    image_bytes = await read_request_body(request)
+    return await coalesced_detection(image_bytes, params, request)
+
+@router.post("/detect/requery", response_model=DetectionResponse)
+async def detect_disease_requery(params: RequeryParams):
+    """Re-run filtering, merging and severity for an image already sent to /detect, without inference.
+
+    The image must still be in the raw prediction cache with the same tile_size and overlap.
+    """
+    entry = cached_predictions(params.image_id, params)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Image not in cache for these tiling parameters; upload it again")
+    return await detection_response(run_requery, entry, params)
+
+@router.get("/detect/render/{render_id}")
+async def render_annotated_image(render_id: str, request: Request,
+                                 max_dim: Optional[int] = Query(None, ge=32, le=16384)):
+    """The annotated image for a detection; drawn on the first request, then served from cache."""
+    # Render ids are content hashes, so a given URL always has the same image
+    etag = f'"{render_id}-{max_dim or "full"}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Concurrent first views of the same image share one render
+    rendered = await detection_flights.do(
+        f"render:{etag}", lambda: submit_detection(annotation_renderer.render, render_id, max_dim)
+    )
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired render id; run detection again")
+    return Response(
+        rendered.image,
+        media_type=rendered.media_type,
+        headers={"ETag": etag, "Cache-Control": "private, max-age=86400, immutable"}
+    )
+
+@router.get("/detect/stats")
+async def detection_stats():
+    return {
+        "executor": detection_executor.stats(),
+        "scheduler": registry.scheduler_stats(),
+        "coalescing": detection_flights.stats(),
+        "cache": result_cache.stats() if result_cache is not None else None,
+        "raw_cache": raw_cache.stats() if raw_cache is not None else None,
+        "render": annotation_renderer.stats(),
+        "image_store": image_store.stats()
+    }
+
+@router.get("/detect/profiles")
+async def list_profiles():
+    """Stored request profiles, newest first. Empty unless PROFILING_ENABLED is set."""
+    return {"enabled": request_profiler.enabled, "profiles": request_profiler.list_profiles()}
+
+@router.get("/detect/profiles/{profile_id}")
+async def profile_hot_functions(profile_id: str, limit: int = Query(25, ge=1, le=500),
+                                sort: Literal['tottime', 'cumulative'] = 'tottime'):
+    """The hottest functions of a stored profile."""
+    report = request_profiler.top_functions(profile_id, limit, sort)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return report
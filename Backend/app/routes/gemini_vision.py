@@ -1,5 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from starlette.datastructures import UploadFile
 from app.schemas.detection import ImageUpload
+from app.utils.uploads import read_form, read_request_body, read_upload
+from app.services.telemetry import external_call, stage
 import google.generativeai as genai
 from google.ai.generativelanguage_v1beta.types import content
 import os
@@ -25,6 +28,43 @@ GENERATION_CONFIG = {
 
 @router.post("/analyze-plant")
 async def analyze_plant_image(image_data: ImageUpload) -> Dict[str, Union[bool, dict]]:
+    # Decode base64 image
+    try:
+        image_bytes = base64.b64decode(image_data.file_content)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid base64 image data")
+    return await analyze_image(image_bytes)
+
+@router.post(
+    "/analyze-plant/upload",
+    openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}
+    }}}}}
+)
+async def analyze_plant_upload(request: Request) -> Dict[str, Union[bool, dict]]:
+    """multipart/form-data variant of /analyze-plant: the image is the "file" part."""
+    # Parsed here rather than with File(), so an oversized file is rejected while it arrives
+    form = await read_form(request)
+    try:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=400, detail="No file part in request")
+        image_bytes = await read_upload(file)
+    finally:
+        await form.close()
+    mime_type = file.content_type if file.content_type and file.content_type.startswith("image/") else "image/jpeg"
+    return await analyze_image(image_bytes, mime_type)
+
+@router.post(
+    "/analyze-plant/raw",
+    openapi_extra={"requestBody": {"content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}}}}
+)
+async def analyze_plant_raw(request: Request) -> Dict[str, Union[bool, dict]]:
+    """application/octet-stream variant of /analyze-plant: the body is the image."""
+    image_bytes = await read_request_body(request)
+    return await analyze_image(image_bytes)
+
+async def analyze_image(image_bytes: bytes, mime_type: str = "image/jpeg") -> Dict[str, Union[bool, dict]]:
     try:
         # Initialize Gemini model
         model = genai.GenerativeModel(
@@ -32,15 +72,17 @@ async def analyze_plant_image(image_data: ImageUpload) -> Dict[str, Union[bool,
             generation_config=GENERATION_CONFIG
         )
 
-        # Decode base64 image and save temporarily
-        image_bytes = base64.b64decode(image_data.file_content)
-        
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
+        # Save the image temporarily for upload
+        with stage("temp_write"), tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
             temp_file.write(image_bytes)
             temp_path = temp_file.name
 
-        # Upload image to Gemini
-        image = genai.upload_file(temp_path, mime_type="image/jpeg")
+        # Upload image to Gemini; the temp file is only needed until then, even if the upload fails
+        try:
+            with external_call("gemini", "upload_file"):
+                image = genai.upload_file(temp_path, mime_type=mime_type)
+        finally:
+            os.unlink(temp_path)
 
         # Create a more detailed prompt
         prompt = """
@@ -77,7 +119,8 @@ async def analyze_plant_image(image_data: ImageUpload) -> Dict[str, Union[bool,
         """
 
         # Generate response
-        response = model.generate_content([prompt, image])
+        with external_call("gemini", "generate_content"):
+            response = model.generate_content([prompt, image])
         
         # Extract JSON from response
         # Look for JSON content between curly braces
@@ -115,9 +158,6 @@ async def analyze_plant_image(image_data: ImageUpload) -> Dict[str, Union[bool,
                     else:
                         raise ValueError(f"Missing required field: {field}")
 
-        # Clean up temp file
-        os.unlink(temp_path)
-
         return result
 
     except ValueError as ve:
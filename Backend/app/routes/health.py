@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services.registry import registry
+
+router = APIRouter()
+
+@router.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def readiness():
+    # The load balancer should only route traffic here once the model is warm
+    if not registry.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error" if registry.error else "loading", "detail": registry.error}
+        )
+    return {"status": "ready", "models": registry.loaded_models()}
@@ -1,39 +1,247 @@
-from fastapi import APIRouter
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from typing import AsyncIterator, List, Optional, Tuple
+import asyncio
+import json
 import random
-from datetime import datetime
-from app.schemas.metrics import PlantMetric, PlantMetricType
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from app.config import (
+    METRICS_PUSH_INTERVAL, METRICS_PUSH_KEEPALIVE, METRICS_PUSH_MIN_INTERVAL, METRICS_PUSH_SEND_TIMEOUT,
+    PLANT_METRICS_SIMULATE, PLANT_METRICS_SIMULATE_INTERVAL
+)
+from app.schemas.metrics import (
+    IngestResponse, MetricAggregate, MetricAggregateParams, MetricHistory, MetricHistoryParams, MetricReading,
+    MetricReadings, MetricWindow, PlantMetric, PlantMetricType
+)
+from app.services.broadcast import SubscriberLimitError, metric_broadcaster
+from app.services.timeseries import metric_store
 
 router = APIRouter()
 
-async def generate_plant_metrics() -> List[PlantMetric]:
-    metrics = []
-    current_time = datetime.now().isoformat()
-    
-    metric_ranges = {
-        PlantMetricType.TEMPERATURE: (20, 30, "°C"),
-        PlantMetricType.HUMIDITY: (40, 80, "%"),
-        PlantMetricType.SOIL_MOISTURE: (30, 70, "%"),
-        PlantMetricType.LIGHT_INTENSITY: (2000, 10000, "lux"),
-        PlantMetricType.SOIL_PH: (5.5, 7.5, "pH"),
-        PlantMetricType.NITROGEN_LEVEL: (100, 200, "ppm"),
-        PlantMetricType.PHOSPHORUS_LEVEL: (20, 50, "ppm"),
-        PlantMetricType.POTASSIUM_LEVEL: (100, 250, "ppm"),
-    }
-
-    for metric_type, (min_val, max_val, unit) in metric_ranges.items():
-        value = round(random.uniform(min_val, max_val), 2)
-        metrics.append(
-            PlantMetric(
-                metric_type=metric_type,
-                value=value,
-                unit=unit,
-                timestamp=current_time
-            )
-        )
-    
-    return metrics
+METRIC_UNITS = {
+    PlantMetricType.TEMPERATURE: "°C",
+    PlantMetricType.HUMIDITY: "%",
+    PlantMetricType.SOIL_MOISTURE: "%",
+    PlantMetricType.LIGHT_INTENSITY: "lux",
+    PlantMetricType.SOIL_PH: "pH",
+    PlantMetricType.NITROGEN_LEVEL: "ppm",
+    PlantMetricType.PHOSPHORUS_LEVEL: "ppm",
+    PlantMetricType.POTASSIUM_LEVEL: "ppm",
+}
+
+# Plausible ranges for simulated values, used until a metric has real readings
+SIMULATED_RANGES = {
+    PlantMetricType.TEMPERATURE: (20, 30),
+    PlantMetricType.HUMIDITY: (40, 80),
+    PlantMetricType.SOIL_MOISTURE: (30, 70),
+    PlantMetricType.LIGHT_INTENSITY: (2000, 10000),
+    PlantMetricType.SOIL_PH: (5.5, 7.5),
+    PlantMetricType.NITROGEN_LEVEL: (100, 200),
+    PlantMetricType.PHOSPHORUS_LEVEL: (20, 50),
+    PlantMetricType.POTASSIUM_LEVEL: (100, 250),
+}
+
+def simulated_metric(metric_type: PlantMetricType) -> PlantMetric:
+    min_val, max_val = SIMULATED_RANGES[metric_type]
+    return PlantMetric(
+        metric_type=metric_type,
+        value=round(random.uniform(min_val, max_val), 2),
+        unit=METRIC_UNITS[metric_type],
+        timestamp=datetime.now().isoformat()
+    )
+
+def latest_plant_metric(metric_type: PlantMetricType) -> Optional[PlantMetric]:
+    latest = metric_store.series(metric_type.value).latest()
+    if latest is None:
+        return simulated_metric(metric_type) if PLANT_METRICS_SIMULATE else None
+    t, value = latest
+    return PlantMetric(
+        metric_type=metric_type,
+        value=value,
+        unit=METRIC_UNITS[metric_type],
+        timestamp=datetime.fromtimestamp(t).isoformat()
+    )
+
+def latest_plant_metrics() -> List[PlantMetric]:
+    metrics = (latest_plant_metric(metric_type) for metric_type in PlantMetricType)
+    return [metric for metric in metrics if metric is not None]
+
+async def publish_simulated_metrics(interval: float = PLANT_METRICS_SIMULATE_INTERVAL) -> None:
+    """Push fresh simulated values of the metrics without readings to live subscribers, forever.
+
+    The one producer for the whole process (started by main's lifespan), so the live
+    dashboard keeps moving in demos without every client polling for random numbers.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if not metric_broadcaster.subscribers:
+            continue
+        metric_broadcaster.publish({
+            metric_type.value: simulated_metric(metric_type).model_dump_json()
+            for metric_type in PlantMetricType
+            if metric_store.series(metric_type.value).latest() is None
+        })
+
+def ingest(readings: List[MetricReading]) -> IngestResponse:
+    now = time.time()
+    t = np.array([reading.timestamp.timestamp() if reading.timestamp else now for reading in readings])
+    values = np.array([reading.value for reading in readings])
+    types = np.array([reading.metric_type.value for reading in readings])
+    accepted = 0
+    changed = {}
+    for metric_type in np.unique(types):
+        selected = types == metric_type
+        count = metric_store.series(metric_type).ingest(t[selected], values[selected])
+        if count:
+            # Encoded once here, whatever the number of live dashboards
+            changed[metric_type] = latest_plant_metric(PlantMetricType(metric_type)).model_dump_json()
+        accepted += count
+    metric_broadcaster.publish(changed)
+    return IngestResponse(accepted=accepted, dropped=len(readings) - accepted)
+
+def window(params: MetricWindow) -> Tuple[float, float]:
+    end = params.end.timestamp() if params.end else time.time()
+    start = params.start.timestamp() if params.start else end - timedelta(days=1).total_seconds()
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+def snapshot() -> str:
+    return json.dumps([metric.model_dump(mode="json") for metric in latest_plant_metrics()])
+
+def sse_event(message: Optional[str]) -> str:
+    # A comment line keeps idle connections (and proxies) open
+    return ": keepalive\n\n" if message is None else f"event: metrics\ndata: {message}\n\n"
+
 
 @router.get("/plant-metrics", response_model=List[PlantMetric])
 async def get_plant_metrics():
-    return await generate_plant_metrics() 
\ No newline at end of file
+    """Latest reading of each metric."""
+    return latest_plant_metrics()
+
+@router.post("/plant-metrics", response_model=IngestResponse)
+async def ingest_plant_metric(reading: MetricReading):
+    return ingest([reading])
+
+@router.post("/plant-metrics/bulk", response_model=IngestResponse)
+async def ingest_plant_metrics(batch: MetricReadings):
+    """Store many readings at once; per metric they may come in any order, but readings older
+    than that metric's newest stored one are dropped."""
+    return ingest(batch.readings)
+
+@router.get("/plant-metrics/history", response_model=MetricHistory)
+async def plant_metric_history(params: MetricHistoryParams = Query()):
+    """One metric over a time window, as raw readings or min / max / mean buckets.
+
+    Without step, the finest resolution with at most max_points points is returned: raw
+    readings for short windows, minute or hour rollups for long ones.
+    """
+    start, end = window(params)
+    resolution, buckets = metric_store.series(params.metric_type.value).query(
+        start, end, params.step, params.max_points
+    )
+    return MetricHistory(
+        metric_type=params.metric_type,
+        unit=METRIC_UNITS[params.metric_type],
+        resolution=resolution,
+        timestamps=buckets.t.tolist(),
+        mean=buckets.mean.tolist(),
+        min=buckets.min.tolist(),
+        max=buckets.max.tolist(),
+        count=buckets.count.tolist()
+    )
+
+@router.get("/plant-metrics/aggregate", response_model=List[MetricAggregate])
+async def plant_metric_aggregates(params: MetricAggregateParams = Query()):
+    """min / max / mean of each metric (or just metric_type) over a time window."""
+    start, end = window(params)
+    aggregates = []
+    for metric_type in [params.metric_type] if params.metric_type else PlantMetricType:
+        buckets = metric_store.series(metric_type.value).aggregate(start, end)
+        count = int(buckets.count[0])
+        aggregates.append(MetricAggregate(
+            metric_type=metric_type,
+            unit=METRIC_UNITS[metric_type],
+            start=datetime.fromtimestamp(start),
+            end=datetime.fromtimestamp(end),
+            count=count,
+            mean=float(buckets.mean[0]) if count else None,
+            min=float(buckets.min[0]) if count else None,
+            max=float(buckets.max[0]) if count else None
+        ))
+    return aggregates
+
+@router.get("/plant-metrics/stream")
+async def stream_plant_metrics(interval: float = Query(METRICS_PUSH_INTERVAL, ge=METRICS_PUSH_MIN_INTERVAL, le=3600)):
+    """Server-sent events: a 'metrics' event with every metric, then one with the metrics that
+    changed, at most every interval seconds (faster updates are merged into the next event).
+
+    A client that takes longer than METRICS_PUSH_SEND_TIMEOUT to accept an event has its
+    stream ended (EventSource then reconnects and starts again from a snapshot).
+    """
+    # Subscribe before the snapshot so nothing published in between is missed
+    try:
+        updates = metric_broadcaster.subscribe(interval, METRICS_PUSH_KEEPALIVE)
+    except SubscriberLimitError:
+        raise HTTPException(status_code=503, detail="Too many live metric subscribers")
+
+    async def stream() -> AsyncIterator[str]:
+        try:
+            yield sse_event(snapshot())
+            async for message in updates.bounded(METRICS_PUSH_SEND_TIMEOUT):
+                yield sse_event(message)
+        finally:
+            await updates.aclose()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Unsubscribes even if the stream is cancelled before it starts
+        background=BackgroundTask(updates.aclose)
+    )
+
+@router.websocket("/plant-metrics/ws")
+async def plant_metrics_socket(websocket: WebSocket,
+                               interval: float = Query(METRICS_PUSH_INTERVAL, ge=METRICS_PUSH_MIN_INTERVAL, le=3600)):
+    """Like /plant-metrics/stream over a WebSocket: each text message is a JSON array of metrics."""
+    try:
+        updates = metric_broadcaster.subscribe(interval, METRICS_PUSH_KEEPALIVE)
+    except SubscriberLimitError:
+        await websocket.close(code=1013)  # try again later
+        return
+    try:
+        await websocket.accept()
+    except BaseException:
+        await updates.aclose()
+        raise
+
+    async def until_closed() -> None:
+        # Clients do not send anything; reading is how a closed socket is noticed
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    closed = asyncio.create_task(until_closed())
+    try:
+        await websocket.send_text(snapshot())
+        async for message in updates.bounded(METRICS_PUSH_SEND_TIMEOUT):
+            if closed.done():
+                break
+            if message is not None:
+                await websocket.send_text(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
+        await updates.aclose()
+
+@router.get("/plant-metrics/stream/stats")
+async def plant_metrics_stream_stats():
+    return metric_broadcaster.stats()
@@ -0,0 +1,37 @@
+import time
+
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+
+from app.services.telemetry import REQUEST_SECONDS, metrics, server_timing, start_breakdown
+
+router = APIRouter()
+
+# Clients send this header (any value) to get a per-stage breakdown of their request
+TIMING_HEADER = "x-timing-breakdown"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def scrape_metrics():
+    """Latency histograms in the Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def timing_middleware(request: Request, call_next):
+    """Record request latency per route, and return a Server-Timing breakdown when asked."""
+    breakdown = start_breakdown() if TIMING_HEADER in request.headers else None
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    # Label by route template rather than raw path to keep the series count bounded
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        elapsed,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code)
+    )
+    if breakdown is not None:
+        response.headers["Server-Timing"] = server_timing(breakdown, elapsed)
+    return response
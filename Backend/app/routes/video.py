@@ -0,0 +1,110 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from starlette.datastructures import UploadFile
+import mimetypes
+import os
+import tempfile
+from typing import Dict
+from app.config import MAX_UPLOAD_BYTES, MAX_VIDEO_BYTES, MAX_VIDEO_FRAMES
+from app.routes.batch import run_when_free
+from app.schemas.detection import VideoDetectionResponse, VideoParams
+from app.services.telemetry import current_breakdown
+from app.services.video import ImageFrames, run_video, run_video_file
+from app.utils.uploads import read_form_to_disk
+
+router = APIRouter()
+
+def video_response(summary: Dict) -> VideoDetectionResponse:
+    return VideoDetectionResponse(
+        success=True,
+        message="Video disease detection completed successfully",
+        timings=current_breakdown(),
+        **summary
+    )
+
+def video_error(e: Exception) -> VideoDetectionResponse:
+    return VideoDetectionResponse(success=False, message=f"Error processing video: {str(e)}", processing_time=0)
+
+async def spool_request_body(request: Request, file, max_bytes: int = MAX_VIDEO_BYTES) -> int:
+    """Stream a raw request body to a file, rejecting it once it passes max_bytes."""
+    too_large = HTTPException(status_code=413, detail=f"Upload exceeds the {max_bytes} byte limit")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise too_large
+
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise too_large
+        file.write(chunk)
+    if not size:
+        raise HTTPException(status_code=400, detail="Empty request body")
+    file.flush()
+    return size
+
+@router.post(
+    "/detect/video",
+    response_model=VideoDetectionResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "video/*": {"schema": {"type": "string", "format": "binary"}},
+        "application/octet-stream": {"schema": {"type": "string", "format": "binary"}}
+    }}}
+)
+async def detect_disease_video(request: Request, params: VideoParams = Query()):
+    """Detect diseases through a walk-through video sent as the raw request body (mp4, mov, avi, ...).
+
+    The model runs on every frame_stride-th frame and boxes are tracked across those
+    sampled frames; each track is reported once, so a lesion filmed for ten seconds is
+    one result. Frames in between are not detected on: track frame numbers and times
+    are those of sampled frames.
+    """
+    # The container is probed from the data; an extension only helps some OpenCV backends
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    suffix = (mimetypes.guess_extension(content_type) or "") if content_type.startswith("video/") else ""
+    # The body goes to disk as it arrives: OpenCV reads videos from files, and videos are large
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as file:
+        path = file.name
+    try:
+        with open(path, "wb") as file:
+            await spool_request_body(request, file)
+        # Videos are bulk work: wait for a free executor slot rather than fail with 503
+        return video_response(await run_when_free(run_video_file, path, params))
+    except HTTPException:
+        raise
+    except Exception as e:
+        return video_error(e)
+    finally:
+        os.remove(path)
+
+@router.post(
+    "/detect/video/frames",
+    response_model=VideoDetectionResponse,
+    openapi_extra={"requestBody": {"content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "properties": {"frames": {"type": "array", "items": {"type": "string", "format": "binary"}}}
+    }}}}}
+)
+async def detect_disease_video_frames(request: Request, params: VideoParams = Query()):
+    """Like /detect/video, for a sequence of still frames: one multipart file part per frame, in order.
+
+    Pass fps to get track times in seconds.
+    """
+    # Every part is spooled to disk; frames are read back one by one as they are decoded
+    form = await read_form_to_disk(request, MAX_VIDEO_FRAMES)
+    try:
+        uploads = [value for _, value in form.multi_items() if isinstance(value, UploadFile)]
+        if not uploads:
+            raise HTTPException(status_code=400, detail="No frames in request")
+        if sum(upload.size or 0 for upload in uploads) > MAX_VIDEO_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_VIDEO_BYTES} byte limit")
+        if any((upload.size or 0) > MAX_UPLOAD_BYTES for upload in uploads):
+            raise HTTPException(status_code=413, detail=f"Frame exceeds the {MAX_UPLOAD_BYTES} byte limit")
+        # Read on the decode thread; the spooled files are not touched by the event loop meanwhile
+        frames = ImageFrames([upload.file.read for upload in uploads], params.frame_stride, params.max_frames, params.fps)
+        return video_response(await run_when_free(run_video, frames, params))
+    except HTTPException:
+        raise
+    except Exception as e:
+        return video_error(e)
+    finally:
+        await form.close()
@@ -1,5 +1,10 @@
+from fastapi import UploadFile
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional, Tuple
+from app.config import (
+    MERGE_STRATEGY, MERGE_IOU_THRESHOLD, SEVERITY_HIGH_THRESHOLD, SEVERITY_MEDIUM_THRESHOLD, DEFAULT_RENDER_MODE,
+    TILING_MODE, VIDEO_FRAME_STRIDE, VIDEO_TRACK_IOU, VIDEO_TRACK_MAX_MISSED, VIDEO_MIN_TRACK_HITS
+)
 
 class Detection(BaseModel):
     class_name: str = Field(alias="class")
@@ -8,19 +13,121 @@ class Detection(BaseModel):
     bbox: List[float]
     severity: str
 
+class TilingPlanInfo(BaseModel):
+    original_shape: Tuple[int, int]  # (height, width)
+    working_shape: Tuple[int, int]  # resolution detection ran at; boxes are in original coordinates
+    scale: float
+    tile_size: int
+    overlap: float
+    tiles: int
+    tile_budget: Optional[int] = None
+    decode_factor: int = 1  # JPEG decoded at 1/decode_factor size
+    orientation: int = 1  # EXIF orientation applied
+
 class DetectionResponse(BaseModel):
     success: bool
     message: str
     detections: List[Detection] = []
     image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None  # at most THUMBNAIL_MAX_DIM pixels on its longest side
     processing_time: float
+    cached: bool = False  # served from the result cache without running inference
+    coalesced: bool = False  # shared an identical request's computation; processing_time is the wait
+    image_id: Optional[str] = None  # pass to /detect/requery to re-filter without re-uploading
+    timings: Optional[Dict[str, float]] = None  # seconds per stage; only with the X-Timing-Breakdown header
+    profile_id: Optional[str] = None  # see /detect/profiles/{profile_id}
+    tiles_total: Optional[int] = None  # tiles in the full grid
+    tiles_skipped: Optional[int] = None  # tiles adaptive tiling did not run through the model
+    plan: Optional[TilingPlanInfo] = None  # resolution and tile layout the image was detected with
 
     class Config:
         populate_by_name = True
 
-class ImageUpload(BaseModel):
-    file_name: str
-    file_content: str  # Base64 encoded image
+class DetectionParams(BaseModel):
     tile_size: int = Field(default=640, ge=32, le=2048)
     overlap: float = Field(default=0.2, ge=0, le=0.9)
-    conf_threshold: float = Field(default=0.25, ge=0, le=1.0) 
\ No newline at end of file
+    # exhaustive: every tile; vegetation / coarse: only tiles over plants, found by colour or a downscaled pass
+    tiling: Literal['exhaustive', 'vegetation', 'coarse'] = TILING_MODE
+    # Cap the tile grid, directly or as model time (ms) at the measured per-tile cost; large
+    # images are detected at a lower resolution to fit. Defaults to TILING_MAX_TILES.
+    max_tiles: Optional[int] = Field(default=None, ge=1, le=10000)
+    latency_budget_ms: Optional[float] = Field(default=None, gt=0)
+    conf_threshold: float = Field(default=0.25, ge=0, le=1.0)
+    merge_strategy: Literal['nms', 'soft_nms', 'wbf'] = MERGE_STRATEGY
+    iou_threshold: float = Field(default=MERGE_IOU_THRESHOLD, ge=0, le=1.0)
+    severity_high: float = Field(default=SEVERITY_HIGH_THRESHOLD, ge=0, le=1.0)
+    severity_medium: float = Field(default=SEVERITY_MEDIUM_THRESHOLD, ge=0, le=1.0)
+    # eager: draw now; lazy: draw on first GET of image_url; none: detections only
+    render: Literal['eager', 'lazy', 'none'] = DEFAULT_RENDER_MODE
+    preview_max_dim: Optional[int] = Field(default=None, ge=32, le=16384)  # downscale the annotated image
+
+class ImageUpload(DetectionParams):
+    file_name: str
+    file_content: str  # Base64 encoded image
+
+class ImageFileUpload(DetectionParams):
+    file: UploadFile  # multipart/form-data file part
+
+class RequeryParams(DetectionParams):
+    image_id: str  # from a previous DetectionResponse
+
+
+class BatchParams(DetectionParams):
+    format: Literal['ndjson', 'sse'] = 'ndjson'  # text/event-stream is also chosen by the Accept header
+
+
+class BatchItemResponse(DetectionResponse):
+    index: int  # position in the batch, counting archive members in archive order
+    file_name: str
+
+
+class BatchSummary(BaseModel):
+    done: bool = True
+    total: int
+    succeeded: int
+    failed: int
+    processing_time: float
+
+
+class VideoParams(DetectionParams):
+    frame_stride: int = Field(default=VIDEO_FRAME_STRIDE, ge=1, le=1000)  # run the model on every Nth frame
+    max_frames: Optional[int] = Field(default=None, ge=1)  # stop after this many frames
+    fps: Optional[float] = Field(default=None, gt=0)  # frame rate of a frame upload, for timestamps
+    track_iou: float = Field(default=VIDEO_TRACK_IOU, gt=0, le=1.0)  # overlap that links boxes across frames
+    max_missed: int = Field(default=VIDEO_TRACK_MAX_MISSED, ge=0)  # sampled frames a track may go unseen
+    min_hits: int = Field(default=VIDEO_MIN_TRACK_HITS, ge=1)  # sampled frames a track needs to be reported
+
+
+class VideoTrack(BaseModel):
+    track_id: int
+    class_name: str = Field(alias="class")  # majority class over the track, weighted by confidence
+    original_class: str
+    confidence: float  # highest of the track's detections of its class
+    mean_confidence: float  # over all of the track's detections
+    severity: str
+    # Sampled frames (multiples of frame_stride) the track was first and last matched on;
+    # the model does not run on the frames in between
+    first_frame: int
+    last_frame: int
+    first_seen: Optional[float] = None  # seconds; None without a known frame rate
+    last_seen: Optional[float] = None
+    frames_detected: int  # sampled frames the track was matched on
+    best_frame: int  # frame of that highest-confidence detection; severity is its severity
+    bbox: List[float]  # box in best_frame
+
+    class Config:
+        populate_by_name = True
+
+
+class VideoDetectionResponse(BaseModel):
+    success: bool
+    message: str
+    tracks: List[VideoTrack] = []
+    disease_summary: Dict[str, int] = {}  # tracks per class
+    frames_total: int = 0
+    frames_processed: int = 0  # frames the model ran on
+    frame_stride: int = 1  # the model ran on every frame_stride-th frame
+    fps: Optional[float] = None
+    duration: Optional[float] = None  # seconds
+    processing_time: float
+    timings: Optional[Dict[str, float]] = None
@@ -1,5 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from datetime import datetime
 from enum import Enum
+from typing import List, Optional
 
 class PlantMetricType(str, Enum):
     TEMPERATURE = "temperature"
@@ -15,4 +17,48 @@ class PlantMetric(BaseModel):
     metric_type: PlantMetricType
     value: float
     unit: str
-    timestamp: str 
\ No newline at end of file
+    timestamp: str
+
+class MetricReading(BaseModel):
+    metric_type: PlantMetricType
+    value: float
+    timestamp: Optional[datetime] = None  # ISO 8601 or epoch seconds; defaults to when it is received
+
+class MetricReadings(BaseModel):
+    readings: List[MetricReading] = Field(max_length=100000)
+
+class IngestResponse(BaseModel):
+    accepted: int
+    dropped: int  # older than the newest stored reading of their metric, or not finite
+
+class MetricWindow(BaseModel):
+    start: Optional[datetime] = None  # defaults to 24 hours before end
+    end: Optional[datetime] = None  # defaults to now
+
+class MetricAggregateParams(MetricWindow):
+    metric_type: Optional[PlantMetricType] = None  # all metrics if omitted
+
+class MetricHistoryParams(MetricWindow):
+    metric_type: PlantMetricType
+    step: Optional[float] = Field(default=None, ge=1)  # bucket width in seconds; chosen from max_points if omitted
+    max_points: int = Field(default=2000, ge=1, le=100000)
+
+class MetricHistory(BaseModel):
+    metric_type: PlantMetricType
+    unit: str
+    resolution: str  # 'raw', '1m', '1h', or the bucket width such as '300s'
+    timestamps: List[float]  # epoch seconds: reading times, or bucket starts
+    mean: List[float]
+    min: List[float]
+    max: List[float]
+    count: List[int]
+
+class MetricAggregate(BaseModel):
+    metric_type: PlantMetricType
+    unit: str
+    start: datetime
+    end: datetime
+    count: int
+    mean: Optional[float] = None  # None without readings in the window
+    min: Optional[float] = None
+    max: Optional[float] = None
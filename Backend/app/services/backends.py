@@ -0,0 +1,144 @@
+import ast
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from app.services.merge import nms
+
+# (boxes xyxy, scores, classes) for one tile, in tile coordinates
+TileResult = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class UltralyticsBackend:
+    """Runs .pt weights through ultralytics/torch."""
+
+    name = "ultralytics"
+
+    def __init__(self, model_path: str):
+        # Imported here so deployments using the ONNX backend never load torch
+        from ultralytics import YOLO
+        self.model = YOLO(model_path, task='detect')
+        self.names: Dict[int, str] = self.model.names
+
+    def infer(self, tiles: List[np.ndarray], conf_threshold: float) -> List[TileResult]:
+        results = self.model(tiles, conf=conf_threshold, verbose=False)
+        return [
+            (r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy(), r.boxes.cls.cpu().numpy())
+            for r in results
+        ]
+
+
+class OnnxBackend:
+    """Runs an ultralytics ONNX export on ONNX Runtime's CPU provider.
+
+    Does its own letterbox preprocessing and decodes the raw (batch, 4 + classes, anchors)
+    output with per-class NMS, matching ultralytics' predict defaults.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str, intra_op_threads: int = 0, inter_op_threads: int = 0,
+                 iou_threshold: float = 0.7, max_det: int = 300):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 lets ONNX Runtime pick based on the available cores
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        if inter_op_threads > 1:
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.iou_threshold = iou_threshold
+        self.max_det = max_det
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        # Dynamic dimensions come back as strings (or None)
+        self.max_batch = batch if isinstance(batch, int) else None
+        self.input_size = (
+            height if isinstance(height, int) else 640,
+            width if isinstance(width, int) else 640
+        )
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if 'names' in metadata:
+            self.names = ast.literal_eval(metadata['names'])
+        else:
+            num_classes = self.session.get_outputs()[0].shape[1] - 4
+            self.names = {i: str(i) for i in range(num_classes)}
+
+    def letterbox(self, image: np.ndarray) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+        """Resize keeping aspect ratio and pad to the model input size with grey (114)."""
+        in_h, in_w = self.input_size
+        height, width = image.shape[:2]
+        ratio = min(in_h / height, in_w / width)
+        new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+        if (new_w, new_h) != (width, height):
+            image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+        pad_x, pad_y = (in_w - new_w) / 2, (in_h - new_h) / 2
+        top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+        left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+        if top or bottom or left or right:
+            image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return image, ratio, (left, top)
+
+    def infer(self, tiles: List[np.ndarray], conf_threshold: float) -> List[TileResult]:
+        chunk = self.max_batch or len(tiles)
+        results: List[TileResult] = []
+        for start in range(0, len(tiles), chunk):
+            results.extend(self._infer_chunk(tiles[start:start + chunk], conf_threshold))
+        return results
+
+    def _infer_chunk(self, tiles: List[np.ndarray], conf_threshold: float) -> List[TileResult]:
+        in_h, in_w = self.input_size
+        blob = np.empty((len(tiles), 3, in_h, in_w), dtype=np.float32)
+        transforms = []
+        for i, tile in enumerate(tiles):
+            image, ratio, pad = self.letterbox(tile)
+            # BGR HWC uint8 -> RGB CHW float in [0, 1]
+            blob[i] = image[:, :, ::-1].transpose(2, 0, 1)
+            transforms.append((ratio, pad))
+        blob *= 1.0 / 255.0
+
+        output = self.session.run(None, {self.input_name: blob})[0]
+        return [
+            self._decode(prediction, conf_threshold, ratio, pad, tile.shape[:2])
+            for prediction, (ratio, pad), tile in zip(output, transforms, tiles)
+        ]
+
+    def _decode(self, prediction: np.ndarray, conf_threshold: float, ratio: float,
+                pad: Tuple[float, float], tile_shape: Tuple[int, int]) -> TileResult:
+        # (4 + classes, anchors) -> (anchors, 4 + classes)
+        prediction = prediction.T
+        class_scores = prediction[:, 4:]
+        classes = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(classes)), classes]
+        keep = scores >= conf_threshold
+        prediction, scores, classes = prediction[keep], scores[keep], classes[keep]
+
+        # cx, cy, w, h in letterboxed input space -> x1, y1, x2, y2 in tile space
+        boxes = np.empty((len(prediction), 4), dtype=np.float32)
+        half_w, half_h = prediction[:, 2] / 2, prediction[:, 3] / 2
+        boxes[:, 0] = prediction[:, 0] - half_w
+        boxes[:, 1] = prediction[:, 1] - half_h
+        boxes[:, 2] = prediction[:, 0] + half_w
+        boxes[:, 3] = prediction[:, 1] + half_h
+        boxes[:, [0, 2]] -= pad[0]
+        boxes[:, [1, 3]] -= pad[1]
+        boxes /= ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, tile_shape[1])
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, tile_shape[0])
+
+        boxes, scores, classes = nms(boxes, scores.astype(np.float32), classes.astype(np.float32), self.iou_threshold)
+        return boxes[:self.max_det], scores[:self.max_det], classes[:self.max_det]
+
+
+def create_backend(model_path: str, **onnx_options):
+    """Pick the inference backend from the model file type."""
+    if model_path.endswith('.onnx'):
+        return OnnxBackend(model_path, **onnx_options)
+    return UltralyticsBackend(model_path)
@@ -0,0 +1,103 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _TileJob:
+    __slots__ = ('tile', 'conf_threshold', 'future')
+
+    def __init__(self, tile: np.ndarray, conf_threshold: float):
+        self.tile = tile
+        self.conf_threshold = conf_threshold
+        self.future: Future = Future()
+
+
+class BatchScheduler:
+    """Collects tiles from concurrent requests into shared model batches.
+
+    A single worker thread pulls tiles off a queue until either max_batch_size
+    tiles are collected or max_wait_ms has passed since the first one arrived,
+    runs them through the predictor in one call and resolves each tile's future.
+    """
+
+    def __init__(self, predictor, max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.predictor = predictor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[_TileJob]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._tiles = 0
+        self._full_batches = 0
+        self._worker = threading.Thread(target=self._run, name="tile-batch-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, tiles: List[np.ndarray], conf_threshold: float) -> List[Future]:
+        """Queue tiles for inference and return one future per tile."""
+        jobs = [_TileJob(tile, conf_threshold) for tile in tiles]
+        for job in jobs:
+            self._queue.put(job)
+        return [job.future for job in jobs]
+
+    def infer_batch(self, tiles: List[np.ndarray],
+                    conf_threshold: float) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Blocking drop-in for TiledPredictor.infer_batch that goes through the shared queue."""
+        return [future.result() for future in self.submit(tiles, conf_threshold)]
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            batches, tiles, full_batches = self._batches, self._tiles, self._full_batches
+        mean_batch_size = tiles / batches if batches else 0.0
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": batches,
+            "tiles": tiles,
+            "full_batches": full_batches,
+            "mean_batch_size": mean_batch_size,
+            "mean_batch_fill": mean_batch_size / self.max_batch_size,
+        }
+
+    def _collect(self) -> List[_TileJob]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Take whatever is already queued even after the deadline
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            # Run at the lowest threshold in the batch, then filter per request
+            conf_floor = min(job.conf_threshold for job in batch)
+            try:
+                results = self.predictor.infer_batch([job.tile for job in batch], conf_floor)
+            except Exception as e:
+                logger.exception("Batched inference failed")
+                for job in batch:
+                    job.future.set_exception(e)
+                continue
+
+            for job, (boxes, scores, classes) in zip(batch, results):
+                keep = scores >= job.conf_threshold
+                job.future.set_result((boxes[keep], scores[keep], classes[keep]))
+
+            with self._stats_lock:
+                self._batches += 1
+                self._tiles += len(batch)
+                if len(batch) == self.max_batch_size:
+                    self._full_batches += 1
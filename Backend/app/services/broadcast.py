@@ -0,0 +1,169 @@
+import asyncio
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from app.config import METRICS_PUSH_MAX_SUBSCRIBERS
+
+
+class SubscriberLimitError(Exception):
+    """Raised when a Broadcaster already has max_subscribers subscribers."""
+
+
+class Subscription:
+    """Async iterator over a subscriber's messages (see Broadcaster.subscribe).
+
+    Counts as a subscriber from creation until aclose(), whether or not it was iterated.
+    """
+
+    def __init__(self, broadcaster: "Broadcaster", updates: AsyncIterator[Optional[str]]):
+        self._broadcaster = broadcaster
+        self._updates = updates
+        self.closed = False
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> Optional[str]:
+        if self.closed:
+            raise StopAsyncIteration
+        return await self._updates.__anext__()
+
+    async def aclose(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._broadcaster.subscribers -= 1
+        # A task waiting inside the generator closes it when it leaves (see bounded)
+        if not self._updates.ag_running:
+            await self._updates.aclose()
+
+    async def bounded(self, send_timeout: float) -> AsyncIterator[Optional[str]]:
+        """The messages through a one-message queue, filled by a separate task.
+
+        A reader that leaves a message unread for longer than send_timeout (a slow or stuck
+        socket) is dropped: the subscription is closed right away, and the iteration ends
+        once the reader gets back to it. Closing the iteration closes the subscription.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        done = object()
+
+        async def fill() -> None:
+            try:
+                async for message in self:
+                    await asyncio.wait_for(queue.put(message), send_timeout)
+            except asyncio.TimeoutError:
+                self._broadcaster.drop()
+            finally:
+                await self.aclose()
+                # The unread message is stale by now; the reader only needs to stop
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(done)
+
+        filler = asyncio.create_task(fill())
+        try:
+            while (message := await queue.get()) is not done:
+                yield message
+        finally:
+            filler.cancel()
+            await self.aclose()  # stops counting now; the filler closes the generator as it exits
+
+
+class Broadcaster:
+    """Fans keyed updates from one producer out to many subscribers on the event loop.
+
+    The producer publishes already-encoded payloads, so an update is serialized once
+    however many clients receive it. Only the latest payload per key is kept, stamped
+    with the version that published it; each subscriber just remembers the last version
+    it sent. A subscriber that waits (its rate limit, or a slow socket) therefore gets
+    every change it missed coalesced into one message, and nothing queues up per client.
+    Subscribers at the same version share the same message string.
+
+    All methods must be called on the event loop.
+    """
+
+    def __init__(self, max_subscribers: int = 10000):
+        self.max_subscribers = max_subscribers
+        self.version = 0
+        self.items: Dict[str, Tuple[int, str]] = {}  # key -> (version, payload)
+        self._messages: Dict[int, str] = {}  # since-version -> message, for the current version
+        self._changed: Optional[asyncio.Event] = None
+        self.subscribers = 0
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, items: Dict[str, str]) -> None:
+        """Record new payloads (JSON objects) by key and wake the subscribers."""
+        if not items:
+            return
+        self.version += 1
+        self.published += 1
+        for key, payload in items.items():
+            self.items[key] = (self.version, payload)
+        self._messages.clear()
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    def message_since(self, version: int) -> Optional[str]:
+        """JSON array of the payloads published after version; None if there are none."""
+        message = self._messages.get(version)
+        if message is None:
+            changed = [payload for item_version, payload in self.items.values() if item_version > version]
+            if not changed:
+                return None
+            message = self._messages[version] = "[" + ",".join(changed) + "]"
+        return message
+
+    async def _wait(self, version: int) -> None:
+        if self.version > version:
+            return
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        await self._changed.wait()
+
+    def subscribe(self, interval: float, keepalive: float) -> Subscription:
+        """Messages of changes since the previous one, at most one per interval seconds.
+
+        Starts with changes published after this call. Yields None after keepalive seconds
+        without changes, so the caller can keep the connection alive and notice it closing.
+        Raises SubscriberLimitError when full; the caller must aclose() the subscription.
+        """
+        # Checked and counted in one step on the event loop, so the limit cannot be overshot
+        if self.full:
+            raise SubscriberLimitError("Too many subscribers")
+        self.subscribers += 1
+        return Subscription(self, self._updates(self.version, interval, keepalive))
+
+    async def _updates(self, version: int, interval: float, keepalive: float) -> AsyncIterator[Optional[str]]:
+        while True:
+            try:
+                await asyncio.wait_for(self._wait(version), keepalive)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            message = self.message_since(version)
+            version = self.version
+            if message is not None:
+                yield message
+            # Updates published meanwhile are merged into the next message
+            await asyncio.sleep(interval)
+
+    @property
+    def full(self) -> bool:
+        return self.subscribers >= self.max_subscribers
+
+    def drop(self) -> None:
+        """Count a subscriber disconnected for not keeping up."""
+        self.dropped += 1
+
+    def stats(self) -> Dict:
+        return {
+            "subscribers": self.subscribers,
+            "max_subscribers": self.max_subscribers,
+            "version": self.version,
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+
+# Latest plant metric readings, pushed to dashboards (see app/routes/metrics.py)
+metric_broadcaster = Broadcaster(METRICS_PUSH_MAX_SUBSCRIBERS)
@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import (
+    DETECT_CACHE_ENABLED, DETECT_CACHE_MEMORY_BYTES, DETECT_CACHE_DISK_DIR, DETECT_CACHE_DISK_TTL_SECONDS,
+    RAW_CACHE_ENABLED, RAW_CACHE_MEMORY_BYTES
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedResult:
+    """A finished detection. Annotated images live in the image store, keyed by a hash of the same request."""
+    detections: List[Dict]
+    image_shape: Optional[Tuple[int, int]] = None  # (height, width) of the upload
+    tiles_total: Optional[int] = None
+    tiles_skipped: Optional[int] = None
+    plan: Optional[Dict] = None  # TilingPlan.as_dict() the detection ran with
+
+    @property
+    def nbytes(self) -> int:
+        # Detections are a few hundred bytes each
+        return 256 * (len(self.detections) + 1)
+
+
+@dataclass
+class CachedPredictions:
+    """Raw tile predictions for an image, plus the upload itself so it can be redrawn."""
+    raw: Any  # app.services.predict.RawPredictions
+    image: bytes
+
+    @property
+    def nbytes(self) -> int:
+        return self.raw.nbytes + len(self.image)
+
+
+def image_id(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def cache_key(image_hash: str, model_version: str, **params) -> str:
+    """Content address of a detection: image hash, tuning parameters and model version."""
+    digest = hashlib.sha256(image_hash.encode())
+    digest.update(model_version.encode())
+    for name in sorted(params):
+        digest.update(f"|{name}={params[name]!r}".encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache of detection results (any picklable value with an nbytes size).
+
+    The memory tier is an LRU bounded by the total size of the cached entries. The optional
+    disk tier keeps one pickle per key and treats files older than ttl_seconds as misses;
+    expired files are swept on write. A disk hit is promoted back into memory.
+    """
+
+    def __init__(self, max_memory_bytes: int, disk_dir: Optional[str] = None, ttl_seconds: float = 86400):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return result
+
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._put_memory(key, result)
+        return result
+
+    def put(self, key: str, result: Any) -> None:
+        with self._lock:
+            self._put_memory(key, result)
+        self._write_disk(key, result)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def _put_memory(self, key: str, result: Any) -> None:
+        # Caller holds the lock
+        if result.nbytes > self.max_memory_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.nbytes
+        self._entries[key] = result
+        self._memory_bytes += result.nbytes
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _read_disk(self, key: str) -> Optional[Any]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.warning("Dropping unreadable cache entry %s", path, exc_info=True)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _write_disk(self, key: str, result: Any) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        # Write then rename so concurrent readers never see a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.warning("Could not write cache entry %s", path, exc_info=True)
+        self._sweep_disk()
+
+    def _sweep_disk(self) -> None:
+        """Delete expired disk entries, at most once per tenth of the TTL."""
+        now = time.time()
+        if now - self._last_sweep < self.ttl_seconds / 10:
+            return
+        self._last_sweep = now
+        for entry in os.scandir(self.disk_dir):
+            try:
+                if entry.name.endswith('.pkl') and now - entry.stat().st_mtime > self.ttl_seconds:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "disk_enabled": bool(self.disk_dir),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+
+
+result_cache: Optional[ResultCache] = (
+    ResultCache(DETECT_CACHE_MEMORY_BYTES, DETECT_CACHE_DISK_DIR or None, DETECT_CACHE_DISK_TTL_SECONDS)
+    if DETECT_CACHE_ENABLED else None
+)
+
+# Memory only: entries hold the original upload and are only useful while a user is tuning
+raw_cache: Optional[ResultCache] = ResultCache(RAW_CACHE_MEMORY_BYTES) if RAW_CACHE_ENABLED else None
@@ -0,0 +1,130 @@
+import asyncio
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional
+
+from app.config import DETECT_MAX_WORKERS, DETECT_MAX_QUEUE
+
+
+class QueueFullError(Exception):
+    """Raised when a BoundedExecutor has no free slot for another job."""
+
+
+class _Waiter:
+    __slots__ = ('loop', 'future')
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future: Optional[asyncio.Future] = None
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class BoundedExecutor:
+    """Thread pool that rejects work instead of queueing it without limit.
+
+    At most max_workers jobs run at once and at most max_queue more wait for a
+    worker; submit() raises QueueFullError once both are taken, while
+    submit_when_free() waits for a slot.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, name: str = "worker"):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._waiters: Deque[_Waiter] = deque()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError("Executor queue is full")
+        return self._start(fn, *args, **kwargs)
+
+    async def submit_when_free(self, fn: Callable, *args, **kwargs) -> Future:
+        """Like submit(), but waits for a free slot instead of raising QueueFullError.
+
+        Waiters get slots in arrival order. A freed slot wakes the oldest waiter, which
+        then takes it unless a submit() call got there first, so work that waits stays
+        behind work that would rather be rejected.
+        """
+        waiter = None
+        try:
+            while True:
+                with self._lock:
+                    turn = self._waiters[0] is waiter if self._waiters else waiter is None
+                    if turn and self._slots.acquire(blocking=False):
+                        if waiter is not None:
+                            self._waiters.popleft()
+                            waiter = None
+                            # Several slots may have been freed at once
+                            self._wake_first()
+                        break
+                    if waiter is None:
+                        waiter = _Waiter(asyncio.get_running_loop())
+                        self._waiters.append(waiter)
+                    waiter.future = waiter.loop.create_future()
+                await waiter.future
+        except BaseException:
+            if waiter is not None:
+                with self._lock:
+                    self._waiters.remove(waiter)
+                    self._wake_first()
+            raise
+        return self._start(fn, *args, **kwargs)
+
+    def _start(self, fn: Callable, *args, **kwargs) -> Future:
+        try:
+            # Run in a copy of the caller's context so request-scoped state (e.g. timing) follows the job
+            future = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self._free()
+            raise
+        with self._lock:
+            self._in_flight += 1
+        future.add_done_callback(self._release)
+        return future
+
+    def stats(self) -> Dict:
+        with self._lock:
+            in_flight, rejected, waiting = self._in_flight, self._rejected, len(self._waiters)
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": min(in_flight, self.max_workers),
+            "queued": max(0, in_flight - self.max_workers),
+            "rejected": rejected,
+            "waiting": waiting,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, _: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._free()
+
+    def _free(self) -> None:
+        # Under the lock, so a waiter either sees the slot or is woken for it
+        with self._lock:
+            self._slots.release()
+            self._wake_first()
+
+    def _wake_first(self) -> None:
+        """Wake the oldest waiter to retry (called with the lock held, from any thread)."""
+        if self._waiters and self._waiters[0].future is not None:
+            waiter = self._waiters[0]
+            waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+
+
+detection_executor = BoundedExecutor(DETECT_MAX_WORKERS, DETECT_MAX_QUEUE, name="detect")
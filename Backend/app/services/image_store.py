@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from app.config import PROCESSED_IMAGE_MAX_BYTES, PROCESSED_IMAGE_TTL_SECONDS, PROCESSED_IMAGE_SWEEP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Served by the /static mount in main.py
+STORE_DIR = "static/processed_images"
+STORE_URL = "/static/processed_images"
+
+# Unfinished writes older than this are leftovers from a crash
+_STALE_TMP_SECONDS = 3600
+
+
+class ImageStore:
+    """Disk store for annotated images, bounded by size and age.
+
+    Names are content addresses chosen by the caller, so concurrent requests never
+    overwrite each other's files and an existing file can be reused instead of being
+    re-encoded. Files are evicted once older than ttl_seconds, then least recently used
+    first (by mtime, refreshed on every lookup) until the store is back under 90% of
+    max_bytes. A background thread sweeps every sweep_seconds; a write that pushes the
+    store over budget also triggers a sweep. Anything else in the directory, such as the
+    processed_/temp_ files older versions named after the upload, ages out the same way.
+    """
+
+    def __init__(self, directory: str, url_prefix: str, max_bytes: int, ttl_seconds: float,
+                 sweep_seconds: float = 300):
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sweep_seconds = sweep_seconds
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        self._bytes = 0
+        self.evicted = 0
+        self.evicted_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self.sweep()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def url(self, name: str) -> str:
+        return f"{self.url_prefix}/{name}"
+
+    def lookup(self, name: str) -> Optional[str]:
+        """URL of a stored image, marking it recently used; None if it is not stored."""
+        try:
+            os.utime(self._path(name))
+        except FileNotFoundError:
+            return None
+        return self.url(name)
+
+    def put(self, name: str, content: bytes) -> str:
+        path = self._path(name)
+        # Write then rename so the static server never serves a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        try:
+            replaced = os.path.getsize(path)  # content-hash names are often written again
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._bytes += len(content) - replaced
+            over_budget = self._bytes > self.max_bytes
+        if over_budget:
+            self.sweep()
+        return self.url(name)
+
+    def sweep(self) -> Dict[str, int]:
+        """Delete expired files, then the least recently used until under budget."""
+        if not self._sweep_lock.acquire(blocking=False):
+            return {"removed": 0, "removed_bytes": 0}
+        try:
+            now = time.time()
+            files, removed, removed_bytes = [], 0, 0
+            for entry in os.scandir(self.directory):
+                if not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                age = now - stat.st_mtime
+                if age > self.ttl_seconds or (entry.name.endswith(".tmp") and age > _STALE_TMP_SECONDS):
+                    removed_bytes += self._remove(entry.path, stat.st_size)
+                    removed += 1
+                else:
+                    files.append((stat.st_mtime, stat.st_size, entry.path, entry.name))
+
+            total = sum(size for _, size, _, _ in files)
+            target = self.max_bytes * 0.9
+            if total > self.max_bytes:
+                for _, size, path, name in sorted(files):
+                    if total <= target:
+                        break
+                    if name.endswith(".tmp"):  # may still be being written
+                        continue
+                    removed_bytes += self._remove(path, size)
+                    removed += 1
+                    total -= size
+
+            with self._lock:
+                self._bytes = total
+                self.evicted += removed
+                self.evicted_bytes += removed_bytes
+            if removed:
+                logger.info("Image store sweep removed %d files (%d bytes)", removed, removed_bytes)
+            return {"removed": removed, "removed_bytes": removed_bytes}
+        finally:
+            self._sweep_lock.release()
+
+    def clear(self) -> None:
+        with self._sweep_lock:
+            for entry in os.scandir(self.directory):
+                if entry.is_file():
+                    self._remove(entry.path, 0)
+            with self._lock:
+                self._bytes = 0
+
+    def _remove(self, path: str, size: int) -> int:
+        try:
+            os.remove(path)
+        except OSError:
+            return 0
+        return size
+
+    def start_sweeper(self) -> None:
+        if self._sweeper is not None:
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="image-store-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+    def _sweep_loop(self) -> None:
+        while not self._stop.wait(self.sweep_seconds):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Image store sweep failed")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evicted": self.evicted,
+                "evicted_bytes": self.evicted_bytes
+            }
+
+
+image_store = ImageStore(
+    STORE_DIR, STORE_URL, PROCESSED_IMAGE_MAX_BYTES, PROCESSED_IMAGE_TTL_SECONDS, PROCESSED_IMAGE_SWEEP_SECONDS
+)
@@ -0,0 +1,156 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+MERGE_STRATEGIES = ('nms', 'soft_nms', 'wbf')
+
+# Larger than any image side we tile, so offset boxes of different classes never overlap
+_CLASS_OFFSET = 1e5
+
+
+def box_area(boxes: np.ndarray) -> np.ndarray:
+    return (boxes[:, 2] - boxes[:, 0]).clip(0) * (boxes[:, 3] - boxes[:, 1]).clip(0)
+
+
+def intersection(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """Intersection area of one box with each of boxes."""
+    width = np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0])
+    height = np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1])
+    return width.clip(0) * height.clip(0)
+
+
+def nms_indices(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Greedy NMS; returns kept indices in descending score order.
+
+    Suppressed boxes are dropped from the candidate set every round, so the number
+    of rounds is the number of kept boxes rather than the number of candidates.
+    """
+    order = np.argsort(-scores, kind='stable')
+    areas = box_area(boxes)
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter = intersection(boxes[i], boxes[rest])
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def _offset_by_class(boxes: np.ndarray, classes: np.ndarray) -> np.ndarray:
+    """Shift each class into its own coordinate range so one pass never mixes classes."""
+    return boxes + classes[:, None].astype(boxes.dtype) * _CLASS_OFFSET
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray,
+        iou_threshold: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Class-aware NMS."""
+    keep = nms_indices(_offset_by_class(boxes, classes), scores, iou_threshold)
+    return boxes[keep], scores[keep], classes[keep]
+
+
+def soft_nms(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou_threshold: float,
+             score_threshold: float, sigma: float = 0.5) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Class-aware Gaussian soft-NMS.
+
+    Overlapping boxes have their score decayed by exp(-iou^2 / sigma) instead of being
+    removed outright; only overlaps above iou_threshold are decayed. Boxes whose score
+    falls below score_threshold are dropped.
+    """
+    offset_boxes = _offset_by_class(boxes, classes)
+    areas = box_area(offset_boxes)
+    scores = scores.astype(np.float64).copy()
+    remaining = np.arange(len(scores))
+    keep, kept_scores = [], []
+    while remaining.size > 0:
+        best = np.argmax(scores[remaining])
+        i = remaining[best]
+        keep.append(i)
+        kept_scores.append(scores[i])
+        remaining = np.delete(remaining, best)
+        if remaining.size == 0:
+            break
+        inter = intersection(offset_boxes[i], offset_boxes[remaining])
+        iou = inter / (areas[i] + areas[remaining] - inter + 1e-9)
+        decay = np.where(iou > iou_threshold, np.exp(-(iou ** 2) / sigma), 1.0)
+        scores[remaining] *= decay
+        remaining = remaining[scores[remaining] >= score_threshold]
+
+    keep = np.array(keep, dtype=np.int64)
+    return boxes[keep], np.array(kept_scores, dtype=np.float32), classes[keep]
+
+
+def weighted_box_fusion(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou_threshold: float,
+                        truncated: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Class-aware weighted box fusion that joins boxes split across tile borders.
+
+    Clusters are formed like NMS: the highest-scoring unclustered box leads a new cluster
+    and absorbs every remaining box of its class overlapping it by more than iou_threshold.
+    truncated marks, per box, which sides (x1, y1, x2, y2) were cut off by an interior tile
+    border (see tile_border_flags). Overlap involving a cut box is measured as intersection
+    over the smaller box, since the two halves of an object straddling a seam barely
+    overlap by IoU. Each fused side is the score-weighted mean of the members whose side is
+    a real object edge, or the outermost member edge when every member was cut on that
+    side. The fused score is the leader's (best) score.
+    """
+    if truncated is None:
+        truncated = np.zeros(boxes.shape, dtype=bool)
+    offset_boxes = _offset_by_class(boxes.astype(np.float64), classes)
+    areas = box_area(offset_boxes)
+    cut = truncated.any(axis=1)
+
+    labels = np.empty(len(boxes), dtype=np.int64)
+    leaders = []
+    order = np.argsort(-scores, kind='stable')
+    while order.size > 0:
+        i = order[0]
+        rest = order[1:]
+        inter = intersection(offset_boxes[i], offset_boxes[rest])
+        denominator = np.where(cut[i] | cut[rest], np.minimum(areas[i], areas[rest]), areas[i] + areas[rest] - inter)
+        member = inter / (denominator + 1e-9) > iou_threshold
+        labels[i] = len(leaders)
+        labels[rest[member]] = len(leaders)
+        leaders.append(i)
+        order = rest[~member]
+
+    count = len(leaders)
+    weights = np.where(truncated, 0.0, scores[:, None].astype(np.float64))
+    weighted_sum = np.zeros((count, 4))
+    weight = np.zeros((count, 4))
+    np.add.at(weighted_sum, labels, boxes * weights)
+    np.add.at(weight, labels, weights)
+    outer = np.empty((count, 4))
+    outer[:, :2] = np.inf
+    outer[:, 2:] = -np.inf
+    np.minimum.at(outer[:, :2], labels, boxes[:, :2])
+    np.maximum.at(outer[:, 2:], labels, boxes[:, 2:])
+
+    all_cut = weight == 0
+    fused = np.where(all_cut, outer, weighted_sum / np.where(all_cut, 1.0, weight))
+    leaders = np.array(leaders, dtype=np.int64)
+    return fused.astype(boxes.dtype), scores[leaders], classes[leaders]
+
+
+def tile_border_flags(boxes: np.ndarray, tile_pos, height: int, width: int, margin: float = 2.0) -> np.ndarray:
+    """Mark box sides (x1, y1, x2, y2) touching a tile border that is not an image border."""
+    x1, y1, x2, y2 = tile_pos
+    return np.stack([
+        (boxes[:, 0] <= x1 + margin) & (x1 > 0),
+        (boxes[:, 1] <= y1 + margin) & (y1 > 0),
+        (boxes[:, 2] >= x2 - margin) & (x2 < width),
+        (boxes[:, 3] >= y2 - margin) & (y2 < height),
+    ], axis=1)
+
+
+def merge_detections(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, strategy: str = 'nms',
+                     iou_threshold: float = 0.45, score_threshold: float = 0.0,
+                     truncated: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Merge overlapping detections collected from all tiles."""
+    if strategy == 'nms':
+        return nms(boxes, scores, classes, iou_threshold)
+    if strategy == 'soft_nms':
+        return soft_nms(boxes, scores, classes, iou_threshold, score_threshold)
+    if strategy == 'wbf':
+        return weighted_box_fusion(boxes, scores, classes, iou_threshold, truncated)
+    raise ValueError(f"Unknown merge strategy: {strategy}")
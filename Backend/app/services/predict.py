@@ -1,54 +1,173 @@
-from ultralytics import YOLO
 import cv2
 import numpy as np
-import os
-from typing import Tuple, List, Dict
-from itertools import product
+import threading
+import time
+from typing import Tuple, List, Dict, Optional, Callable, Iterator
+from dataclasses import dataclass
+from app.services.backends import create_backend
+from app.services.merge import merge_detections, tile_border_flags
+from app.services.roi import coarse_mask, select_tiles, vegetation_mask
+from app.services.telemetry import record_stage, stage
+
+@dataclass
+class RawPredictions:
+    """Unmerged detections from every tile, in image coordinates.
+
+    Produced by TiledPredictor.collect_predictions with scores of at least conf_floor;
+    truncated flags which box sides were cut by an interior tile border. With adaptive
+    tiling, tiles_skipped of the tiles_total grid tiles were never run through the model.
+    """
+    boxes: np.ndarray
+    scores: np.ndarray
+    classes: np.ndarray
+    truncated: np.ndarray
+    tile_size: int
+    overlap: float
+    conf_floor: float
+    image_shape: Tuple[int, int]  # (height, width)
+    tiling: str = 'exhaustive'
+    tiles_total: int = 0
+    tiles_skipped: int = 0
+    working_shape: Optional[Tuple[int, int]] = None  # resolution detected at, if not image_shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.boxes.nbytes + self.scores.nbytes + self.classes.nbytes + self.truncated.nbytes
 
 class TiledPredictor:
-    def __init__(self, model_path: str, tile_size: int = 640, overlap: float = 0.2, conf_threshold: float = 0.25):
-        self.model = YOLO(model_path, task='detect')
+    def __init__(self, model_path: str, tile_size: int = 640, overlap: float = 0.2, conf_threshold: float = 0.25,
+                 batch_size: int = 8, backend=None, merge_strategy: str = 'nms', iou_threshold: float = 0.45,
+                 severity_high: float = 0.85, severity_medium: float = 0.65, tiling: str = 'exhaustive',
+                 min_coverage: float = 0.02, coarse_conf: float = 0.05):
+        # Backend is chosen from the model file (.pt -> ultralytics, .onnx -> ONNX Runtime)
+        # unless a preconfigured one is passed in.
+        self.backend = backend or create_backend(model_path)
+        self.model_path = model_path
+        self.batch_size = max(1, batch_size)
+        # Instance values are only defaults; predict() accepts per-call overrides
+        # so a single loaded model can be shared by every request.
         self.tile_size = tile_size
         self.overlap = overlap
         self.conf_threshold = conf_threshold
+        self.merge_strategy = merge_strategy
+        self.iou_threshold = iou_threshold
+        # Confidence at or above which a detection is reported as High / Medium severity
+        self.severity_high = severity_high
+        self.severity_medium = severity_medium
+        # Adaptive tiling: 'vegetation' keeps tiles with at least min_coverage plant-coloured
+        # area, 'coarse' tiles over boxes a downscaled pass finds at coarse_conf
+        self.tiling = tiling
+        self.min_coverage = min_coverage
+        self.coarse_conf = coarse_conf
+        # Moving average of model time per tile, for latency budgets; None until measured
+        self.seconds_per_tile: Optional[float] = None
+        self._local = threading.local()
+
+    def warmup(self) -> None:
+        """Run one inference on a blank tile so lazy model initialisation happens up front."""
+        blank_tile = np.full((self.tile_size, self.tile_size, 3), 114, dtype=np.uint8)
+        self.backend.infer([blank_tile], self.conf_threshold)
         
-    def split_image(self, image: np.ndarray) -> Tuple[List[Dict], Tuple[int, int]]:
+    def tile_grid(self, height: int, width: int, tile_size: Optional[int] = None,
+                  overlap: Optional[float] = None) -> np.ndarray:
+        """Compute overlapping tile boxes as an (N, 4) array of (x1, y1, x2, y2), row by row."""
+        tile_size = self.tile_size if tile_size is None else tile_size
+        overlap = self.overlap if overlap is None else overlap
+        stride = max(1, int(tile_size * (1 - overlap)))
+
+        def axis_starts(length: int) -> np.ndarray:
+            starts = np.arange(0, length, stride)
+            # Tiles running past the edge are shifted back to end at it; several strides
+            # can land on the same edge tile, so drop the repeats.
+            starts = np.where(starts + tile_size >= length, max(0, length - tile_size), starts)
+            return np.unique(starts)
+
+        ys, xs = np.meshgrid(axis_starts(height), axis_starts(width), indexing='ij')
+        x1, y1 = xs.ravel(), ys.ravel()
+        return np.stack([x1, y1, np.minimum(x1 + tile_size, width), np.minimum(y1 + tile_size, height)], axis=1)
+
+    def iter_tile_batches(self, image: np.ndarray, positions: np.ndarray, tile_size: Optional[int] = None,
+                          batch_size: Optional[int] = None) -> Iterator[Tuple[List[np.ndarray], np.ndarray]]:
+        """Yield (tiles, positions) batches over the tile grid.
+
+        Full tiles are views into the image. Tiles smaller than tile_size (images smaller
+        than a tile) are padded into a per-thread buffer that is reused for every batch,
+        so each batch must be consumed before the next one is requested.
+        """
+        tile_size = self.tile_size if tile_size is None else tile_size
+        batch_size = batch_size or self.batch_size
+        pad_buffer = None
+
+        for start in range(0, len(positions), batch_size):
+            batch_positions = positions[start:start + batch_size]
+            tiles = []
+            for i, (x1, y1, x2, y2) in enumerate(batch_positions):
+                tile = image[y1:y2, x1:x2]
+                if tile.shape[0] != tile_size or tile.shape[1] != tile_size:
+                    if pad_buffer is None:
+                        pad_buffer = self._pad_buffer(batch_size, tile_size)
+                    padded_tile = pad_buffer[i]
+                    padded_tile.fill(114)
+                    padded_tile[:tile.shape[0], :tile.shape[1]] = tile
+                    tile = padded_tile
+                tiles.append(tile)
+            yield tiles, batch_positions
+
+    def _pad_buffer(self, batch_size: int, tile_size: int) -> np.ndarray:
+        """Preallocated (batch_size, tile_size, tile_size, 3) buffer for padded tiles, one per thread."""
+        buffer = getattr(self._local, 'pad_buffer', None)
+        if buffer is None or buffer.shape[0] < batch_size or buffer.shape[1] != tile_size:
+            buffer = np.empty((batch_size, tile_size, tile_size, 3), dtype=np.uint8)
+            self._local.pad_buffer = buffer
+        return buffer
+
+    def split_image(self, image: np.ndarray, tile_size: Optional[int] = None,
+                    overlap: Optional[float] = None) -> Tuple[List[Dict], Tuple[int, int]]:
         """Split image into overlapping tiles."""
+        tile_size = self.tile_size if tile_size is None else tile_size
         height, width = image.shape[:2]
-        stride = int(self.tile_size * (1 - self.overlap))
         
         tiles = []
         
-        for y in range(0, height, stride):
-            for x in range(0, width, stride):
-                # Calculate tile boundaries
-                x1 = x
-                y1 = y
-                x2 = min(x + self.tile_size, width)
-                y2 = min(y + self.tile_size, height)
-                
-                # Adjust starting position for edge tiles
-                if x2 == width:
-                    x1 = max(0, x2 - self.tile_size)
-                if y2 == height:
-                    y1 = max(0, y2 - self.tile_size)
-                
-                # Extract tile
-                tile = image[y1:y2, x1:x2]
-                
-                # Pad if necessary
-                if tile.shape[0] != self.tile_size or tile.shape[1] != self.tile_size:
-                    padded_tile = np.full((self.tile_size, self.tile_size, 3), 114, dtype=np.uint8)
-                    padded_tile[:tile.shape[0], :tile.shape[1]] = tile
-                    tile = padded_tile
-                
-                tiles.append({
-                    'tile': tile,
-                    'position': (x1, y1, x2, y2)
-                })
+        for x1, y1, x2, y2 in self.tile_grid(height, width, tile_size, overlap).tolist():
+            # Extract tile
+            tile = image[y1:y2, x1:x2]
+            
+            # Pad if necessary
+            if tile.shape[0] != tile_size or tile.shape[1] != tile_size:
+                padded_tile = np.full((tile_size, tile_size, 3), 114, dtype=np.uint8)
+                padded_tile[:tile.shape[0], :tile.shape[1]] = tile
+                tile = padded_tile
+            
+            tiles.append({
+                'tile': tile,
+                'position': (x1, y1, x2, y2)
+            })
         
         return tiles, (height, width)
 
+    def region_of_interest(self, image: np.ndarray, positions: np.ndarray, tile_size: int, overlap: float,
+                           tiling: str, tile_runner: Callable) -> np.ndarray:
+        """Boolean mask over positions of the tiles worth running through the model."""
+        if tiling == 'vegetation':
+            mask, scale = vegetation_mask(image)
+            min_coverage = self.min_coverage
+        elif tiling == 'coarse':
+            mask, scale = coarse_mask(image, tile_size, tile_runner, self.coarse_conf)
+            min_coverage = 0.0
+        else:
+            raise ValueError(f"Unknown tiling mode: {tiling}")
+        # Grow regions by the tile overlap so objects at their edges are still seen whole
+        return select_tiles(positions, mask, scale, margin=tile_size * overlap, min_coverage=min_coverage)
+
+    def infer_batch(self, tiles: List[np.ndarray],
+                    conf_threshold: float) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Run the model once over a batch of tiles.
+
+        Returns (boxes, scores, classes) in tile coordinates for each tile, in input order.
+        """
+        return self.backend.infer(tiles, conf_threshold)
+
     def adjust_coordinates(self, boxes: np.ndarray, tile_pos: Tuple[int, int, int, int]) -> np.ndarray:
         """Adjust coordinates from tile space to original image space."""
         x1, y1, _, _ = tile_pos
@@ -57,7 +176,8 @@ class TiledPredictor:
         adjusted_boxes[:, [1, 3]] += y1  # adjust y coordinates
         return adjusted_boxes
 
-    def get_detections(self, boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray) -> List[Dict]:
+    def get_detections(self, boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray,
+                       severity_high: Optional[float] = None, severity_medium: Optional[float] = None) -> List[Dict]:
         """Convert detections to a structured format with descriptive labels."""
         disease_descriptions = {
             'Cf_blk_rot': 'Cauliflower Black Rot Disease',
@@ -69,120 +189,191 @@ class TiledPredictor:
         
         detections = []
         for box, score, cls in zip(boxes, scores, classes):
-            class_name = self.model.names[int(cls)]
+            class_name = self.backend.names[int(cls)]
             detections.append({
                 "class": disease_descriptions.get(class_name, class_name),
                 "original_class": class_name,
                 "confidence": float(score),
                 "bbox": box.tolist(),  # Make sure it's a list
-                "severity": self._calculate_severity(score)
+                "severity": self._calculate_severity(score, severity_high, severity_medium)
             })
         return detections
 
-    def _calculate_severity(self, confidence: float) -> str:
+    def _calculate_severity(self, confidence: float, high: Optional[float] = None,
+                            medium: Optional[float] = None) -> str:
         """Calculate severity level based on confidence score."""
-        if confidence >= 0.85:
+        high = self.severity_high if high is None else high
+        medium = self.severity_medium if medium is None else medium
+        if confidence >= high:
             return "High"
-        elif confidence >= 0.65:
+        elif confidence >= medium:
             return "Medium"
         else:
             return "Low"
 
-    def predict(self, image_path: str) -> Tuple[np.ndarray, List[Dict]]:
-        """Predict on tiled image and combine results."""
-        # Read and enhance image
+    def predict(self, image_path: str, **kwargs) -> Tuple[np.ndarray, List[Dict]]:
+        """Predict on an image file; see predict_array for the options."""
         original_img = cv2.imread(image_path)
         if original_img is None:
             raise ValueError("Could not load image")
-        
-        # Split image into tiles
-        tiles, (height, width) = self.split_image(original_img)
+        return self.predict_array(original_img, **kwargs)
+
+    @staticmethod
+    def decode(image_bytes: bytes) -> np.ndarray:
+        """Decode an encoded image (JPEG, PNG, ...) held in memory to BGR."""
+        with stage("decode"):
+            original_img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if original_img is None:
+            raise ValueError("Invalid image data")
+        return original_img
+
+    def predict_bytes(self, image_bytes: bytes, **kwargs) -> Tuple[np.ndarray, List[Dict]]:
+        """Predict on an encoded image held in memory; see predict_array for the options."""
+        return self.predict_array(self.decode(image_bytes), **kwargs)
+
+    def collect_predictions(self, original_img: np.ndarray, tile_size: Optional[int] = None,
+                            overlap: Optional[float] = None, conf_threshold: Optional[float] = None,
+                            tile_runner: Optional[Callable] = None, tiling: Optional[str] = None) -> RawPredictions:
+        """Run the tiles through the model and gather the unmerged boxes in image coordinates.
+
+        tile_runner replaces infer_batch for running tiles through the model,
+        e.g. to route them through a shared BatchScheduler. tiling is 'exhaustive'
+        (every tile) or an adaptive mode that first picks the tiles to run; see region_of_interest.
+        """
+        conf_threshold = self.conf_threshold if conf_threshold is None else conf_threshold
+        tile_runner = tile_runner or self.infer_batch
+
+        # Compute the tile grid; tiles themselves are views produced batch by batch
+        tile_size = self.tile_size if tile_size is None else tile_size
+        overlap = self.overlap if overlap is None else overlap
+        height, width = original_img.shape[:2]
+        positions = self.tile_grid(height, width, tile_size, overlap)
+        tiling = self.tiling if tiling is None else tiling
+        tiles_total = len(positions)
+        if tiling != 'exhaustive' and tiles_total > 1:
+            with stage("roi"):
+                positions = positions[self.region_of_interest(
+                    original_img, positions, tile_size, overlap, tiling, tile_runner
+                )]
+        tiles = (tiling, tiles_total, tiles_total - len(positions))
         
         # Store all detections
         all_boxes = []
         all_scores = []
         all_classes = []
+        all_truncated = []
         
-        # Process each tile
-        for tile_info in tiles:
-            tile = tile_info['tile']
-            tile_pos = tile_info['position']
-            
-            # Run inference on tile
-            results = self.model(tile, conf=self.conf_threshold)
-            
-            for r in results:
-                if len(r.boxes) > 0:
-                    # Get boxes and adjust coordinates to original image space
-                    boxes = r.boxes.xyxy.cpu().numpy()
+        # Run inference on batches of tiles, one model call per batch; model time is
+        # reported as the infer stage and everything else here as the tile stage
+        start = time.perf_counter()
+        infer_seconds = 0.0
+        for batch_tiles, batch_positions in self.iter_tile_batches(original_img, positions, tile_size):
+            infer_start = time.perf_counter()
+            batch_results = tile_runner(batch_tiles, conf_threshold)
+            infer_seconds += time.perf_counter() - infer_start
+
+            for tile_pos, (boxes, scores, classes) in zip(batch_positions, batch_results):
+                if len(boxes) > 0:
+                    # Adjust coordinates to original image space
                     adjusted_boxes = self.adjust_coordinates(boxes, tile_pos)
-                    
-                    all_boxes.extend(adjusted_boxes)
-                    all_scores.extend(r.boxes.conf.cpu().numpy())
-                    all_classes.extend(r.boxes.cls.cpu().numpy())
-        
-        final_detections = []
-        # Convert to numpy arrays
-        if all_boxes:
-            all_boxes = np.array(all_boxes)
-            all_scores = np.array(all_scores)
-            all_classes = np.array(all_classes)
-            
-            # Apply NMS to remove overlapping boxes
-            indices = cv2.dnn.NMSBoxes(
-                all_boxes.tolist(),
-                all_scores.tolist(),
-                self.conf_threshold,
-                0.45  # NMS threshold
+                    all_boxes.append(adjusted_boxes)
+                    all_scores.append(scores)
+                    all_classes.append(classes)
+                    all_truncated.append(tile_border_flags(adjusted_boxes, tile_pos, height, width))
+        record_stage("infer", infer_seconds)
+        if len(positions):
+            per_tile = infer_seconds / len(positions)
+            self.seconds_per_tile = per_tile if self.seconds_per_tile is None else 0.9 * self.seconds_per_tile + 0.1 * per_tile
+        record_stage("tile", time.perf_counter() - start - infer_seconds)
+
+        if not all_boxes:
+            return RawPredictions(
+                np.empty((0, 4), np.float32), np.empty(0, np.float32), np.empty(0, np.float32),
+                np.empty((0, 4), bool), tile_size, overlap, conf_threshold, (height, width), *tiles
             )
+        return RawPredictions(
+            np.concatenate(all_boxes), np.concatenate(all_scores), np.concatenate(all_classes),
+            np.concatenate(all_truncated), tile_size, overlap, conf_threshold, (height, width), *tiles
+        )
+
+    def finalize(self, raw: RawPredictions, conf_threshold: Optional[float] = None,
+                 merge_strategy: Optional[str] = None, iou_threshold: Optional[float] = None,
+                 severity_high: Optional[float] = None, severity_medium: Optional[float] = None) -> List[Dict]:
+        """Filter and merge raw tile predictions into structured detections.
+
+        Cheap compared to inference, so raw predictions collected at a low confidence
+        floor can be re-finalized for any conf_threshold at or above that floor.
+        merge_strategy is one of 'nms', 'soft_nms' or 'wbf' (see app.services.merge).
+        """
+        conf_threshold = self.conf_threshold if conf_threshold is None else conf_threshold
+        merge_strategy = self.merge_strategy if merge_strategy is None else merge_strategy
+        iou_threshold = self.iou_threshold if iou_threshold is None else iou_threshold
+
+        keep = raw.scores >= conf_threshold
+        if not keep.any():
+            return []
+
+        # Merge duplicate and seam-split boxes from overlapping tiles
+        with stage("merge"):
+            final_boxes, final_scores, final_classes = merge_detections(
+                raw.boxes[keep], raw.scores[keep], raw.classes[keep],
+                strategy=merge_strategy,
+                iou_threshold=iou_threshold,
+                score_threshold=conf_threshold,
+                truncated=raw.truncated[keep]
+            )
+
+        # Get structured detections
+        return self.get_detections(final_boxes, final_scores, final_classes, severity_high, severity_medium)
+
+    def draw_detections(self, original_img: np.ndarray, detections: List[Dict], scale: float = 1.0) -> np.ndarray:
+        """Draw detections onto the image in place.
+
+        scale maps detection coordinates onto the image, e.g. 0.25 for a quarter-size preview.
+        """
+        with stage("annotate"):
+            self._draw(original_img, detections, scale)
+        return original_img
+
+    def _draw(self, original_img: np.ndarray, detections: List[Dict], scale: float) -> None:
+        for detection in detections:
+            box = [coordinate * scale for coordinate in detection["bbox"]]
+            label = f'{detection["class"]} ({detection["severity"]}) {detection["confidence"]:.2f}'
             
-            # Get final detections
-            final_boxes = all_boxes[indices]
-            final_scores = all_scores[indices]
-            final_classes = all_classes[indices]
+            # Draw rectangle
+            cv2.rectangle(original_img,
+                        (int(box[0]), int(box[1])),
+                        (int(box[2]), int(box[3])),
+                        (0, 255, 0), 2)
             
-            # Get structured detections
-            final_detections = self.get_detections(final_boxes, final_scores, final_classes)
+            # Add label with better positioning and background
+            label_size, baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
+            text_x = int(box[0])
+            text_y = int(box[1]) - 10 if int(box[1]) - 10 > label_size[1] else int(box[1]) + 10 + label_size[1]
             
-            # Draw final predictions
-            for detection in final_detections:
-                box = detection["bbox"]
-                label = f'{detection["class"]} ({detection["severity"]}) {detection["confidence"]:.2f}'
-                
-                # Draw rectangle
-                cv2.rectangle(original_img,
-                            (int(box[0]), int(box[1])),
-                            (int(box[2]), int(box[3])),
-                            (0, 255, 0), 2)
-                
-                # Add label with better positioning and background
-                label_size, baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                text_x = int(box[0])
-                text_y = int(box[1]) - 10 if int(box[1]) - 10 > label_size[1] else int(box[1]) + 10 + label_size[1]
-                
-                # Draw background rectangle for text
-                cv2.rectangle(original_img,
-                            (text_x, text_y - label_size[1] - baseline),
-                            (text_x + label_size[0], text_y + baseline),
-                            (0, 0, 0), cv2.FILLED)
-                
-                # Draw text
-                cv2.putText(original_img, label,
-                           (text_x, text_y),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
-        return original_img, final_detections
-
-def predict_image(image_path: str, conf_threshold: float = 0.25) -> None:
-    """Main prediction function."""
-    predictor = TiledPredictor(
-        model_path=os.path.join(os.path.dirname(__file__)+'models/cauliflower_model.pt'),
-        tile_size=640,
-        overlap=0.2,
-        conf_threshold=conf_threshold
-    )
-    predictor.predict(image_path)
-
-if __name__ == '__main__':
-    image_path = "Bacterial-Soft-Rot-of-Cauliflower-Head.jpg"
-    predict_image(image_path)
\ No newline at end of file
+            # Draw background rectangle for text
+            cv2.rectangle(original_img,
+                        (text_x, text_y - label_size[1] - baseline),
+                        (text_x + label_size[0], text_y + baseline),
+                        (0, 0, 0), cv2.FILLED)
+            
+            # Draw text
+            cv2.putText(original_img, label,
+                       (text_x, text_y),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+    def predict_array(self, original_img: np.ndarray, tile_size: Optional[int] = None,
+                      overlap: Optional[float] = None, conf_threshold: Optional[float] = None,
+                      tile_runner: Optional[Callable] = None, merge_strategy: Optional[str] = None,
+                      iou_threshold: Optional[float] = None, severity_high: Optional[float] = None,
+                      severity_medium: Optional[float] = None,
+                      tiling: Optional[str] = None) -> Tuple[np.ndarray, List[Dict]]:
+        """Predict on tiled image and combine results.
+
+        Takes a decoded BGR image and draws the detections onto it in place.
+        See collect_predictions and finalize for the options.
+        """
+        raw = self.collect_predictions(original_img, tile_size, overlap, conf_threshold, tile_runner, tiling)
+        final_detections = self.finalize(raw, conf_threshold, merge_strategy, iou_threshold,
+                                         severity_high, severity_medium)
+        return self.draw_detections(original_img, final_detections), final_detections
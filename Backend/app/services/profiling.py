@@ -0,0 +1,117 @@
+import cProfile
+import itertools
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from app.config import PROFILING_ENABLED, PROFILE_EVERY_N, PROFILE_DIR, PROFILE_MAX_FILES
+
+logger = logging.getLogger(__name__)
+
+_PROFILE_ID = re.compile(r"^[0-9T]+-[0-9a-f]{8}$")
+SORT_KEYS = {"tottime": 2, "cumulative": 3}
+
+
+class RequestProfiler:
+    """Samples requests with cProfile and keeps the most recent profiles on disk.
+
+    A request is profiled when the client asks for it or when it is every every_n-th
+    request (0 disables sampling). Only one request is profiled at a time: cProfile on
+    Python 3.12+ allows a single active profiler per process, and overlapping profiles
+    would be hard to read anyway. Profiles are standard .prof files (load them with
+    pstats or snakeviz); the oldest are deleted once more than max_files exist.
+    """
+
+    def __init__(self, directory: str, every_n: int = 0, max_files: int = 50, enabled: bool = True):
+        self.directory = directory
+        self.every_n = max(0, every_n)
+        self.max_files = max(1, max_files)
+        self.enabled = enabled
+        self._counter = itertools.count(1)
+        self._active = threading.Lock()
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    def should_profile(self, requested: bool = False) -> bool:
+        if not self.enabled:
+            return False
+        sampled = self.every_n > 0 and next(self._counter) % self.every_n == 0
+        return requested or sampled
+
+    @contextmanager
+    def profile(self) -> Iterator[Optional[str]]:
+        """Profile the enclosed block on the current thread; yields the profile id, or None if busy."""
+        if not self._active.acquire(blocking=False):
+            yield None
+            return
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                yield profile_id
+            finally:
+                profiler.disable()
+            profiler.dump_stats(self._path(profile_id))
+            self._prune()
+        finally:
+            self._active.release()
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.prof")
+
+    def _stored(self) -> List[os.DirEntry]:
+        """Stored profiles, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.prof')]
+        return sorted(entries, key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+
+    def _prune(self) -> None:
+        for entry in self._stored()[self.max_files:]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                logger.warning("Could not remove old profile %s", entry.path, exc_info=True)
+
+    def list_profiles(self) -> List[Dict]:
+        return [
+            {
+                "id": entry.name[:-len('.prof')],
+                "size_bytes": entry.stat().st_size,
+                "created": entry.stat().st_mtime
+            }
+            for entry in self._stored()
+        ]
+
+    def top_functions(self, profile_id: str, limit: int = 25, sort: str = "tottime") -> Optional[Dict]:
+        """The hottest functions of a stored profile, or None if it does not exist."""
+        # Ids are used as file names, so reject anything we did not generate
+        if not _PROFILE_ID.match(profile_id) or sort not in SORT_KEYS:
+            return None
+        path = self._path(profile_id)
+        if not os.path.exists(path):
+            return None
+
+        stats = pstats.Stats(path)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][SORT_KEYS[sort]], reverse=True)
+        functions = []
+        for (filename, line, function), (primitive_calls, calls, tottime, cumtime, _) in rows[:limit]:
+            functions.append({
+                "function": function,
+                "location": f"{filename}:{line}",
+                "calls": calls,
+                "primitive_calls": primitive_calls,
+                "tottime": tottime,
+                "cumtime": cumtime
+            })
+        return {"id": profile_id, "total_time": stats.total_tt, "sort": sort, "functions": functions}
+
+
+request_profiler = RequestProfiler(PROFILE_DIR, PROFILE_EVERY_N, PROFILE_MAX_FILES, enabled=PROFILING_ENABLED)
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+from app.config import (
+    MODEL_PATH, MODEL_WARMUP, TILE_BATCH_SIZE, DYNAMIC_BATCH_MAX_SIZE, DYNAMIC_BATCH_MAX_WAIT_MS,
+    ONNX_INTRA_OP_THREADS, ONNX_INTER_OP_THREADS, INFERENCE_BACKEND, ONNX_INT8_MODEL_PATH, USE_INT8_MODEL,
+    INT8_MAX_MAP_DROP, MERGE_STRATEGY, MERGE_IOU_THRESHOLD, SEVERITY_HIGH_THRESHOLD, SEVERITY_MEDIUM_THRESHOLD,
+    TILING_MODE, ADAPTIVE_MIN_COVERAGE, ADAPTIVE_COARSE_CONF
+)
+from app.services.batching import BatchScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def default_model_path() -> str:
+    """The configured model, or its INT8 variant when that is within the accuracy tolerance."""
+    if INFERENCE_BACKEND != 'onnx' or not USE_INT8_MODEL:
+        return MODEL_PATH
+
+    report_path = ONNX_INT8_MODEL_PATH + '.report.json'
+    if not (os.path.exists(ONNX_INT8_MODEL_PATH) and os.path.exists(report_path)):
+        return MODEL_PATH
+    with open(report_path) as f:
+        report = json.load(f)
+
+    drop = report.get('max_class_map50_drop', float('inf'))
+    if drop > INT8_MAX_MAP_DROP:
+        logger.warning("Not serving INT8 model: mAP50 drop %.4f exceeds tolerance %.4f", drop, INT8_MAX_MAP_DROP)
+        return MODEL_PATH
+    return ONNX_INT8_MODEL_PATH
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded predictors, keyed by model path."""
+
+    def __init__(self):
+        self._predictors: Dict[str, "TiledPredictor"] = {}
+        self._schedulers: Dict[str, BatchScheduler] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.error: Optional[str] = None
+        self.default_model_path = default_model_path()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def loaded_models(self) -> List[str]:
+        return list(self._predictors)
+
+    def model_version(self, model_path: Optional[str] = None) -> str:
+        """Identifies the weights behind a model path; changes whenever the file is replaced."""
+        model_path = model_path or self.default_model_path
+        if not os.path.exists(model_path):
+            # e.g. an ultralytics hub name resolved by the runtime itself
+            return model_path
+        stat = os.stat(model_path)
+        return f"{os.path.basename(model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def register_predictor(self, predictor: "TiledPredictor", model_path: Optional[str] = None) -> None:
+        """Serve a preconstructed predictor for a model path (e.g. a stub backend in benchmarks)."""
+        with self._lock:
+            self._predictors[model_path or self.default_model_path] = predictor
+
+    def get_predictor(self, model_path: Optional[str] = None) -> "TiledPredictor":
+        """Return the shared predictor for a model, loading the weights on first use."""
+        model_path = model_path or self.default_model_path
+        predictor = self._predictors.get(model_path)
+        if predictor is None:
+            with self._lock:
+                predictor = self._predictors.get(model_path)
+                if predictor is None:
+                    # Imported lazily so the API can start before the model runtime is loaded
+                    from app.services.backends import create_backend
+                    from app.services.predict import TiledPredictor
+                    backend = create_backend(
+                        model_path,
+                        intra_op_threads=ONNX_INTRA_OP_THREADS,
+                        inter_op_threads=ONNX_INTER_OP_THREADS
+                    )
+                    predictor = TiledPredictor(
+                        model_path=model_path,
+                        batch_size=TILE_BATCH_SIZE,
+                        backend=backend,
+                        merge_strategy=MERGE_STRATEGY,
+                        iou_threshold=MERGE_IOU_THRESHOLD,
+                        severity_high=SEVERITY_HIGH_THRESHOLD,
+                        severity_medium=SEVERITY_MEDIUM_THRESHOLD,
+                        tiling=TILING_MODE,
+                        min_coverage=ADAPTIVE_MIN_COVERAGE,
+                        coarse_conf=ADAPTIVE_COARSE_CONF
+                    )
+                    self._predictors[model_path] = predictor
+        return predictor
+
+    def get_scheduler(self, model_path: Optional[str] = None) -> BatchScheduler:
+        """Return the shared cross-request batch scheduler for a model."""
+        model_path = model_path or self.default_model_path
+        scheduler = self._schedulers.get(model_path)
+        if scheduler is None:
+            predictor = self.get_predictor(model_path)
+            with self._lock:
+                scheduler = self._schedulers.get(model_path)
+                if scheduler is None:
+                    scheduler = BatchScheduler(predictor, DYNAMIC_BATCH_MAX_SIZE, DYNAMIC_BATCH_MAX_WAIT_MS)
+                    self._schedulers[model_path] = scheduler
+        return scheduler
+
+    def scheduler_stats(self) -> Dict[str, Dict]:
+        return {model_path: scheduler.stats() for model_path, scheduler in self._schedulers.items()}
+
+    def load(self, model_path: Optional[str] = None, warmup: bool = MODEL_WARMUP) -> None:
+        """Load (and optionally warm up) a model, then mark the registry as ready."""
+        model_path = model_path or self.default_model_path
+        try:
+            predictor = self.get_predictor(model_path)
+            if warmup:
+                predictor.warmup()
+        except Exception as e:
+            self.error = str(e)
+            logger.exception("Failed to load model %s", model_path)
+            return
+        self.error = None
+        self._ready.set()
+
+
+registry = ModelRegistry()
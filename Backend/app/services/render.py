@@ -0,0 +1,147 @@
+import mimetypes
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.config import (
+    RENDER_SOURCE_MEMORY_BYTES, RENDER_OUTPUT_MEMORY_BYTES, PROCESSED_IMAGE_FORMAT, PROCESSED_IMAGE_QUALITY
+)
+from app.services.cache import ResultCache
+from app.services.registry import registry
+from app.services.telemetry import stage
+from app.services.tiling import REDUCED_DECODE
+
+
+def encoding(image_format: str, quality: int) -> Tuple[str, List[int]]:
+    """File extension and cv2.imencode parameters for an output format."""
+    if image_format == 'jpeg':
+        return '.jpg', [cv2.IMWRITE_JPEG_QUALITY, quality]
+    if image_format == 'webp':
+        return '.webp', [cv2.IMWRITE_WEBP_QUALITY, quality]
+    if image_format == 'png':
+        return '.png', [cv2.IMWRITE_PNG_COMPRESSION, 3]
+    raise ValueError(f"Unsupported image format: {image_format}")
+
+
+@dataclass
+class RenderSource:
+    """What an annotated image is drawn from: the original upload and its detections."""
+    image: bytes
+    detections: List[Dict]
+    image_shape: Optional[Tuple[int, int]] = None  # (height, width), when known
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.image) + 256 * len(self.detections)
+
+
+@dataclass
+class RenderedImage:
+    image: bytes
+    image_ext: str
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.image)
+
+    @property
+    def media_type(self) -> str:
+        return mimetypes.guess_type(f"image{self.image_ext}")[0] or "application/octet-stream"
+
+
+def preview_scale(image_shape: Tuple[int, int], max_dim: Optional[int]) -> float:
+    return 1.0 if max_dim is None else min(1.0, max_dim / max(image_shape))
+
+
+class AnnotationRenderer:
+    """Draws detections onto uploads on demand and caches the encoded results.
+
+    Sources are registered when detection finishes; rendering happens either straight
+    away (eager) or on the first request for the image (lazy). Each (render id, max_dim)
+    is drawn at most once while it stays in the output cache. Previews are decoded at a
+    reduced JPEG scale where possible and drawn at preview size, so they cost a fraction
+    of a full-resolution render.
+    """
+
+    def __init__(self, draw, source_bytes: int, output_bytes: int, image_format: str = 'jpeg', quality: int = 85):
+        # draw(image, detections, scale) draws in place; see TiledPredictor.draw_detections
+        self.draw = draw
+        self.image_ext, self.encode_params = encoding(image_format, quality)
+        self.sources = ResultCache(source_bytes)
+        self.outputs = ResultCache(output_bytes)
+
+    def register(self, render_id: str, source: RenderSource) -> None:
+        self.sources.put(render_id, source)
+
+    def has(self, render_id: str) -> bool:
+        return self.sources.get(render_id) is not None
+
+    def file_name(self, render_id: str, max_dim: Optional[int] = None) -> str:
+        """A content-addressed file name for a rendering."""
+        return f"{render_id[:40]}{f'_{max_dim}' if max_dim else ''}{self.image_ext}"
+
+    def render(self, render_id: str, max_dim: Optional[int] = None, decoded: Optional[np.ndarray] = None,
+               cache_output: bool = True) -> Optional[RenderedImage]:
+        """The annotated image, at most max_dim pixels on its longest side; None if unknown.
+
+        decoded may pass the already decoded full-size upload; it is drawn on in place.
+        cache_output=False is for callers that keep the result themselves.
+        """
+        output_key = f"{render_id}:{max_dim or 'full'}"
+        rendered = self.outputs.get(output_key) if cache_output else None
+        if rendered is not None:
+            return rendered
+        source = self.sources.get(render_id)
+        if source is None:
+            return None
+
+        image, scale = self._load(source, max_dim, decoded)
+        self.draw(image, source.detections, scale)
+        with stage("encode"):
+            ok, encoded = cv2.imencode(self.image_ext, image, self.encode_params)
+        if not ok:
+            raise ValueError(f"Could not encode processed image as {self.image_ext}")
+        rendered = RenderedImage(encoded.tobytes(), self.image_ext)
+        if cache_output:
+            self.outputs.put(output_key, rendered)
+        return rendered
+
+    def _load(self, source: RenderSource, max_dim: Optional[int],
+              decoded: Optional[np.ndarray]) -> Tuple[np.ndarray, float]:
+        """Decode (or reuse) the upload at the size to draw on; returns it with its scale."""
+        if decoded is not None:
+            image = decoded
+        else:
+            flags = cv2.IMREAD_COLOR
+            if source.image_shape is not None:
+                target_scale = preview_scale(source.image_shape, max_dim)
+                for factor, reduced_flags in REDUCED_DECODE:
+                    if target_scale <= 1 / factor:
+                        flags = reduced_flags
+                        break
+            with stage("decode"):
+                image = cv2.imdecode(np.frombuffer(source.image, np.uint8), flags)
+            if image is None:
+                raise ValueError("Invalid image data")
+
+        full_shape = source.image_shape or image.shape[:2]
+        scale = preview_scale(full_shape, max_dim)
+        if scale < 1.0:
+            size = (max(1, round(full_shape[1] * scale)), max(1, round(full_shape[0] * scale)))
+            if (image.shape[1], image.shape[0]) != size:
+                image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return image, scale
+
+    def stats(self) -> Dict:
+        return {"sources": self.sources.stats(), "outputs": self.outputs.stats()}
+
+
+def _draw(image: np.ndarray, detections: List[Dict], scale: float) -> None:
+    registry.get_predictor().draw_detections(image, detections, scale)
+
+
+annotation_renderer = AnnotationRenderer(
+    _draw, RENDER_SOURCE_MEMORY_BYTES, RENDER_OUTPUT_MEMORY_BYTES, PROCESSED_IMAGE_FORMAT, PROCESSED_IMAGE_QUALITY
+)
@@ -0,0 +1,78 @@
+from typing import Callable, Tuple
+
+import cv2
+import numpy as np
+
+# Region-of-interest masks are computed at this size (longest side); plenty to place 640px tiles
+ROI_MAX_DIM = 512
+# 2G - R - B above this counts as vegetation; yellowed and browning leaves still clear it
+EXCESS_GREEN_THRESHOLD = 20
+
+
+def downscale(image: np.ndarray, max_dim: int = ROI_MAX_DIM,
+              interpolation: int = cv2.INTER_AREA) -> Tuple[np.ndarray, float]:
+    """The image shrunk to at most max_dim on its longest side, with the scale applied."""
+    height, width = image.shape[:2]
+    scale = min(1.0, max_dim / max(height, width))
+    if scale == 1.0:
+        return image, scale
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=interpolation), scale
+
+
+def vegetation_mask(image: np.ndarray, max_dim: int = ROI_MAX_DIM) -> Tuple[np.ndarray, float]:
+    """Low-resolution mask of plant-coloured pixels (excess green index), and its scale.
+
+    Cauliflower curds are white, but always sit inside their leaves, so the margin added
+    by select_tiles brings them in; sky, soil and stall backgrounds stay out.
+    """
+    # Bilinear sampling is ~40x faster than area averaging on large photos and plenty for a colour mask
+    small, scale = downscale(image, max_dim, cv2.INTER_LINEAR)
+    b, g, r = cv2.split(small.astype(np.int16))
+    return ((2 * g - r - b) > EXCESS_GREEN_THRESHOLD).astype(np.uint8), scale
+
+
+def coarse_mask(image: np.ndarray, tile_size: int, tile_runner: Callable, conf_threshold: float,
+                max_dim: int = ROI_MAX_DIM) -> Tuple[np.ndarray, float]:
+    """Low-resolution mask of boxes from one model pass over the whole image shrunk to a single tile.
+
+    Small lesions can vanish at that scale; the mask finds the plants, and full-resolution
+    tiles over them find the lesions.
+    """
+    height, width = image.shape[:2]
+    resized, fit = downscale(image, tile_size)
+    tile = np.full((tile_size, tile_size, 3), 114, dtype=np.uint8)
+    tile[:resized.shape[0], :resized.shape[1]] = resized
+    boxes, _, _ = tile_runner([tile], conf_threshold)[0]
+
+    scale = min(1.0, max_dim / max(height, width))
+    mask = np.zeros((max(1, round(height * scale)), max(1, round(width * scale))), np.uint8)
+    for x1, y1, x2, y2 in np.round(np.asarray(boxes, np.float32).reshape(-1, 4) * (scale / fit)).astype(int):
+        mask[max(0, y1):max(0, y2) + 1, max(0, x1):max(0, x2) + 1] = 1
+    return mask, scale
+
+
+def select_tiles(positions: np.ndarray, mask: np.ndarray, scale: float, margin: float = 0.0,
+                 min_coverage: float = 0.0) -> np.ndarray:
+    """Which tiles (x1, y1, x2, y2 in full-resolution pixels) cover enough of the mask.
+
+    The mask is first grown by margin full-resolution pixels. A tile is kept if any masked
+    pixel falls inside it and masked pixels make up at least min_coverage of its area.
+    """
+    if len(positions) == 0:
+        return np.zeros(0, bool)
+    radius = int(round(margin * scale))
+    if radius > 0:
+        mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_RECT, (2 * radius + 1, 2 * radius + 1)))
+
+    # Summed-area table: masked pixels in any rectangle in four lookups
+    integral = cv2.integral(mask)
+    height, width = mask.shape
+    scaled = np.round(np.asarray(positions, np.float64) * scale).astype(int)
+    x1 = np.clip(scaled[:, 0], 0, width - 1)
+    y1 = np.clip(scaled[:, 1], 0, height - 1)
+    x2 = np.clip(np.maximum(scaled[:, 2], x1 + 1), 1, width)
+    y2 = np.clip(np.maximum(scaled[:, 3], y1 + 1), 1, height)
+    covered = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+    area = (x2 - x1) * (y2 - y1)
+    return (covered > 0) & (covered >= min_coverage * area)
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one in-flight computation.
+
+    The first caller for a key starts the work; callers arriving while it is still
+    running await the same result (or exception) instead of starting their own. The key
+    is forgotten as soon as the work finishes, so this never serves stale results; see
+    app.services.cache for that. Used only from the event loop, so no locking is needed.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        result, _ = await self.join(key, fn)
+        return result
+
+    async def join(self, key: str, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Like do(), also telling whether this caller waited on another caller's work.
+
+        The work runs in the first caller's context, so only that caller's request sees
+        its telemetry.
+        """
+        future = self._inflight.get(key)
+        coalesced = future is not None
+        if future is None:
+            self.started += 1
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller disconnecting does not cancel the work the others wait on
+        return await asyncio.shield(future), coalesced
+
+    def _finished(self, key: str, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._inflight),
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
+
+
+detection_flights = SingleFlight()
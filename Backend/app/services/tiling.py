@@ -0,0 +1,142 @@
+import math
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.config import TILING_MAX_TILES, TILING_MIN_SCALE
+from app.services.telemetry import stage
+from app.utils.image_info import ImageInfo
+
+# cv2.imdecode flags that decode a JPEG at 1/2, 1/4 or 1/8 scale, much faster than full size
+REDUCED_DECODE = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+@dataclass
+class TilingPlan:
+    """The resolution an image is detected at and the tile layout over it.
+
+    Boxes are found at working_shape and reported in original_shape coordinates.
+    """
+    original_shape: Tuple[int, int]  # (height, width) as displayed, after EXIF orientation
+    working_shape: Tuple[int, int]
+    tile_size: int
+    overlap: float
+    tiles: int  # grid tiles at working_shape, before adaptive tiling skips any
+    tile_budget: Optional[int] = None  # None: unlimited
+    decode_factor: int = 1  # JPEG decoded at 1/decode_factor scale before the final resize
+    orientation: int = 1
+
+    @property
+    def scale(self) -> float:
+        return self.working_shape[1] / self.original_shape[1]
+
+    @property
+    def full_resolution(self) -> bool:
+        return self.working_shape == self.original_shape
+
+    def as_dict(self) -> Dict:
+        return {**asdict(self), "scale": round(self.scale, 4)}
+
+
+def axis_tiles(length: int, tile_size: int, overlap: float) -> int:
+    """Tiles along one axis; matches TiledPredictor.tile_grid."""
+    stride = max(1, int(tile_size * (1 - overlap)))
+    return 1 if length <= tile_size else math.ceil((length - tile_size) / stride) + 1
+
+
+def grid_tiles(height: int, width: int, tile_size: int, overlap: float) -> int:
+    return axis_tiles(height, tile_size, overlap) * axis_tiles(width, tile_size, overlap)
+
+
+class TilingPolicy:
+    """Chooses the working resolution for an image from its size and a tile budget.
+
+    The tile count grows with image area, so a large frame is scaled down until its grid
+    fits the budget, but never below min_scale of its original size (beyond that objects
+    get too small to detect; the plan then simply exceeds the budget). The budget is the
+    smaller of max_tiles and what a latency budget allows at the measured model time per tile.
+    """
+
+    def __init__(self, max_tiles: int = 0, min_scale: float = 0.25):
+        self.max_tiles = max_tiles  # 0: unlimited
+        self.min_scale = min_scale
+
+    def tile_budget(self, max_tiles: Optional[int] = None, latency_budget_ms: Optional[float] = None,
+                    seconds_per_tile: Optional[float] = None) -> Optional[int]:
+        budgets = []
+        if max_tiles or self.max_tiles:
+            budgets.append(max_tiles or self.max_tiles)
+        if latency_budget_ms and seconds_per_tile:
+            budgets.append(max(1, int(latency_budget_ms / 1000 / seconds_per_tile)))
+        return min(budgets) if budgets else None
+
+    def plan_for(self, info: ImageInfo, params, seconds_per_tile: Optional[float] = None) -> TilingPlan:
+        """plan() with the tile size, overlap and budgets of a request's DetectionParams."""
+        budget = self.tile_budget(params.max_tiles, params.latency_budget_ms, seconds_per_tile)
+        return self.plan(info, params.tile_size, params.overlap, budget)
+
+    def plan(self, info: ImageInfo, tile_size: int, overlap: float, budget: Optional[int] = None) -> TilingPlan:
+        height, width = info.shape
+        tiles = grid_tiles(height, width, tile_size, overlap)
+        scale = 1.0
+        if budget is not None and tiles > budget:
+            # Largest scale whose grid fits; the tile count only falls as the scale does
+            low, high = self.min_scale, 1.0
+            for _ in range(20):
+                middle = (low + high) / 2
+                if grid_tiles(round(height * middle), round(width * middle), tile_size, overlap) <= budget:
+                    low = middle
+                else:
+                    high = middle
+            scale = low
+        working_shape = (max(1, round(height * scale)), max(1, round(width * scale)))
+        if scale == 1.0:
+            working_shape = (height, width)
+
+        # Decode JPEGs at the largest reduced scale that is still at least the working size
+        decode_factor = 1
+        if info.format == 'jpeg':
+            for factor, _ in REDUCED_DECODE:
+                if scale <= 1 / factor:
+                    decode_factor = factor
+                    break
+        return TilingPlan(
+            (height, width), working_shape, tile_size, overlap,
+            grid_tiles(*working_shape, tile_size, overlap), budget, decode_factor, info.orientation
+        )
+
+    def decode(self, image_bytes: bytes, plan: TilingPlan) -> np.ndarray:
+        """Decode the image at the plan's working resolution, EXIF orientation applied."""
+        flags = dict(REDUCED_DECODE).get(plan.decode_factor, cv2.IMREAD_COLOR)
+        with stage("decode"):
+            image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flags)
+        if image is None:
+            raise ValueError("Invalid image data")
+        return self.fit(image, plan)
+
+    def fit(self, image: np.ndarray, plan: TilingPlan) -> np.ndarray:
+        """Resize a decoded image to the plan's working resolution."""
+        height, width = plan.working_shape
+        if image.shape[:2] == (height, width):
+            return image
+        # Bilinear is ~4x faster than area averaging and alias-free down to half size,
+        # which is all that is left after a reduced-scale JPEG decode
+        ratio = width / image.shape[1]
+        interpolation = cv2.INTER_LINEAR if ratio >= 0.5 else cv2.INTER_AREA
+        with stage("resize"):
+            return cv2.resize(image, (width, height), interpolation=interpolation)
+
+
+def to_original(raw, plan: TilingPlan):
+    """RawPredictions found at the working resolution, with boxes mapped back to original coordinates."""
+    if plan.full_resolution:
+        return raw
+    boxes = raw.boxes.astype(np.float32, copy=True)
+    boxes[:, [0, 2]] *= plan.original_shape[1] / plan.working_shape[1]
+    boxes[:, [1, 3]] *= plan.original_shape[0] / plan.working_shape[0]
+    return replace(raw, boxes=boxes, image_shape=plan.original_shape, working_shape=plan.working_shape)
+
+
+tiling_policy = TilingPolicy(TILING_MAX_TILES, TILING_MIN_SCALE)
@@ -0,0 +1,290 @@
+import logging
+import math
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.config import (
+    TIMESERIES_DIR, TIMESERIES_HOUR_CAPACITY, TIMESERIES_MINUTE_CAPACITY, TIMESERIES_RAW_CAPACITY
+)
+
+logger = logging.getLogger(__name__)
+
+RAW_DTYPE = np.dtype([('t', 'f8'), ('value', 'f8')])
+ROLLUP_DTYPE = np.dtype([('t', 'f8'), ('min', 'f8'), ('max', 'f8'), ('sum', 'f8'), ('count', 'i8')])
+
+
+class Level(NamedTuple):
+    name: str
+    width: float  # bucket width in seconds; 0 for raw readings
+
+
+RAW = Level('raw', 0)
+MINUTE = Level('1m', 60)
+HOUR = Level('1h', 3600)
+LEVELS = (RAW, MINUTE, HOUR)
+
+
+class Buckets(NamedTuple):
+    """Columns of a series window: bucket start (or reading) times and the statistics per bucket."""
+    t: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+    sum: np.ndarray
+    count: np.ndarray
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.sum / np.maximum(self.count, 1)
+
+    @classmethod
+    def of(cls, level: Level, rows: np.ndarray) -> "Buckets":
+        if level.width == 0:
+            return cls(rows['t'], rows['value'], rows['value'], rows['value'], np.ones(len(rows), np.int64))
+        return cls(rows['t'], rows['min'], rows['max'], rows['sum'], rows['count'])
+
+    def reduce(self, step: float) -> "Buckets":
+        """Merge into buckets step seconds wide, aligned to multiples of step since the epoch."""
+        if len(self.t) == 0:
+            return self
+        bucket = np.floor(self.t / step)
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        return Buckets(
+            bucket[starts] * step,
+            np.minimum.reduceat(self.min, starts),
+            np.maximum.reduceat(self.max, starts),
+            np.add.reduceat(self.sum, starts),
+            np.add.reduceat(self.count, starts)
+        )
+
+
+class RingSeries:
+    """Fixed-capacity series of time-ordered rows in a numpy ring buffer.
+
+    Once full, each append overwrites the oldest rows. Rows stay in time order around the
+    ring, so a time window is two binary searches over at most two contiguous segments.
+    With a path the buffer is a memory-mapped .npy file; its head and size are recovered
+    from the data itself (unused slots have t = NaN), so there is no state to get out of sync.
+    """
+
+    def __init__(self, dtype: np.dtype, capacity: int, path: Optional[str] = None):
+        self.capacity = capacity
+        self.path = path
+        self.data = self._open(dtype, capacity, path)
+        t = self.data['t']
+        self.size = int(np.count_nonzero(~np.isnan(t)))
+        self.head = self.size % capacity
+        if self.size == capacity:
+            # The write position is just after the one place where time goes backwards
+            drops = np.flatnonzero(np.roll(t, -1) < t)
+            self.head = int(drops[0] + 1) % capacity if len(drops) else 0
+
+    @staticmethod
+    def _open(dtype: np.dtype, capacity: int, path: Optional[str]) -> np.ndarray:
+        if path is None:
+            data = np.empty(capacity, dtype)
+            data['t'] = np.nan
+            return data
+        existing = None
+        if os.path.exists(path):
+            existing = np.load(path, mmap_mode='r+')
+            if existing.dtype == dtype and existing.shape == (capacity,):
+                return existing
+            logger.warning("Resizing %s from %d to %d rows", path, len(existing), capacity)
+        tmp_path = f"{path}.tmp.npy"
+        data = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(capacity,))
+        data['t'] = np.nan
+        if existing is not None and existing.dtype == dtype:
+            # Keep the newest rows that fit, in time order from the start of the new buffer
+            rows = existing[~np.isnan(existing['t'])]
+            rows = rows[np.argsort(rows['t'], kind='stable')][-capacity:]
+            data[:len(rows)] = rows
+        data.flush()
+        del existing
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode='r+')
+
+    def _segments(self) -> List[np.ndarray]:
+        """The stored rows as contiguous views, oldest first."""
+        if self.size < self.capacity:
+            return [self.data[:self.size]]
+        return [self.data[self.head:], self.data[:self.head]]
+
+    def last(self) -> Optional[np.void]:
+        return self.data[(self.head - 1) % self.capacity] if self.size else None
+
+    def holds(self, start: float) -> bool:
+        """Whether every row from start on is still stored (nothing newer has been overwritten)."""
+        return self.size < self.capacity or self._segments()[0]['t'][0] <= start
+
+    def append(self, rows: np.ndarray) -> None:
+        rows = rows[-self.capacity:]
+        first = min(len(rows), self.capacity - self.head)
+        self.data[self.head:self.head + first] = rows[:first]
+        self.data[:len(rows) - first] = rows[first:]
+        self.head = (self.head + len(rows)) % self.capacity
+        self.size = min(self.capacity, self.size + len(rows))
+
+    def window(self, start: float, end: float) -> np.ndarray:
+        """Copy of the rows with start <= t < end, oldest first."""
+        parts = []
+        for segment in self._segments():
+            t = segment['t']
+            parts.append(segment[np.searchsorted(t, start, 'left'):np.searchsorted(t, end, 'left')])
+        return np.concatenate(parts)
+
+    def flush(self) -> None:
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+
+
+class MetricSeries:
+    """Readings of one metric, with per-minute and per-hour rollups.
+
+    Rollups are kept up to date on ingest, so they keep months of history after the raw
+    ring has wrapped. Readings must arrive in time order per metric; ones older than the
+    newest stored reading are dropped.
+    """
+
+    def __init__(self, name: str, capacities: Dict[str, int], directory: Optional[str] = None):
+        self.name = name
+        self.lock = threading.Lock()
+        self.series = {
+            level.name: RingSeries(
+                RAW_DTYPE if level.width == 0 else ROLLUP_DTYPE,
+                capacities[level.name],
+                os.path.join(directory, f"{name}.{level.name}.npy") if directory else None
+            )
+            for level in LEVELS
+        }
+
+    def ingest(self, t: np.ndarray, values: np.ndarray) -> int:
+        """Store readings (any order within the call); returns how many were accepted."""
+        order = np.argsort(t, kind='stable')
+        t, values = t[order], values[order]
+        keep = np.isfinite(t) & np.isfinite(values)
+        with self.lock:
+            raw = self.series[RAW.name]
+            last = raw.last()
+            if last is not None:
+                keep &= t >= last['t']
+            t, values = t[keep], values[keep]
+            if len(t) == 0:
+                return 0
+            rows = np.empty(len(t), RAW_DTYPE)
+            rows['t'], rows['value'] = t, values
+            raw.append(rows)
+            for level in LEVELS[1:]:
+                self._roll_up(level, Buckets.of(RAW, rows).reduce(level.width))
+        return len(t)
+
+    def _roll_up(self, level: Level, buckets: Buckets) -> None:
+        series = self.series[level.name]
+        rows = np.empty(len(buckets.t), ROLLUP_DTYPE)
+        rows['t'], rows['min'], rows['max'], rows['sum'], rows['count'] = buckets
+        last = series.last()
+        if last is not None and last['t'] == rows['t'][0]:
+            # The first bucket continues the one still open in the ring: merge it in place
+            index = (series.head - 1) % series.capacity
+            current = series.data[index]
+            series.data[index] = (
+                current['t'], min(current['min'], rows['min'][0]), max(current['max'], rows['max'][0]),
+                current['sum'] + rows['sum'][0], current['count'] + rows['count'][0]
+            )
+            rows = rows[1:]
+        series.append(rows)
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        with self.lock:
+            last = self.series[RAW.name].last()
+        return None if last is None else (float(last['t']), float(last['value']))
+
+    def buckets(self, level: Level, start: float, end: float) -> Buckets:
+        if level.width:
+            # Include the bucket start falls in
+            start = math.floor(start / level.width) * level.width
+        with self.lock:
+            return Buckets.of(level, self.series[level.name].window(start, end))
+
+    def query(self, start: float, end: float, step: Optional[float] = None,
+              max_points: int = 2000) -> Tuple[str, Buckets]:
+        """Statistics over [start, end) in buckets step seconds wide, and the resolution used.
+
+        step=None returns the finest stored level with at most max_points rows in the window
+        (raw readings, then minute and hour rollups), reducing hours further if needed.
+        With a step, the coarsest level at least that fine is reduced to it; if that level has
+        already wrapped past start, the finest coarser level still holding start is used at its
+        own width (or hours, trimmed to the oldest one kept). Rollup buckets are included
+        whole, so window edges are exact to the level's width.
+        """
+        if step is not None:
+            level = [level for level in LEVELS if level.width <= step][-1]
+            if not self.series[level.name].holds(start):
+                level = next(
+                    (level for level in LEVELS if level.width > step and self.series[level.name].holds(start)), HOUR
+                )
+                step = max(step, level.width)
+            return f"{step:g}s", self.buckets(level, start, end).reduce(step)
+        for level in LEVELS[:-1]:
+            # Raw readings and minutes wrap first; only use them while they reach back to start
+            if self.series[level.name].holds(start):
+                buckets = self.buckets(level, start, end)
+                if len(buckets.t) <= max_points:
+                    return level.name, buckets
+        buckets = self.buckets(HOUR, start, end)
+        if len(buckets.t) <= max_points:
+            return HOUR.name, buckets
+        # Even hourly buckets are too many: widen them to fit
+        step = math.ceil((end - start) / max_points / HOUR.width) * HOUR.width
+        return f"{step:g}s", buckets.reduce(step)
+
+    def aggregate(self, start: float, end: float) -> Buckets:
+        """min / max / sum / count over [start, end), as one bucket, from the finest level holding start."""
+        level = next((level for level in LEVELS if self.series[level.name].holds(start)), HOUR)
+        buckets = self.buckets(level, start, end)
+        empty = len(buckets.t) == 0
+        return Buckets(
+            np.array([start]),
+            np.array([np.nan if empty else buckets.min.min()]),
+            np.array([np.nan if empty else buckets.max.max()]),
+            np.array([buckets.sum.sum()]),
+            np.array([buckets.count.sum()])
+        )
+
+    def flush(self) -> None:
+        with self.lock:
+            for series in self.series.values():
+                series.flush()
+
+
+class TimeSeriesStore:
+    """MetricSeries by name, created on first use; memory-mapped under directory when one is given."""
+
+    def __init__(self, capacities: Dict[str, int], directory: Optional[str] = None):
+        self.capacities = capacities
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._series: Dict[str, MetricSeries] = {}
+        self._lock = threading.Lock()
+
+    def series(self, name: str) -> MetricSeries:
+        series = self._series.get(name)
+        if series is None:
+            with self._lock:
+                series = self._series.get(name)
+                if series is None:
+                    series = self._series[name] = MetricSeries(name, self.capacities, self.directory)
+        return series
+
+    def flush(self) -> None:
+        for series in list(self._series.values()):
+            series.flush()
+
+
+metric_store = TimeSeriesStore(
+    {RAW.name: TIMESERIES_RAW_CAPACITY, MINUTE.name: TIMESERIES_MINUTE_CAPACITY, HOUR.name: TIMESERIES_HOUR_CAPACITY},
+    TIMESERIES_DIR or None
+)
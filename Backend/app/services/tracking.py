@@ -0,0 +1,135 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class Track:
+    """One object followed across frames, with the evidence gathered for its label."""
+    track_id: int
+    box: np.ndarray  # (x1, y1, x2, y2) at last_frame
+    first_frame: int
+    last_frame: int
+    velocity: np.ndarray = field(default_factory=lambda: np.zeros(4, np.float32))  # per frame
+    hits: int = 0
+    missed: int = 0  # consecutive updates without a match
+    confidences: List[float] = field(default_factory=list)
+    class_votes: Dict[str, float] = field(default_factory=lambda: defaultdict(float))  # summed confidence
+    labels: Dict[str, str] = field(default_factory=dict)  # original_class -> description
+    # original_class -> (frame, highest-confidence detection of that class)
+    best: Dict[str, Tuple[int, Dict]] = field(default_factory=dict)
+
+    def predicted_box(self, frame_index: int) -> np.ndarray:
+        return self.box + self.velocity * (frame_index - self.last_frame)
+
+    def add(self, frame_index: int, detection: Dict) -> None:
+        box = np.asarray(detection["bbox"], np.float32)
+        if self.hits:
+            gap = max(1, frame_index - self.last_frame)
+            # Smoothed constant-velocity motion, for a walking camera panning over the bed
+            self.velocity = 0.5 * self.velocity + 0.5 * (box - self.box) / gap
+        self.box = box
+        self.last_frame = frame_index
+        self.hits += 1
+        self.missed = 0
+        self.confidences.append(detection["confidence"])
+        self.class_votes[detection["original_class"]] += detection["confidence"]
+        self.labels[detection["original_class"]] = detection["class"]
+        best = self.best.get(detection["original_class"])
+        if best is None or detection["confidence"] > best[1]["confidence"]:
+            self.best[detection["original_class"]] = (frame_index, detection)
+
+    @property
+    def original_class(self) -> str:
+        # Per-frame labels flicker; the track takes the class with the most confidence behind it
+        return max(self.class_votes, key=self.class_votes.get)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (N, 4) and (M, 4) x1, y1, x2, y2 boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class IoUTracker:
+    """Greedy IoU tracker over detections from sampled frames.
+
+    Each update matches detections to the boxes live tracks are predicted to have at that
+    frame, highest IoU first; unmatched detections start tracks, and tracks unmatched for
+    more than max_missed updates end. Matching ignores class so a lesion whose label
+    flickers between frames stays one track.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_missed: int = 3):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.active: List[Track] = []
+        self.finished: List[Track] = []
+        self._next_id = 1
+
+    def update(self, frame_index: int, detections: List[Dict]) -> None:
+        matched_tracks, matched_detections = set(), set()
+        if self.active and detections:
+            predicted = np.stack([track.predicted_box(frame_index) for track in self.active])
+            boxes = np.asarray([detection["bbox"] for detection in detections], np.float32)
+            ious = iou_matrix(predicted, boxes)
+            for flat in np.argsort(ious, axis=None)[::-1]:
+                t, d = np.unravel_index(flat, ious.shape)
+                if ious[t, d] < self.iou_threshold:
+                    break
+                if t in matched_tracks or d in matched_detections:
+                    continue
+                self.active[t].add(frame_index, detections[d])
+                matched_tracks.add(t)
+                matched_detections.add(d)
+
+        still_active = []
+        for t, track in enumerate(self.active):
+            if t not in matched_tracks:
+                track.missed += 1
+            (self.finished if track.missed > self.max_missed else still_active).append(track)
+        self.active = still_active
+
+        for d, detection in enumerate(detections):
+            if d not in matched_detections:
+                track = Track(self._next_id, np.asarray(detection["bbox"], np.float32), frame_index, frame_index)
+                track.add(frame_index, detection)
+                self.active.append(track)
+                self._next_id += 1
+
+    def tracks(self) -> List[Track]:
+        return sorted(self.finished + self.active, key=lambda track: track.track_id)
+
+    def summaries(self, fps: Optional[float] = None, min_hits: int = 1) -> List[Dict]:
+        """One summary per track seen on at least min_hits sampled frames."""
+        summaries = []
+        for track in self.tracks():
+            if track.hits < min_hits:
+                continue
+            original_class = track.original_class
+            # Confidence, severity and box come from the voted class, not a stray other label
+            best_frame, best = track.best[original_class]
+            summaries.append({
+                "track_id": track.track_id,
+                "class": track.labels[original_class],
+                "original_class": original_class,
+                "confidence": best["confidence"],
+                "mean_confidence": float(np.mean(track.confidences)),
+                "severity": best["severity"],
+                "first_frame": track.first_frame,
+                "last_frame": track.last_frame,
+                "first_seen": track.first_frame / fps if fps else None,
+                "last_seen": track.last_frame / fps if fps else None,
+                "frames_detected": track.hits,
+                "best_frame": best_frame,
+                "bbox": best["bbox"]
+            })
+        return summaries
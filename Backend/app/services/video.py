@@ -0,0 +1,208 @@
+import contextvars
+import queue
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+import cv2
+import numpy as np
+
+from app.config import DYNAMIC_BATCHING_ENABLED, VIDEO_PREFETCH_FRAMES
+from app.services.registry import registry
+from app.services.telemetry import stage
+from app.services.tiling import tiling_policy, to_original
+from app.services.tracking import IoUTracker
+from app.utils.image_info import ImageInfo
+
+T = TypeVar("T")
+
+# (frame index in the source, decoded BGR frame)
+Frame = Tuple[int, np.ndarray]
+
+
+class VideoFrames:
+    """Every frame_stride-th frame of a video file, decoded; the frames between are skipped.
+
+    Skipped frames are only grabbed (demuxed and decoded by the codec, which inter-frame
+    compression requires) without the colour conversion and copy of a full read.
+    """
+
+    def __init__(self, path: str, frame_stride: int = 1, max_frames: Optional[int] = None):
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise ValueError("Invalid or unsupported video")
+        self.frame_stride = frame_stride
+        self.max_frames = max_frames
+        self.fps: Optional[float] = self.capture.get(cv2.CAP_PROP_FPS) or None
+        self.frames_read = 0
+
+    def __iter__(self) -> Iterator[Frame]:
+        while self.max_frames is None or self.frames_read < self.max_frames:
+            index = self.frames_read
+            if index % self.frame_stride:
+                if not self.capture.grab():
+                    break
+            else:
+                with stage("decode"):
+                    ok, frame = self.capture.read()
+                if not ok:
+                    break
+            self.frames_read += 1
+            if index % self.frame_stride == 0:
+                yield index, frame
+
+    def close(self) -> None:
+        self.capture.release()
+
+
+class ImageFrames:
+    """Every frame_stride-th image of a sequence of encoded frames (JPEG, PNG, ...), decoded.
+
+    reads returns each frame's bytes when called; skipped frames are never read.
+    """
+
+    def __init__(self, reads: List[Callable[[], bytes]], frame_stride: int = 1,
+                 max_frames: Optional[int] = None, fps: Optional[float] = None):
+        self.reads = reads[:max_frames] if max_frames else reads
+        self.frame_stride = frame_stride
+        self.fps = fps
+        self.frames_read = 0
+
+    def __iter__(self) -> Iterator[Frame]:
+        for index in range(0, len(self.reads), self.frame_stride):
+            with stage("decode"):
+                frame = cv2.imdecode(np.frombuffer(self.reads[index](), np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                raise ValueError(f"Invalid image data in frame {index}")
+            self.frames_read = min(len(self.reads), index + self.frame_stride)
+            yield index, frame
+
+    def close(self) -> None:
+        pass
+
+
+def prefetch(items: Iterable[T], depth: int) -> Iterator[T]:
+    """Iterate items on a background thread, keeping up to depth of them ready.
+
+    Decoding the next frames then overlaps inference on the current one, while the
+    bounded queue keeps memory flat however long the video. Errors from the producer
+    are raised here; stopping early stops the producer.
+    """
+    ready: queue.Queue = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+    end = object()
+    error: List[BaseException] = []
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as e:
+            error.append(e)
+        put(end)
+
+    # Decode stages count towards the request that started the video, like executor jobs
+    producer = threading.Thread(
+        target=contextvars.copy_context().run, args=(produce,), name="video-decode", daemon=True
+    )
+    producer.start()
+    try:
+        while (item := ready.get()) is not end:
+            yield item
+        if error:
+            raise error[0]
+    finally:
+        stopped.set()
+        producer.join()
+
+
+def track_video(frames, detect: Callable[[np.ndarray], List[Dict]], tracker: IoUTracker,
+                min_hits: int = 1, prefetch_frames: int = 4) -> Dict:
+    """Run detect on the sampled frames, pipelined with decoding, and track what it finds.
+
+    frames is a VideoFrames or ImageFrames. Returns per-track summaries (see
+    IoUTracker.summaries) with how many frames were read and processed. Only sampled
+    frames are detected on, so track frame numbers are multiples of the frame stride.
+    """
+    processed = 0
+    pipeline = prefetch(frames, prefetch_frames)
+    try:
+        for index, frame in pipeline:
+            detections = detect(frame)
+            with stage("track"):
+                tracker.update(index, detections)
+            processed += 1
+    finally:
+        pipeline.close()  # stops and joins the decode thread before the source is closed
+        frames.close()
+
+    tracks = tracker.summaries(frames.fps, min_hits)
+    disease_summary: Dict[str, int] = {}
+    for track in tracks:
+        disease_summary[track["class"]] = disease_summary.get(track["class"], 0) + 1
+    return {
+        "tracks": tracks,
+        "disease_summary": disease_summary,
+        "frames_total": frames.frames_read,
+        "frames_processed": processed,
+        "frame_stride": frames.frame_stride,
+        "fps": frames.fps,
+        "duration": frames.frames_read / frames.fps if frames.fps else None
+    }
+
+
+def frame_detector(params) -> Callable[[np.ndarray], List[Dict]]:
+    """Detections for one decoded frame, tiled and merged as /detect would for an image that size.
+
+    params is a VideoParams (or any DetectionParams).
+    """
+    predictor = registry.get_predictor()
+    # Frame tiles share model batches with concurrent image requests through the scheduler
+    tile_runner = registry.get_scheduler().infer_batch if DYNAMIC_BATCHING_ENABLED else None
+    plans = {}
+
+    def detect(frame: np.ndarray) -> List[Dict]:
+        shape = frame.shape[:2]
+        if shape not in plans:
+            seconds_per_tile = predictor.seconds_per_tile if params.latency_budget_ms else None
+            plans[shape] = tiling_policy.plan_for(ImageInfo(*shape, format='other'), params, seconds_per_tile)
+        plan = plans[shape]
+        raw = to_original(predictor.collect_predictions(
+            tiling_policy.fit(frame, plan), params.tile_size, params.overlap, params.conf_threshold,
+            tile_runner, params.tiling
+        ), plan)
+        return predictor.finalize(
+            raw,
+            conf_threshold=params.conf_threshold,
+            merge_strategy=params.merge_strategy,
+            iou_threshold=params.iou_threshold,
+            severity_high=params.severity_high,
+            severity_medium=params.severity_medium
+        )
+
+    return detect
+
+
+def run_video(frames, params) -> Dict:
+    """Detect and track diseases through a VideoFrames or ImageFrames with a VideoParams. Blocking."""
+    start_time = datetime.now()
+    summary = track_video(
+        frames, frame_detector(params), IoUTracker(params.track_iou, params.max_missed),
+        params.min_hits, VIDEO_PREFETCH_FRAMES
+    )
+    summary["processing_time"] = (datetime.now() - start_time).total_seconds()
+    return summary
+
+
+def run_video_file(path: str, params) -> Dict:
+    return run_video(VideoFrames(path, params.frame_stride, params.max_frames), params)
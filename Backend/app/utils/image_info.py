@@ -0,0 +1,78 @@
+import struct
+from typing import NamedTuple, Optional, Tuple
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG start-of-frame markers (baseline, progressive, ...); C4, C8 and CC are other segments
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_EXIF_ORIENTATION_TAG = 0x0112
+
+
+class ImageInfo(NamedTuple):
+    height: int  # as displayed, i.e. after EXIF orientation
+    width: int
+    format: str  # 'jpeg' or 'png'
+    orientation: int = 1  # EXIF orientation, 1 = as stored
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.height, self.width
+
+
+def image_info(data: bytes) -> Optional[ImageInfo]:
+    """Dimensions of a JPEG or PNG from its header, without decoding; None for other or corrupt data."""
+    try:
+        if data[:8] == PNG_SIGNATURE and data[12:16] == b'IHDR':
+            width, height = struct.unpack('>II', data[16:24])
+            return ImageInfo(height, width, 'png')
+        if data[:2] == b'\xff\xd8':
+            return _jpeg_info(data)
+    except (struct.error, IndexError):
+        pass
+    return None
+
+
+def _jpeg_info(data: bytes) -> Optional[ImageInfo]:
+    orientation = 1
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:  # fill byte
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # markers without a length
+            offset += 2
+            continue
+        if marker == 0xDA:  # start of scan: no frame header before the image data
+            return None
+        (length,) = struct.unpack('>H', data[offset + 2:offset + 4])
+        segment = data[offset + 4:offset + 2 + length]
+        if marker == 0xE1 and segment[:6] == b'Exif\x00\x00':
+            orientation = _exif_orientation(segment[6:]) or orientation
+        elif marker in _SOF_MARKERS:
+            height, width = struct.unpack('>HH', segment[1:5])
+            # Orientations 5-8 rotate by 90 degrees, which OpenCV applies when decoding
+            if orientation in (5, 6, 7, 8):
+                height, width = width, height
+            return ImageInfo(height, width, 'jpeg', orientation)
+        offset += 2 + length
+    return None
+
+
+def _exif_orientation(tiff: bytes) -> Optional[int]:
+    """The orientation tag from IFD0 of an EXIF (TIFF) block."""
+    if tiff[:2] == b'II':
+        endian = '<'
+    elif tiff[:2] == b'MM':
+        endian = '>'
+    else:
+        return None
+    (ifd_offset,) = struct.unpack(endian + 'I', tiff[4:8])
+    (count,) = struct.unpack(endian + 'H', tiff[ifd_offset:ifd_offset + 2])
+    for i in range(count):
+        entry = ifd_offset + 2 + 12 * i
+        tag, _, _, value = struct.unpack(endian + 'HHIH', tiff[entry:entry + 10])
+        if tag == _EXIF_ORIENTATION_TAG:
+            return value if 1 <= value <= 8 else None
+    return None
@@ -0,0 +1,166 @@
+import os
+import zipfile
+from typing import List, Tuple, Type, TypeVar
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import FormData
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from app.config import MAX_UPLOAD_BYTES
+
+CHUNK_SIZE = 1024 * 1024
+FormModel = TypeVar('FormModel', bound=BaseModel)
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+ARCHIVE_CONTENT_TYPES = {'application/zip', 'application/x-zip-compressed'}
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload exceeds the {max_bytes} byte limit")
+
+
+async def read_request_body(request: Request, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Stream a raw request body into memory, rejecting it once it passes max_bytes."""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise _too_large(max_bytes)
+
+    buffer = bytearray()
+    async for chunk in request.stream():
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise _too_large(max_bytes)
+    if not buffer:
+        raise HTTPException(status_code=400, detail="Empty request body")
+    return bytes(buffer)
+
+
+async def read_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Read a multipart file upload in chunks, rejecting it once it passes max_bytes."""
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    buffer = bytearray()
+    while chunk := await file.read(CHUNK_SIZE):
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise _too_large(max_bytes)
+    if not buffer:
+        raise HTTPException(status_code=400, detail="Empty file upload")
+    return bytes(buffer)
+
+
+class DiskMultiPartParser(MultiPartParser):
+    """MultiPartParser that spools every file part to disk.
+
+    Starlette keeps file parts of up to 1 MiB in memory, which adds up to gigabytes for a
+    form with a thousand photos. A max_size of 0 would never roll over, hence 1 byte.
+    """
+    max_file_size = 1
+
+
+class FilePartTooLarge(MultiPartException):
+    pass
+
+
+class CappedMultiPartParser(MultiPartParser):
+    """MultiPartParser that rejects the body as soon as a file part passes max_file_bytes.
+
+    Starlette would otherwise spool a file part of any size before the route sees it.
+    """
+
+    def __init__(self, *args, max_file_bytes: int = MAX_UPLOAD_BYTES, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_file_bytes = max_file_bytes
+        self._part_bytes = 0
+
+    def on_headers_finished(self) -> None:
+        super().on_headers_finished()
+        self._part_bytes = 0
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._current_part.file is not None:
+            self._part_bytes += end - start
+            if self._part_bytes > self.max_file_bytes:
+                raise FilePartTooLarge(f"Upload exceeds the {self.max_file_bytes} byte limit")
+        super().on_part_data(data, start, end)
+
+
+async def _parse_form(parser: MultiPartParser) -> FormData:
+    try:
+        return await parser.parse()
+    except FilePartTooLarge as e:
+        raise HTTPException(status_code=413, detail=e.message)
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+
+
+def _is_multipart(request: Request) -> bool:
+    return request.headers.get("content-type", "").lower().startswith("multipart/form-data")
+
+
+async def read_form_to_disk(request: Request, max_files: int) -> FormData:
+    """Parse a multipart/form-data body with every file part in a temporary file.
+
+    The whole body is received before this returns. Other content types give an empty form.
+    """
+    if not _is_multipart(request):
+        return FormData()
+    return await _parse_form(DiskMultiPartParser(request.headers, request.stream(), max_files=max_files))
+
+
+async def read_form(request: Request, max_files: int = 1, max_bytes: int = MAX_UPLOAD_BYTES) -> FormData:
+    """Parse a multipart/form-data body, rejecting it while it is received once a file part
+    passes max_bytes. Other content types give an empty form."""
+    if not _is_multipart(request):
+        return FormData()
+    parser = CappedMultiPartParser(request.headers, request.stream(), max_files=max_files, max_file_bytes=max_bytes)
+    return await _parse_form(parser)
+
+
+async def read_form_model(request: Request, model: Type[FormModel]) -> Tuple[FormModel, FormData]:
+    """A single-upload form (see read_form) validated as model, like a Form() parameter.
+
+    Returns the form too; the caller must close it.
+    """
+    form = await read_form(request)
+    try:
+        return model.model_validate(dict(form)), form
+    except ValidationError as e:
+        await form.close()
+        raise RequestValidationError([{**error, 'loc': ('body', *error['loc'])} for error in e.errors(include_url=False)])
+
+
+def form_schema(model: Type[BaseModel]) -> dict:
+    """openapi_extra documenting a route whose multipart body is read with read_form_model."""
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": model.model_json_schema()}}}}
+
+
+def is_archive(file: UploadFile) -> bool:
+    return (file.filename or "").lower().endswith(".zip") or file.content_type in ARCHIVE_CONTENT_TYPES
+
+
+def archive_images(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """Image members of a zip archive, in archive order (directories and macOS metadata skipped)."""
+    return [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and not info.filename.startswith("__MACOSX/")
+        and not os.path.basename(info.filename).startswith(".")
+        and os.path.splitext(info.filename)[1].lower() in IMAGE_EXTENSIONS
+    ]
+
+
+def read_archive_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Extract one archive member, rejecting it once it passes max_bytes. Blocking."""
+    if info.file_size > max_bytes:
+        raise _too_large(max_bytes)
+    # The declared size can lie, so bound the read itself too
+    with archive.open(info) as member:
+        data = member.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise _too_large(max_bytes)
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty file upload")
+    return data
@@ -0,0 +1,245 @@
+"""Benchmarks for the tiled detection pipeline.
+
+Runs synthetic images of a few sizes through the detection stages (decode, tile, infer,
+merge, annotate, encode, save) and through the whole /api/detect route via the ASGI test
+client. Reports p50/p95 latency, throughput and peak memory. By default the model is a
+stub that returns random boxes, so no weights or GPU are needed. Pass --model to time
+real weights instead.
+
+Run from the Backend directory:
+
+    python -m benchmarks.pipeline --save-baseline benchmarks/baseline.json
+    python -m benchmarks.pipeline --baseline benchmarks/baseline.json
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+CLASS_NAMES = {0: 'Cf_blk_rot', 1: 'Cf_healthy_l', 2: 'Cf_healthy_v', 3: 'Cf_r_spot', 4: 'Cf_s_rot'}
+STAGES = ('b64decode', 'decode', 'resize', 'roi', 'tile', 'infer', 'merge', 'annotate', 'encode', 'save')
+
+
+class StubBackend:
+    """Stands in for the model: deterministic random boxes per tile, optional fixed latency."""
+
+    name = "stub"
+
+    def __init__(self, boxes_per_tile: int = 8, latency_ms: float = 0.0, names: Optional[Dict[int, str]] = None):
+        self.boxes_per_tile = boxes_per_tile
+        self.latency = latency_ms / 1000.0
+        self.names = names or CLASS_NAMES
+
+    def infer(self, tiles: List[np.ndarray], conf_threshold: float):
+        results = []
+        for tile in tiles:
+            height, width = tile.shape[:2]
+            # Seeded from the tile so repeated runs see the same boxes
+            rng = np.random.default_rng(int(tile[::97, ::97].sum()))
+            n = self.boxes_per_tile
+            corner = rng.uniform(0, 1, (n, 2)) * [width * 0.8, height * 0.8]
+            size = rng.uniform(0.05, 0.3, (n, 2)) * [width, height]
+            boxes = np.concatenate([corner, np.minimum(corner + size, [width, height])], axis=1).astype(np.float32)
+            scores = rng.uniform(0.05, 1.0, n).astype(np.float32)
+            classes = rng.integers(0, len(self.names), n).astype(np.float32)
+            keep = scores > conf_threshold
+            results.append((boxes[keep], scores[keep], classes[keep]))
+        if self.latency:
+            time.sleep(self.latency * len(tiles))
+        return results
+
+
+def synthetic_image(megapixels: float, seed: int = 0) -> np.ndarray:
+    """A 4:3 BGR image with smooth foliage-like colour variation plus sensor-like noise."""
+    width = int(round(math.sqrt(megapixels * 1e6 * 4 / 3)))
+    height = int(round(width * 3 / 4))
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (max(2, height // 48), max(2, width // 48), 3), dtype=np.uint8)
+    coarse[..., 1] = np.maximum(coarse[..., 1], 96)  # mostly green
+    image = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.integers(0, 24, image.shape, dtype=np.uint8)
+    return cv2.add(image, noise)
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def peak_memory(fn: Callable[[], object]) -> int:
+    """Peak bytes allocated through Python/NumPy while running fn (one extra, untimed run)."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int) -> Dict:
+    from app.services.telemetry import start_breakdown
+
+    for _ in range(warmup):
+        fn()
+    latencies, stages = [], {name: [] for name in STAGES}
+    for _ in range(repeat):
+        breakdown = start_breakdown()
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+        for name in STAGES:
+            stages[name].append(breakdown.get(name, 0.0))
+    return {
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "mean": float(np.mean(latencies)),
+        "throughput": repeat / sum(latencies),
+        "stages_p50": {name: percentile(values, 50) for name, values in stages.items()},
+        "peak_bytes": peak_memory(fn)
+    }
+
+
+def run_benchmarks(args) -> Dict:
+    # The app reads its config on import, so it is only imported once main() has set it up
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.routes import detection, telemetry
+    from app.schemas.detection import DetectionParams
+    from app.services.image_store import ImageStore
+    from app.services.predict import TiledPredictor
+    from app.services.registry import registry
+
+    if args.model:
+        registry.load(args.model, warmup=True)
+        registry.default_model_path = args.model
+        if registry.error:
+            raise SystemExit(f"Could not load {args.model}: {registry.error}")
+    else:
+        backend = StubBackend(args.boxes_per_tile, args.stub_latency_ms)
+        registry.register_predictor(TiledPredictor(registry.default_model_path, backend=backend))
+
+    # Keep benchmark images out of the real store; cleared before each run so images are redrawn
+    store = ImageStore(tempfile.mkdtemp(prefix="bench_images_"), "/static/processed_images", 2 ** 40, 3600)
+    detection.image_store = store
+
+    app = FastAPI()
+    app.middleware("http")(telemetry.timing_middleware)
+    app.include_router(detection.router, prefix="/api")
+    client = TestClient(app)
+    params = DetectionParams(
+        tile_size=args.tile_size, overlap=args.overlap, tiling=args.tiling, max_tiles=args.max_tiles
+    )
+
+    results = {}
+    for megapixels in args.sizes:
+        image_bytes = cv2.imencode('.jpg', synthetic_image(megapixels), [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+        file_name = f"bench_{megapixels:g}mp.jpg"
+        payload = {
+            "file_name": file_name,
+            "file_content": base64.b64encode(image_bytes).decode(),
+            "tile_size": args.tile_size,
+            "overlap": args.overlap,
+            "tiling": args.tiling,
+            "max_tiles": args.max_tiles
+        }
+
+        def pipeline():
+            store.clear()
+            detection.run_detection(image_bytes, params, use_cache=False, batched=not args.unbatched)
+
+        def route():
+            store.clear()
+            response = client.post("/api/detect", json=payload)
+            if not response.json().get("success"):
+                raise RuntimeError(response.json().get("message"))
+
+        for mode, fn in (("pipeline", pipeline), ("route", route)):
+            result = measure(fn, args.repeat, args.warmup)
+            result["megapixels_per_s"] = result["throughput"] * megapixels
+            results[f"{mode}/{megapixels:g}MP"] = result
+            print_result(f"{mode}/{megapixels:g}MP", result)
+    return results
+
+
+def print_result(name: str, result: Dict) -> None:
+    stages = " ".join(f"{stage}={seconds * 1000:.1f}" for stage, seconds in result["stages_p50"].items() if seconds)
+    print(f"{name:<16} p50 {result['p50'] * 1000:9.1f} ms  p95 {result['p95'] * 1000:9.1f} ms  "
+          f"{result['throughput']:7.2f} img/s  {result['megapixels_per_s']:7.1f} MP/s  "
+          f"peak {result['peak_bytes'] / 2 ** 20:8.1f} MiB")
+    print(f"{'':<16} stages p50 (ms): {stages}")
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> bool:
+    """Print p50/p95 changes against the baseline; True if any case regressed beyond threshold."""
+    regressed = False
+    print(f"\nAgainst baseline (regression threshold {threshold:.0%}):")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"  {name:<16} no baseline")
+            continue
+        changes = {metric: result[metric] / base[metric] - 1 for metric in ("p50", "p95", "peak_bytes") if base[metric]}
+        flag = ""
+        if changes.get("p50", 0) > threshold:
+            regressed = True
+            flag = "  REGRESSION"
+        print(f"  {name:<16} " + "  ".join(f"{metric} {change:+.1%}" for metric, change in changes.items()) + flag)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 12, 48], help='image sizes in megapixels')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--tile-size', type=int, default=640)
+    parser.add_argument('--overlap', type=float, default=0.2)
+    parser.add_argument('--tiling', choices=['exhaustive', 'vegetation', 'coarse'], default='exhaustive')
+    parser.add_argument('--max-tiles', type=int, help='tile budget per image (default: TILING_MAX_TILES)')
+    parser.add_argument('--model', help='real .pt/.onnx weights instead of the stub model')
+    parser.add_argument('--boxes-per-tile', type=int, default=8, help='stub model: boxes returned per tile')
+    parser.add_argument('--stub-latency-ms', type=float, default=0.0, help='stub model: simulated time per tile')
+    parser.add_argument('--unbatched', action='store_true', help='bypass the cross-request batch scheduler')
+    parser.add_argument('--baseline', help='compare against results saved with --save-baseline')
+    parser.add_argument('--threshold', type=float, default=0.10, help='p50 slowdown counted as a regression')
+    parser.add_argument('--save-baseline', help='write these results as a baseline JSON file')
+    args = parser.parse_args()
+
+    # Caches would turn every repeat into a hit; set before the app reads its config
+    os.environ.setdefault('DETECT_CACHE_ENABLED', 'false')
+    os.environ.setdefault('RAW_CACHE_ENABLED', 'false')
+    os.environ.setdefault('RENDER_OUTPUT_MEMORY_BYTES', '0')
+    results = run_benchmarks(args)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({
+                "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+                "model": args.model or "stub",
+                "results": results
+            }, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"\nProcess peak RSS: {rss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10):.1f} MiB")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline["results"], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
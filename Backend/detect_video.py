@@ -0,0 +1,92 @@
+"""Detect diseases in walk-through videos from the command line.
+
+Runs the same pipeline as /api/detect/video: the tiled model on every Nth frame, an IoU
+tracker across those sampled frames, one summary per tracked lesion (its frame numbers are
+sampled frames). Inputs are video files, or
+directories of still frames (read in name order). Run from the Backend directory:
+
+    python detect_video.py bed1.mp4 bed2.mp4 --frame-stride 10 -o tracks.json
+    python detect_video.py frames/ --fps 30
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict
+
+from app.schemas.detection import VideoParams
+from app.services.registry import registry
+from app.services.video import ImageFrames, VideoFrames, run_video
+from app.utils.uploads import IMAGE_EXTENSIONS
+
+
+def frame_source(path: str, params: VideoParams):
+    if not os.path.isdir(path):
+        return VideoFrames(path, params.frame_stride, params.max_frames)
+    frame_paths = sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )
+    if not frame_paths:
+        raise ValueError(f"No images in {path}")
+
+    def read(frame_path: str) -> bytes:
+        with open(frame_path, 'rb') as f:
+            return f.read()
+
+    return ImageFrames(
+        [lambda frame_path=frame_path: read(frame_path) for frame_path in frame_paths],
+        params.frame_stride, params.max_frames, params.fps
+    )
+
+
+def print_summary(path: str, summary: Dict) -> None:
+    print(f"{path}: {summary['frames_processed']}/{summary['frames_total']} frames processed "
+          f"in {summary['processing_time']:.1f}s, {len(summary['tracks'])} tracks")
+    for track in summary['tracks']:
+        seen = (f"{track['first_seen']:.1f}-{track['last_seen']:.1f}s" if track['first_seen'] is not None
+                else f"frames {track['first_frame']}-{track['last_frame']}")
+        print(f"  #{track['track_id']:<4} {track['class']:<28} {track['severity']:<6} "
+              f"{track['confidence']:.2f}  {seen}  ({track['frames_detected']} detections)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help='video files or directories of frames')
+    parser.add_argument('-o', '--output', help='write the summaries as JSON, keyed by input')
+    parser.add_argument('--frame-stride', type=int, help='run the model on every Nth frame')
+    parser.add_argument('--max-frames', type=int, help='stop after this many frames')
+    parser.add_argument('--fps', type=float, help='frame rate of frame directories')
+    parser.add_argument('--min-hits', type=int, help='sampled frames a track needs to be reported')
+    parser.add_argument('--tile-size', type=int)
+    parser.add_argument('--conf', dest='conf_threshold', type=float)
+    parser.add_argument('--tiling', choices=['exhaustive', 'vegetation', 'coarse'])
+    parser.add_argument('--max-tiles', type=int)
+    args = vars(parser.parse_args())
+    inputs, output = args.pop('inputs'), args.pop('output')
+    params = VideoParams(**{name: value for name, value in args.items() if value is not None})
+
+    registry.load()
+    if registry.error:
+        print(f"Could not load model: {registry.error}", file=sys.stderr)
+        return 1
+
+    results, failed = {}, 0
+    for path in inputs:
+        try:
+            summary = run_video(frame_source(path, params), params)
+        except Exception as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        print_summary(path, summary)
+        results[path] = summary
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
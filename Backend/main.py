@@ -1,10 +1,30 @@
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-import os
-from app.routes import detection, metrics, gemini_vision, chat
+from app.config import PLANT_METRICS_SIMULATE
+from app.routes import batch, detection, metrics, video, gemini_vision, chat, health, telemetry
+from app.services.registry import registry
+from app.services.executor import detection_executor
+from app.services.image_store import image_store
+from app.services.timeseries import metric_store
 
-main = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load and warm up the detection model in the background so the process
+    # starts accepting connections; /api/health/ready stays 503 until it is done.
+    asyncio.get_running_loop().run_in_executor(None, registry.load)
+    image_store.start_sweeper()
+    simulator = asyncio.create_task(metrics.publish_simulated_metrics()) if PLANT_METRICS_SIMULATE else None
+    yield
+    if simulator is not None:
+        simulator.cancel()
+    image_store.stop_sweeper()
+    metric_store.flush()
+    detection_executor.shutdown()
+
+main = FastAPI(lifespan=lifespan)
 
 # Simpler CORS configuration
 main.add_middleware(
@@ -15,18 +35,21 @@ main.add_middleware(
     allow_headers=["*"]
 )
 
-# Create a directory for storing processed images
-UPLOAD_DIR = "static/processed_images"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Per-route latency histograms and the optional Server-Timing breakdown
+main.middleware("http")(telemetry.timing_middleware)
 
-# Serve static files
+# Serve static files; annotated images live in static/processed_images (see app/services/image_store.py)
 main.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Include routers
 main.include_router(detection.router, prefix="/api", tags=["detection"])
+main.include_router(batch.router, prefix="/api", tags=["detection"])
+main.include_router(video.router, prefix="/api", tags=["detection"])
 main.include_router(metrics.router, prefix="/api", tags=["metrics"])
 main.include_router(gemini_vision.router, prefix="/api", tags=["gemini-vision"])
 main.include_router(chat.router, prefix="/api", tags=["chat"])
+main.include_router(health.router, prefix="/api", tags=["health"])
+main.include_router(telemetry.router, prefix="/api", tags=["telemetry"])
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:main", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
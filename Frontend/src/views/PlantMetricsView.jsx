@@ -10,32 +10,54 @@ const PlantMetricsView = () => {
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
 
-  const fetchMetrics = async () => {
-    try {
-      const response = await fetch('http://localhost:8000/api/plant-metrics')
-      if (!response.ok) {
-        throw new Error('Failed to fetch metrics')
-      }
-      const data = await response.json()
-      setMetrics(data)
+  useEffect(() => {
+    let pollInterval = null
+
+    const merge = changed => {
+      setMetrics(current => {
+        const byType = new Map(current.map(metric => [metric.metric_type, metric]))
+
+        changed.forEach(metric => byType.set(metric.metric_type, metric))
+
+        return Array.from(byType.values())
+      })
       setError(null)
-    } catch (err) {
-      console.error('Error fetching metrics:', err)
-      setError('Failed to fetch metrics data')
-    } finally {
       setLoading(false)
     }
-  }
 
-  useEffect(() => {
-    // Initial fetch
-    fetchMetrics()
+    const fetchMetrics = async () => {
+      try {
+        const response = await fetch('http://localhost:8000/api/plant-metrics')
 
-    // Set up polling interval (every 5 seconds)
-    const interval = setInterval(fetchMetrics, 5000)
+        if (!response.ok) throw new Error('Failed to fetch metrics')
+        merge(await response.json())
+      } catch (err) {
+        console.error('Error fetching metrics:', err)
+        setError('Failed to fetch metrics data')
+        setLoading(false)
+      }
+    }
+
+    // The server pushes every metric on connect, then only the ones that changed
+    const source = new EventSource('http://localhost:8000/api/plant-metrics/stream')
 
-    // Cleanup interval on component unmount
-    return () => clearInterval(interval)
+    source.addEventListener('metrics', event => merge(JSON.parse(event.data)))
+
+    source.onerror = () => {
+      // EventSource reconnects by itself unless the server refused the stream (e.g. too many
+      // subscribers): fall back to polling every 5 seconds
+      if (source.readyState === EventSource.CLOSED && pollInterval === null) {
+        console.error('Metrics stream closed, polling instead')
+        fetchMetrics()
+        pollInterval = setInterval(fetchMetrics, 5000)
+      }
+    }
+
+    // Close the stream and stop polling on component unmount
+    return () => {
+      source.close()
+      if (pollInterval !== null) clearInterval(pollInterval)
+    }
   }, [])
 
   if (error) {
@@ -1,16 +1,52 @@
-from ultralytics import YOLO
+"""
+Tiled cauliflower disease detection over whole directories of images.
+
+Images are decoded by a pool of reader threads that stays a few images ahead of
+inference, and split across worker processes that each load the model once. Results
+are appended to progress.jsonl in the output directory as they finish, so an
+interrupted run picks up where it stopped; detections.csv and detections.coco.json
+are written from it at the end.
+
+    python predict.py survey/ --output results/ --workers 4 --save-images
+    python predict.py "fields/**/*.jpg" --output results/ --format csv
+"""
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain, islice
 import cv2
 import numpy as np
-import os
-from typing import Tuple, List, Dict
-from itertools import product
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+DISEASE_DESCRIPTIONS = {
+    'Cf_blk_rot': 'Cauliflower Black Rot Disease',
+    'Cf_healthy_l': 'Healthy Cauliflower Leaf',
+    'Cf_healthy_v': 'Healthy Cauliflower Vegetable',
+    'Cf_r_spot': 'Cauliflower Ring Spot Disease',
+    'Cf_s_rot': 'Cauliflower Soft Rot Disease'
+}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+DEFAULT_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'cauliflower_model.pt')
+PROGRESS_FILE = 'progress.jsonl'
 
 class TiledPredictor:
-    def __init__(self, model_path: str, tile_size: int = 640, overlap: float = 0.2, conf_threshold: float = 0.25):
+    def __init__(self, model_path: str, tile_size: int = 640, overlap: float = 0.2, conf_threshold: float = 0.25,
+                 batch_size: int = 8):
+        # Imported here so only the processes that run the model load torch
+        from ultralytics import YOLO
         self.model = YOLO(model_path, task='detect')
         self.tile_size = tile_size
         self.overlap = overlap
         self.conf_threshold = conf_threshold
+        self.batch_size = max(1, batch_size)
         
     def split_image(self, image: np.ndarray) -> Tuple[List[Dict], Tuple[int, int]]:
         """Split image into overlapping tiles."""
@@ -59,19 +95,11 @@ class TiledPredictor:
 
     def get_detections(self, boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray) -> List[Dict]:
         """Convert detections to a structured format with descriptive labels."""
-        disease_descriptions = {
-            'Cf_blk_rot': 'Cauliflower Black Rot Disease',
-            'Cf_healthy_l': 'Healthy Cauliflower Leaf',
-            'Cf_healthy_v': 'Healthy Cauliflower Vegetable',
-            'Cf_r_spot': 'Cauliflower Ring Spot Disease',
-            'Cf_s_rot': 'Cauliflower Soft Rot Disease'
-        }
-        
         detections = []
         for box, score, cls in zip(boxes, scores, classes):
             class_name = self.model.names[int(cls)]
             detections.append({
-                "class": disease_descriptions.get(class_name, class_name),
+                "class": DISEASE_DESCRIPTIONS.get(class_name, class_name),
                 "original_class": class_name,
                 "confidence": float(score),
                 "bbox": box.tolist(),  # Make sure it's a list
@@ -94,7 +122,10 @@ class TiledPredictor:
         original_img = cv2.imread(image_path)
         if original_img is None:
             raise ValueError("Could not load image")
+        return self.predict_array(original_img)
         
+    def predict_array(self, original_img: np.ndarray, draw: bool = True) -> Tuple[np.ndarray, List[Dict]]:
+        """Predict on an already decoded image; draws the detections on it in place unless draw=False."""
         # Split image into tiles
         tiles, (height, width) = self.split_image(original_img)
         
@@ -103,19 +134,16 @@ class TiledPredictor:
         all_scores = []
         all_classes = []
         
-        # Process each tile
-        for tile_info in tiles:
-            tile = tile_info['tile']
-            tile_pos = tile_info['position']
-            
-            # Run inference on tile
-            results = self.model(tile, conf=self.conf_threshold)
+        # Run inference on batches of tiles
+        for start in range(0, len(tiles), self.batch_size):
+            batch = tiles[start:start + self.batch_size]
+            results = self.model([tile_info['tile'] for tile_info in batch], conf=self.conf_threshold, verbose=False)
             
-            for r in results:
+            for tile_info, r in zip(batch, results):
                 if len(r.boxes) > 0:
                     # Get boxes and adjust coordinates to original image space
                     boxes = r.boxes.xyxy.cpu().numpy()
-                    adjusted_boxes = self.adjust_coordinates(boxes, tile_pos)
+                    adjusted_boxes = self.adjust_coordinates(boxes, tile_info['position'])
                     
                     all_boxes.extend(adjusted_boxes)
                     all_scores.extend(r.boxes.conf.cpu().numpy())
@@ -128,13 +156,14 @@ class TiledPredictor:
             all_scores = np.array(all_scores)
             all_classes = np.array(all_classes)
             
-            # Apply NMS to remove overlapping boxes
-            indices = cv2.dnn.NMSBoxes(
-                all_boxes.tolist(),
+            # Apply NMS to remove overlapping boxes (NMSBoxes takes x, y, width, height)
+            xywh = np.concatenate([all_boxes[:, :2], all_boxes[:, 2:] - all_boxes[:, :2]], axis=1)
+            indices = np.asarray(cv2.dnn.NMSBoxes(
+                xywh.tolist(),
                 all_scores.tolist(),
                 self.conf_threshold,
                 0.45  # NMS threshold
-            )
+            ), dtype=int).reshape(-1)
             
             # Get final detections
             final_boxes = all_boxes[indices]
@@ -144,45 +173,287 @@ class TiledPredictor:
             # Get structured detections
             final_detections = self.get_detections(final_boxes, final_scores, final_classes)
             
-            # Draw final predictions
-            for detection in final_detections:
-                box = detection["bbox"]
-                label = f'{detection["class"]} ({detection["severity"]}) {detection["confidence"]:.2f}'
-                
-                # Draw rectangle
-                cv2.rectangle(original_img,
-                            (int(box[0]), int(box[1])),
-                            (int(box[2]), int(box[3])),
-                            (0, 255, 0), 2)
-                
-                # Add label with better positioning and background
-                label_size, baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                text_x = int(box[0])
-                text_y = int(box[1]) - 10 if int(box[1]) - 10 > label_size[1] else int(box[1]) + 10 + label_size[1]
-                
-                # Draw background rectangle for text
-                cv2.rectangle(original_img,
-                            (text_x, text_y - label_size[1] - baseline),
-                            (text_x + label_size[0], text_y + baseline),
-                            (0, 0, 0), cv2.FILLED)
-                
-                # Draw text
-                cv2.putText(original_img, label,
-                           (text_x, text_y),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+            if draw:
+                self.draw_detections(original_img, final_detections)
         
         return original_img, final_detections
 
-def predict_image(image_path: str, conf_threshold: float = 0.25) -> None:
-    """Main prediction function."""
+    def draw_detections(self, image: np.ndarray, detections: List[Dict]) -> None:
+        """Draw boxes and labels on the image in place."""
+        for detection in detections:
+            box = detection["bbox"]
+            label = f'{detection["class"]} ({detection["severity"]}) {detection["confidence"]:.2f}'
+
+            # Draw rectangle
+            cv2.rectangle(image,
+                        (int(box[0]), int(box[1])),
+                        (int(box[2]), int(box[3])),
+                        (0, 255, 0), 2)
+
+            # Add label with better positioning and background
+            label_size, baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
+            text_x = int(box[0])
+            text_y = int(box[1]) - 10 if int(box[1]) - 10 > label_size[1] else int(box[1]) + 10 + label_size[1]
+
+            # Draw background rectangle for text
+            cv2.rectangle(image,
+                        (text_x, text_y - label_size[1] - baseline),
+                        (text_x + label_size[0], text_y + baseline),
+                        (0, 0, 0), cv2.FILLED)
+
+            # Draw text
+            cv2.putText(image, label,
+                       (text_x, text_y),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+def predict_image(image_path: str, conf_threshold: float = 0.25,
+                  model_path: str = DEFAULT_MODEL) -> Tuple[np.ndarray, List[Dict]]:
+    """Predict on a single image; returns the annotated image and its detections."""
     predictor = TiledPredictor(
-        model_path=os.path.join(os.path.dirname(__file__)+'models/cauliflower_model.pt'),
+        model_path=model_path,
         tile_size=640,
         overlap=0.2,
         conf_threshold=conf_threshold
     )
-    predictor.predict(image_path)
+    return predictor.predict(image_path)
+
+
+def find_images(inputs: Iterable[str]) -> List[str]:
+    """Image files in the given directories (recursively), glob patterns and files, sorted and deduplicated."""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.update(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+        elif os.path.isfile(item):
+            paths.add(item)
+        else:
+            paths.update(
+                path for path in glob.glob(item, recursive=True)
+                if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)
+            )
+    return sorted(os.path.normpath(path) for path in paths)
+
+
+def load_progress(path: str) -> Dict[str, Dict]:
+    """Records of a previous run by image path; the last record for an image wins."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # line cut short by an interrupted run
+            records[record['image']] = record
+    return records
+
+
+# Per-process state, set up once by init_worker
+_predictor: Optional[TiledPredictor] = None
+_reader: Optional[ThreadPoolExecutor] = None
+_prefetch = 8
+_annotated_dir: Optional[str] = None
+_root = ''
+_results: Optional[multiprocessing.Queue] = None
+
+
+def init_worker(model_path: str, tile_size: int, overlap: float, conf_threshold: float, batch_size: int,
+                readers: int, prefetch: int, annotated_dir: Optional[str], root: str,
+                results: Optional[multiprocessing.Queue] = None) -> None:
+    global _predictor, _reader, _prefetch, _annotated_dir, _root, _results
+    _predictor = TiledPredictor(model_path, tile_size, overlap, conf_threshold, batch_size)
+    # cv2.imread releases the GIL, so threads decode in parallel with inference
+    _reader = ThreadPoolExecutor(max_workers=max(1, readers), thread_name_prefix='reader')
+    _prefetch = max(1, prefetch)
+    _annotated_dir = annotated_dir
+    _root = root
+    _results = results
+
+
+def read_ahead(paths: Iterable[str], depth: int) -> Iterator[Tuple[str, Optional[np.ndarray]]]:
+    """Decoded images in order, with up to depth more being read in the background."""
+    pending = deque()
+    for path in paths:
+        pending.append((path, _reader.submit(cv2.imread, path)))
+        if len(pending) > depth:
+            path, image = pending.popleft()
+            yield path, image.result()
+    while pending:
+        path, image = pending.popleft()
+        yield path, image.result()
+
+
+def process_image(path: str, image: Optional[np.ndarray]) -> Dict:
+    record = {'image': path}
+    try:
+        if image is None:
+            raise ValueError("Could not load image")
+        height, width = image.shape[:2]
+        _, detections = _predictor.predict_array(image, draw=_annotated_dir is not None)
+        if _annotated_dir is not None:
+            output_path = os.path.join(_annotated_dir, os.path.relpath(path, _root))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            cv2.imwrite(output_path, image)
+        record.update(width=width, height=height, detections=detections)
+    except Exception as e:
+        record['error'] = str(e)
+    return record
+
+
+def process_chunks(chunks: List[List[str]]) -> Iterator[List[Dict]]:
+    """Yield the records of each chunk in turn.
+
+    Reading runs ahead across chunk boundaries, so the next chunk's first images are
+    already decoded when the current chunk's last one is being inferred.
+    """
+    images = read_ahead(chain.from_iterable(chunks), _prefetch)
+    for chunk in chunks:
+        yield [process_image(path, image) for path, image in islice(images, len(chunk))]
+
+
+def process_shard(chunks: List[List[str]]) -> None:
+    """Worker process task: detect on its share of the chunks, sending each chunk's records back as it finishes."""
+    for records in process_chunks(chunks):
+        _results.put(records)
+
+
+def run_chunks(chunks: List[List[str]], workers: int, init_args: Tuple) -> Iterator[List[Dict]]:
+    """Yield each chunk's records as it finishes, in this process or across worker processes."""
+    if workers <= 1:
+        init_worker(*init_args)
+        yield from process_chunks(chunks)
+        return
+    # spawn rather than fork: CUDA and the model's thread pools do not survive fork
+    context = multiprocessing.get_context('spawn')
+    # Each worker takes every n-th chunk as one long task, so its reader never runs dry between chunks
+    results = context.Queue()
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker,
+                             initargs=(*init_args, results)) as pool:
+        shards = [pool.submit(process_shard, chunks[worker::workers]) for worker in range(workers)]
+        for _ in chunks:
+            while True:
+                try:
+                    yield results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    # A crashed worker would otherwise leave us waiting forever
+                    for shard in shards:
+                        if shard.done() and shard.exception() is not None:
+                            raise shard.exception()
+
+
+def write_csv(records: List[Dict], path: str) -> None:
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['image', 'class', 'original_class', 'confidence', 'severity', 'x1', 'y1', 'x2', 'y2'])
+        for record in records:
+            for detection in record.get('detections', []):
+                writer.writerow([
+                    record['image'], detection['class'], detection['original_class'],
+                    f"{detection['confidence']:.4f}", detection['severity'],
+                    *(f'{value:.1f}' for value in detection['bbox'])
+                ])
+
+
+def write_coco(records: List[Dict], path: str) -> None:
+    """COCO-style detections: images, categories and annotations (bbox as x, y, width, height, plus score)."""
+    categories = {name: index + 1 for index, name in enumerate(DISEASE_DESCRIPTIONS)}
+    images, annotations = [], []
+    for image_id, record in enumerate(records, start=1):
+        images.append({'id': image_id, 'file_name': record['image'], 'width': record['width'], 'height': record['height']})
+        for detection in record['detections']:
+            category = categories.setdefault(detection['original_class'], len(categories) + 1)
+            x1, y1, x2, y2 = detection['bbox']
+            annotations.append({
+                'id': len(annotations) + 1,
+                'image_id': image_id,
+                'category_id': category,
+                'bbox': [x1, y1, x2 - x1, y2 - y1],
+                'area': (x2 - x1) * (y2 - y1),
+                'score': detection['confidence'],
+                'severity': detection['severity'],
+                'iscrowd': 0
+            })
+    with open(path, 'w') as f:
+        json.dump({
+            'images': images,
+            'annotations': annotations,
+            'categories': [
+                {'id': category, 'name': name, 'description': DISEASE_DESCRIPTIONS.get(name, name)}
+                for name, category in categories.items()
+            ]
+        }, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='image files, directories (searched recursively) or glob patterns')
+    parser.add_argument('--output', '-o', required=True, help='directory for detections and progress')
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--format', choices=['coco', 'csv', 'both'], default='both')
+    parser.add_argument('--save-images', action='store_true', help='also write annotated images under OUTPUT/annotated')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 4),
+                        help='worker processes, each holding its own copy of the model')
+    parser.add_argument('--readers', type=int, default=2, help='decoding threads per worker')
+    parser.add_argument('--prefetch', type=int, default=8, help='images decoded ahead of inference per worker')
+    parser.add_argument('--chunk-size', type=int, default=8, help='images handed to a worker at a time')
+    parser.add_argument('--tile-size', type=int, default=640)
+    parser.add_argument('--overlap', type=float, default=0.2)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--batch-size', type=int, default=8, help='tiles per forward pass')
+    parser.add_argument('--restart', action='store_true', help='ignore the progress of a previous run')
+    args = parser.parse_args()
+
+    images = find_images(args.inputs)
+    if not images:
+        sys.exit('No images found')
+    os.makedirs(args.output, exist_ok=True)
+    progress_path = os.path.join(args.output, PROGRESS_FILE)
+    if args.restart and os.path.exists(progress_path):
+        os.remove(progress_path)
+
+    # Images that failed last time are retried
+    records = load_progress(progress_path)
+    todo = [path for path in images if path not in records or 'error' in records[path]]
+    print(f"{len(images)} images, {len(images) - len(todo)} already done, {len(todo)} to process", file=sys.stderr)
+
+    root = os.path.commonpath([os.path.abspath(path) for path in images])
+    root = root if os.path.isdir(root) else os.path.dirname(root)
+    annotated_dir = os.path.join(args.output, 'annotated') if args.save_images else None
+    init_args = (args.model, args.tile_size, args.overlap, args.conf, args.batch_size, args.readers, args.prefetch,
+                 annotated_dir, root)
+    chunks = [todo[i:i + args.chunk_size] for i in range(0, len(todo), args.chunk_size)]
+
+    start = time.perf_counter()
+    done = failed = 0
+    megapixels = 0.0
+    with open(progress_path, 'a') as progress:
+        for chunk_records in run_chunks(chunks, args.workers, init_args):
+            for record in chunk_records:
+                progress.write(json.dumps(record) + '\n')
+                records[record['image']] = record
+                if 'error' in record:
+                    failed += 1
+                    print(f"  {record['image']}: {record['error']}", file=sys.stderr)
+                else:
+                    megapixels += record['width'] * record['height'] / 1e6
+            progress.flush()
+            done += len(chunk_records)
+            elapsed = time.perf_counter() - start
+            rate = done / elapsed
+            eta = (len(todo) - done) / rate if rate else 0
+            print(f"{done}/{len(todo)}  {rate:.2f} img/s  {megapixels / elapsed:.1f} MP/s  "
+                  f"{failed} failed  ETA {eta:.0f}s", file=sys.stderr)
+
+    finished = [records[path] for path in images if path in records and 'error' not in records[path]]
+    if args.format in ('csv', 'both'):
+        write_csv(finished, os.path.join(args.output, 'detections.csv'))
+    if args.format in ('coco', 'both'):
+        write_coco(finished, os.path.join(args.output, 'detections.coco.json'))
+    print(f"Wrote detections for {len(finished)} images to {args.output}", file=sys.stderr)
+
 
 if __name__ == '__main__':
-    image_path = "Bacterial-Soft-Rot-of-Cauliflower-Head.jpg"
-    predict_image(image_path)
\ No newline at end of file
+    main()
@@ -0,0 +1,272 @@
+"""
+Quantize the exported cauliflower ONNX model to INT8 and compare it with FP32.
+
+Calibrates on a sample of the Roboflow dataset fetched by download.py, then
+reports per-class mAP and per-image latency for both models. The report is
+written next to the INT8 model; the backend only serves the INT8 variant when
+the report shows the accuracy drop is within INT8_MAX_MAP_DROP.
+
+    python quantize.py --model runs/detect/experimentv8/weights/best.onnx \
+        --data DiseasedLeafDetection-1 --output ../Backend/app/services/models/cauliflower_model.int8.onnx
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+import onnx
+from onnxruntime.quantization import (
+    CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+)
+
+# Reuse the backend's preprocessing and output decoding so the numbers match production
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Backend'))
+from app.services.backends import OnnxBackend  # noqa: E402
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# Ultralytics exports name nodes after their module, e.g. /model.22/dfl/conv/Conv
+MODULE_NODE = re.compile(r'^/model\.(\d+)/')
+IMAGE_EXTENSIONS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def list_images(directory: str) -> List[str]:
+    paths = []
+    for pattern in IMAGE_EXTENSIONS:
+        paths.extend(glob.glob(os.path.join(directory, pattern)))
+    return sorted(paths)
+
+
+class TileCalibrationReader(CalibrationDataReader):
+    """Feeds letterboxed dataset images to the static quantization calibrator."""
+
+    def __init__(self, backend: OnnxBackend, image_paths: List[str]):
+        self.backend = backend
+        self.image_paths = iter(image_paths)
+
+    def get_next(self):
+        for path in self.image_paths:
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            image, _, _ = self.backend.letterbox(image)
+            blob = image[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+            return {self.backend.input_name: blob}
+        return None
+
+
+def load_labels(image_path: str, shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Read YOLO-format labels for an image as (xyxy boxes in pixels, classes)."""
+    labels_dir = os.path.join(os.path.dirname(os.path.dirname(image_path)), 'labels')
+    label_path = os.path.join(labels_dir, os.path.splitext(os.path.basename(image_path))[0] + '.txt')
+    if not os.path.exists(label_path):
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.int64)
+
+    rows = np.loadtxt(label_path, ndmin=2, dtype=np.float32)
+    if rows.size == 0:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.int64)
+    # Polygon labels: keep their bounding box
+    if rows.shape[1] > 5:
+        xs, ys = rows[:, 1::2], rows[:, 2::2]
+        rows = np.stack([rows[:, 0], (xs.min(1) + xs.max(1)) / 2, (ys.min(1) + ys.max(1)) / 2,
+                         xs.max(1) - xs.min(1), ys.max(1) - ys.min(1)], axis=1)
+
+    height, width = shape
+    cx, cy, w, h = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    return boxes, rows[:, 0].astype(np.int64)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match_predictions(pred_boxes: np.ndarray, pred_classes: np.ndarray,
+                      gt_boxes: np.ndarray, gt_classes: np.ndarray) -> np.ndarray:
+    """Return a (predictions, IoU thresholds) boolean matrix of true positives."""
+    correct = np.zeros((len(pred_boxes), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+        return correct
+    iou = box_iou(gt_boxes, pred_boxes) * (gt_classes[:, None] == pred_classes[None, :])
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        gt_idx, pred_idx = np.nonzero(iou >= threshold)
+        if len(gt_idx) == 0:
+            continue
+        # Highest IoU pairs first, each prediction and ground truth used once
+        order = iou[gt_idx, pred_idx].argsort()[::-1]
+        gt_idx, pred_idx = gt_idx[order], pred_idx[order]
+        _, first = np.unique(pred_idx, return_index=True)
+        gt_idx, pred_idx = gt_idx[first], pred_idx[first]
+        _, first = np.unique(gt_idx, return_index=True)
+        correct[pred_idx[first], t] = True
+    return correct
+
+
+def average_precision(recall: np.ndarray, precision: np.ndarray) -> float:
+    """COCO-style 101-point interpolated AP."""
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([1.0], precision, [0.0]))
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    points = np.linspace(0, 1, 101)
+    return float(np.trapezoid(np.interp(points, recall, precision), points))
+
+
+def evaluate(backend: OnnxBackend, image_paths: List[str], conf_threshold: float = 0.001) -> Dict:
+    """Per-class mAP50 / mAP50-95 and latency per image (one letterboxed model input) for one model."""
+    correct, scores, pred_classes, gt_classes = [], [], [], []
+    latencies = []
+    for path in image_paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        start = time.perf_counter()
+        boxes, conf, classes = backend.infer([image], conf_threshold)[0]
+        latencies.append(time.perf_counter() - start)
+
+        gt_boxes, gt_cls = load_labels(path, image.shape[:2])
+        correct.append(match_predictions(boxes, classes.astype(np.int64), gt_boxes, gt_cls))
+        scores.append(conf)
+        pred_classes.append(classes.astype(np.int64))
+        gt_classes.append(gt_cls)
+
+    correct = np.concatenate(correct) if correct else np.zeros((0, len(IOU_THRESHOLDS)), bool)
+    scores = np.concatenate(scores) if scores else np.zeros(0)
+    pred_classes = np.concatenate(pred_classes) if pred_classes else np.zeros(0, np.int64)
+    gt_classes = np.concatenate(gt_classes) if gt_classes else np.zeros(0, np.int64)
+
+    per_class = {}
+    order = scores.argsort()[::-1]
+    correct, pred_classes = correct[order], pred_classes[order]
+    for class_id, class_name in backend.names.items():
+        num_gt = int((gt_classes == class_id).sum())
+        if num_gt == 0:
+            continue
+        tp = correct[pred_classes == class_id]
+        if len(tp) == 0:
+            per_class[class_name] = {"instances": num_gt, "map50": 0.0, "map50_95": 0.0}
+            continue
+        tp_cum = tp.cumsum(axis=0)
+        fp_cum = (~tp).cumsum(axis=0)
+        recall = tp_cum / num_gt
+        precision = tp_cum / np.maximum(tp_cum + fp_cum, 1)
+        aps = [average_precision(recall[:, t], precision[:, t]) for t in range(len(IOU_THRESHOLDS))]
+        per_class[class_name] = {"instances": num_gt, "map50": aps[0], "map50_95": float(np.mean(aps))}
+
+    latencies_ms = np.array(latencies) * 1000.0
+    return {
+        "per_class": per_class,
+        "map50": float(np.mean([c["map50"] for c in per_class.values()])) if per_class else 0.0,
+        "map50_95": float(np.mean([c["map50_95"] for c in per_class.values()])) if per_class else 0.0,
+        "image_latency_ms": {
+            "mean": float(latencies_ms.mean()) if len(latencies_ms) else 0.0,
+            "p50": float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else 0.0,
+            "p95": float(np.percentile(latencies_ms, 95)) if len(latencies_ms) else 0.0,
+        },
+    }
+
+
+def head_nodes(model_path: str) -> List[str]:
+    """Nodes of the detection head: the last module and any decoding after it.
+
+    Box regression (DFL and the grid/stride decode) and the final concat of boxes and class
+    scores mix value ranges that do not survive 8-bit activations, so they stay FP32.
+    """
+    nodes = onnx.load(model_path, load_external_data=False).graph.node
+    modules = [int(match.group(1)) for node in nodes if (match := MODULE_NODE.match(node.name))]
+    if not modules:
+        raise ValueError("Cannot find the detection head: node names are not /model.N/...; use --mode dynamic")
+    head = f"/model.{max(modules)}/"
+    # Everything from the first head node on (post-processing nodes are not under a module)
+    first = next(i for i, node in enumerate(nodes) if node.name.startswith(head))
+    return [node.name for node in nodes[first:] if not MODULE_NODE.match(node.name) or node.name.startswith(head)]
+
+
+def print_report(fp32: Dict, int8: Dict) -> None:
+    print(f"\n{'class':<16}{'inst':>6}{'FP32 mAP50':>12}{'INT8 mAP50':>12}{'drop':>8}"
+          f"{'FP32 50-95':>12}{'INT8 50-95':>12}")
+    for class_name, fp in fp32["per_class"].items():
+        q = int8["per_class"].get(class_name, {"map50": 0.0, "map50_95": 0.0})
+        print(f"{class_name:<16}{fp['instances']:>6}{fp['map50']:>12.4f}{q['map50']:>12.4f}"
+              f"{fp['map50'] - q['map50']:>8.4f}{fp['map50_95']:>12.4f}{q['map50_95']:>12.4f}")
+    print(f"{'all':<16}{'':>6}{fp32['map50']:>12.4f}{int8['map50']:>12.4f}"
+          f"{fp32['map50'] - int8['map50']:>8.4f}{fp32['map50_95']:>12.4f}{int8['map50_95']:>12.4f}")
+    print("\nPer-image latency (ms)  mean    p50    p95")
+    for label, result in (("FP32", fp32), ("INT8", int8)):
+        latency = result["image_latency_ms"]
+        print(f"{label:<22}{latency['mean']:>7.1f}{latency['p50']:>7.1f}{latency['p95']:>7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the detection model to INT8 and compare it with FP32")
+    parser.add_argument('--model', required=True, help="FP32 ONNX model exported by train.py")
+    parser.add_argument('--data', default='DiseasedLeafDetection-1', help="Dataset directory from download.py")
+    parser.add_argument('--output', help="INT8 model path (default: <model>.int8.onnx)")
+    parser.add_argument('--mode', choices=['static', 'dynamic'], default='static')
+    parser.add_argument('--calib-size', type=int, default=200, help="Training images used for calibration")
+    parser.add_argument('--eval-size', type=int, default=0, help="Validation images to evaluate (0 = all)")
+    parser.add_argument('--threads', type=int, default=0, help="ONNX Runtime intra-op threads (0 = auto)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.model)[0] + '.int8.onnx'
+    rng = random.Random(args.seed)
+    fp32_backend = OnnxBackend(args.model, intra_op_threads=args.threads)
+
+    if args.mode == 'static':
+        calib_images = list_images(os.path.join(args.data, 'train', 'images'))
+        calib_images = rng.sample(calib_images, min(args.calib_size, len(calib_images)))
+        excluded = head_nodes(args.model)
+        print(f"Calibrating on {len(calib_images)} images ({len(excluded)} head nodes kept in FP32)...")
+        quantize_static(
+            args.model, output,
+            TileCalibrationReader(fp32_backend, calib_images),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            nodes_to_exclude=excluded
+        )
+    else:
+        quantize_dynamic(args.model, output, weight_type=QuantType.QUInt8)
+    print(f"Saved INT8 model to {output}")
+
+    eval_images = list_images(os.path.join(args.data, 'valid', 'images'))
+    if args.eval_size:
+        eval_images = rng.sample(eval_images, min(args.eval_size, len(eval_images)))
+    print(f"Evaluating on {len(eval_images)} validation images...")
+    fp32 = evaluate(fp32_backend, eval_images)
+    int8 = evaluate(OnnxBackend(output, intra_op_threads=args.threads), eval_images)
+    print_report(fp32, int8)
+
+    drops = [
+        fp32["per_class"][name]["map50"] - int8["per_class"].get(name, {"map50": 0.0})["map50"]
+        for name in fp32["per_class"]
+    ]
+    report = {
+        "fp32_model": os.path.abspath(args.model),
+        "int8_model": os.path.abspath(output),
+        "mode": args.mode,
+        "fp32": fp32,
+        "int8": int8,
+        "map50_drop": fp32["map50"] - int8["map50"],
+        "max_class_map50_drop": max(drops) if drops else 0.0,
+    }
+    report_path = output + '.report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The backend is imported as it is when run from the Backend directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Backend'))
@@ -0,0 +1,121 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.broadcast import Broadcaster, SubscriberLimitError
+
+
+def values(message):
+    return {item["key"]: item["value"] for item in json.loads(message)}
+
+
+def test_message_since_coalesces_latest_payload_per_key():
+    broadcaster = Broadcaster()
+    broadcaster.publish({"a": '{"key": "a", "value": 1}'})
+    broadcaster.publish({"a": '{"key": "a", "value": 2}', "b": '{"key": "b", "value": 3}'})
+    assert values(broadcaster.message_since(0)) == {"a": 2, "b": 3}
+    assert values(broadcaster.message_since(1)) == {"a": 2, "b": 3}
+    broadcaster.publish({"b": '{"key": "b", "value": 4}'})
+    assert values(broadcaster.message_since(2)) == {"b": 4}
+    assert broadcaster.message_since(3) is None
+
+
+def test_message_since_is_shared_until_next_publish():
+    broadcaster = Broadcaster()
+    broadcaster.publish({"a": '{"key": "a", "value": 1}'})
+    message = broadcaster.message_since(0)
+    assert broadcaster.message_since(0) is message
+    broadcaster.publish({"a": '{"key": "a", "value": 2}'})
+    assert broadcaster.message_since(0) is not message
+
+
+def test_empty_publish_is_ignored():
+    broadcaster = Broadcaster()
+    broadcaster.publish({})
+    assert broadcaster.version == 0
+
+
+def test_subscribe_rejects_over_limit_and_releases_on_close():
+    async def run():
+        broadcaster = Broadcaster(max_subscribers=2)
+        first = broadcaster.subscribe(0.01, 10)
+        second = broadcaster.subscribe(0.01, 10)
+        with pytest.raises(SubscriberLimitError):
+            broadcaster.subscribe(0.01, 10)
+        assert broadcaster.subscribers == 2
+        # Never iterated, and closed twice
+        await first.aclose()
+        await first.aclose()
+        assert broadcaster.subscribers == 1
+        third = broadcaster.subscribe(0.01, 10)
+        await second.aclose()
+        await third.aclose()
+        assert broadcaster.subscribers == 0
+
+    asyncio.run(run())
+
+
+def test_subscriber_gets_changes_after_subscribing_then_keepalives():
+    async def run():
+        broadcaster = Broadcaster()
+        broadcaster.publish({"a": '{"key": "a", "value": 1}'})
+        updates = broadcaster.subscribe(0.01, 0.05)
+        broadcaster.publish({"b": '{"key": "b", "value": 2}'})
+        assert values(await updates.__anext__()) == {"b": 2}
+        assert await updates.__anext__() is None
+        await updates.aclose()
+        with pytest.raises(StopAsyncIteration):
+            await updates.__anext__()
+
+    asyncio.run(run())
+
+
+def test_updates_within_interval_are_merged():
+    async def run():
+        broadcaster = Broadcaster()
+        updates = broadcaster.subscribe(0.2, 10)
+        broadcaster.publish({"a": '{"key": "a", "value": 1}'})
+        assert values(await updates.__anext__()) == {"a": 1}
+        for value in (2, 3):
+            broadcaster.publish({"a": f'{{"key": "a", "value": {value}}}'})
+        broadcaster.publish({"b": '{"key": "b", "value": 4}'})
+        assert values(await updates.__anext__()) == {"a": 3, "b": 4}
+        await updates.aclose()
+
+    asyncio.run(run())
+
+
+def test_bounded_drops_reader_that_stops_reading():
+    async def run():
+        broadcaster = Broadcaster()
+        updates = broadcaster.subscribe(0.01, 10)
+        messages = updates.bounded(0.05)
+        broadcaster.publish({"a": '{"key": "a", "value": 1}'})
+        assert values(await messages.__anext__()) == {"a": 1}
+        # One message fits in the queue; the next one times out
+        for value in (2, 3):
+            broadcaster.publish({"a": f'{{"key": "a", "value": {value}}}'})
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.1)
+        assert broadcaster.dropped == 1
+        assert broadcaster.subscribers == 0
+        with pytest.raises(StopAsyncIteration):
+            await messages.__anext__()
+
+    asyncio.run(run())
+
+
+def test_closing_bounded_reader_unsubscribes():
+    async def run():
+        broadcaster = Broadcaster()
+        updates = broadcaster.subscribe(0.01, 10)
+        messages = updates.bounded(1)
+        broadcaster.publish({"a": '{"key": "a", "value": 1}'})
+        await messages.__anext__()
+        await messages.aclose()
+        assert broadcaster.subscribers == 0
+        await asyncio.sleep(0.01)
+        assert broadcaster.dropped == 0
+
+    asyncio.run(run())
@@ -0,0 +1,88 @@
+import os
+import time
+from dataclasses import dataclass
+
+import pytest
+
+from app.services.cache import ResultCache, cache_key
+
+
+@dataclass
+class Entry:
+    value: str
+    nbytes: int = 100
+
+
+def test_cache_key_depends_on_every_part():
+    key = cache_key("image", "v1", conf_threshold=0.25, tile_size=640)
+    assert key == cache_key("image", "v1", tile_size=640, conf_threshold=0.25)
+    assert key != cache_key("image", "v2", conf_threshold=0.25, tile_size=640)
+    assert key != cache_key("other", "v1", conf_threshold=0.25, tile_size=640)
+    assert key != cache_key("image", "v1", conf_threshold=0.3, tile_size=640)
+
+
+def test_memory_tier_evicts_least_recently_used_by_size():
+    cache = ResultCache(max_memory_bytes=300)
+    for key in "abc":
+        cache.put(key, Entry(key))
+    cache.get("a")  # now the most recently used
+    cache.put("d", Entry("d"))
+
+    assert cache.get("b") is None
+    assert [cache.get(key).value for key in "acd"] == ["a", "c", "d"]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["memory_bytes"] == 300
+
+
+def test_large_entries_evict_several_and_oversized_ones_are_skipped():
+    cache = ResultCache(max_memory_bytes=300)
+    for key in "abc":
+        cache.put(key, Entry(key))
+    cache.put("big", Entry("big", nbytes=250))
+    assert cache.stats()["entries"] == 1
+    cache.put("huge", Entry("huge", nbytes=301))
+    assert cache.get("huge") is None
+    assert cache.get("big") is not None
+
+
+def test_replacing_an_entry_updates_its_size():
+    cache = ResultCache(max_memory_bytes=1000)
+    cache.put("a", Entry("a", nbytes=400))
+    cache.put("a", Entry("a2", nbytes=100))
+    assert cache.stats()["memory_bytes"] == 100
+    assert cache.get("a").value == "a2"
+
+
+def test_hit_and_miss_counters():
+    cache = ResultCache(max_memory_bytes=1000)
+    cache.put("a", Entry("a"))
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_rate"] == pytest.approx(0.5)
+
+
+def test_disk_tier_survives_a_restart_and_promotes_hits(tmp_path):
+    ResultCache(1000, str(tmp_path)).put("a", Entry("a"))
+
+    cache = ResultCache(1000, str(tmp_path))
+    assert cache.get("a").value == "a"
+    assert cache.get("a").value == "a"
+    assert (cache.stats()["disk_hits"], cache.stats()["memory_hits"]) == (1, 1)
+
+
+def test_disk_entries_expire_after_ttl(tmp_path):
+    ResultCache(1000, str(tmp_path), ttl_seconds=60).put("a", Entry("a"))
+    path = tmp_path / "a.pkl"
+    old = time.time() - 120
+    os.utime(path, (old, old))
+
+    assert ResultCache(1000, str(tmp_path), ttl_seconds=60).get("a") is None
+    assert not path.exists()
+
+
+def test_unreadable_disk_entries_are_dropped(tmp_path):
+    (tmp_path / "a.pkl").write_bytes(b"not a pickle")
+    assert ResultCache(1000, str(tmp_path)).get("a") is None
+    assert not (tmp_path / "a.pkl").exists()
@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def detection(tmp_path, monkeypatch):
+    # Importing the routes creates the app's image store under the working directory
+    monkeypatch.chdir(tmp_path)
+    from app.routes import detection
+    from app.services.predict import TiledPredictor
+    from app.services.registry import registry
+    from benchmarks.pipeline import StubBackend
+    predictor = TiledPredictor(registry.default_model_path, backend=StubBackend())
+    monkeypatch.setitem(registry._predictors, registry.default_model_path, predictor)
+    return detection
+
+
+def webp_image(seed: int) -> bytes:
+    image = np.random.default_rng(seed).integers(0, 255, (480, 700, 3), dtype=np.uint8)
+    ok, encoded = cv2.imencode('.webp', image)
+    assert ok
+    return encoded.tobytes()
+
+
+def test_repeat_webp_upload_never_decodes(detection, monkeypatch):
+    from app.schemas.detection import DetectionParams
+    from app.services.predict import TiledPredictor
+    from app.utils.image_info import image_info
+
+    data = webp_image(seed=1)
+    assert image_info(data) is None  # no size in the header: planning needs a decode
+    decodes = []
+    decode = TiledPredictor.decode
+    monkeypatch.setattr(TiledPredictor, 'decode', staticmethod(lambda image_bytes: decodes.append(1) or decode(image_bytes)))
+    params = DetectionParams(render='none')
+
+    first = detection.run_detection(data, params, batched=False)
+    assert not first.cached
+    assert len(decodes) == 1
+
+    second = detection.run_detection(data, params, batched=False)
+    assert second.cached
+    assert len(decodes) == 1
+    assert second.detections == first.detections
+    assert second.plan == first.plan
+
+
+def test_lower_threshold_reuses_raw_predictions_without_decoding(detection, monkeypatch):
+    from app.schemas.detection import DetectionParams
+    from app.services.predict import TiledPredictor
+
+    data = webp_image(seed=2)
+    first = detection.run_detection(data, DetectionParams(render='none', conf_threshold=0.5), batched=False)
+    monkeypatch.setattr(TiledPredictor, 'decode', staticmethod(lambda image_bytes: pytest.fail("decoded")))
+    lower = detection.run_detection(data, DetectionParams(render='none', conf_threshold=0.2), batched=False)
+    assert not lower.cached
+    assert len(lower.detections) >= len(first.detections)
+    assert lower.plan == first.plan
@@ -0,0 +1,54 @@
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+from app.utils.image_info import ImageInfo, image_info
+
+
+def encode(image: np.ndarray, ext: str) -> bytes:
+    return cv2.imencode(ext, image)[1].tobytes()
+
+
+def with_orientation(jpeg: bytes, orientation: int, endian: str = '<') -> bytes:
+    """Insert an EXIF APP1 segment holding just the orientation tag after the SOI marker."""
+    byte_order = b'II' if endian == '<' else b'MM'
+    tiff = byte_order + struct.pack(endian + 'HI', 42, 8)
+    tiff += struct.pack(endian + 'H', 1) + struct.pack(endian + 'HHIHH', 0x0112, 3, 1, orientation, 0)
+    tiff += struct.pack(endian + 'I', 0)
+    segment = b'Exif\x00\x00' + tiff
+    return jpeg[:2] + b'\xff\xe1' + struct.pack('>H', len(segment) + 2) + segment + jpeg[2:]
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).integers(0, 256, (30, 50, 3), dtype=np.uint8)
+
+
+def test_png(image):
+    assert image_info(encode(image, '.png')) == ImageInfo(30, 50, 'png')
+
+
+def test_jpeg(image):
+    assert image_info(encode(image, '.jpg')) == ImageInfo(30, 50, 'jpeg', 1)
+
+
+@pytest.mark.parametrize("endian", ['<', '>'])
+@pytest.mark.parametrize("orientation, shape", [(1, (30, 50)), (3, (30, 50)), (6, (50, 30)), (8, (50, 30))])
+def test_exif_orientation_swaps_rotated_sides(image, endian, orientation, shape):
+    data = with_orientation(encode(image, '.jpg'), orientation, endian)
+    info = image_info(data)
+    assert info == ImageInfo(*shape, 'jpeg', orientation)
+    # Matches what OpenCV decodes, since it applies the orientation too
+    assert cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR).shape[:2] == info.shape
+
+
+@pytest.mark.parametrize("data", [b'', b'not an image', b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n'])
+def test_unreadable_headers(data):
+    assert image_info(data) is None
+
+
+def test_truncated_jpeg_before_frame_header(image):
+    data = encode(image, '.jpg')
+    assert image_info(data[:20]) is None
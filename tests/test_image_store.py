@@ -0,0 +1,44 @@
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Importing the module creates the app's own store under the working directory
+    monkeypatch.chdir(tmp_path)
+    from app.services.image_store import ImageStore
+    return ImageStore(str(tmp_path / "images"), "/images", max_bytes=1000, ttl_seconds=3600)
+
+
+def test_put_counts_bytes_and_returns_url(store):
+    assert store.put("a.jpg", b"x" * 100) == "/images/a.jpg"
+    store.put("b.jpg", b"x" * 50)
+    assert store.stats()["bytes"] == 150
+    assert store.lookup("a.jpg") == "/images/a.jpg"
+    assert store.lookup("missing.jpg") is None
+
+
+def test_overwriting_a_name_counts_only_the_new_size(store):
+    store.put("a.jpg", b"x" * 400)
+    store.put("a.jpg", b"x" * 400)
+    # Still under budget, so no sweep has corrected the count
+    assert store.stats()["bytes"] == 400
+    store.put("a.jpg", b"x" * 300)
+    assert store.stats()["bytes"] == 300
+    assert store.sweep() == {"removed": 0, "removed_bytes": 0}
+    assert store.stats()["bytes"] == 300
+    assert os.path.exists(os.path.join(store.directory, "a.jpg"))
+
+
+def test_going_over_budget_evicts_least_recently_used(store):
+    now = time.time()
+    for age, name in ((30, "a.jpg"), (20, "b.jpg"), (10, "c.jpg")):
+        store.put(name, b"x" * 400)
+        # Distinct mtimes so the eviction order does not depend on timestamp resolution
+        os.utime(store._path(name), (now - age, now - age))
+    assert store.lookup("a.jpg") is None
+    assert store.lookup("b.jpg") is not None
+    assert store.stats()["bytes"] == 800
+    assert store.stats()["evicted"] == 1
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from app.services.merge import merge_detections, nms, soft_nms, tile_border_flags, weighted_box_fusion
+
+
+def arrays(boxes, scores, classes):
+    return np.array(boxes, np.float32), np.array(scores, np.float32), np.array(classes, np.float32)
+
+
+def test_nms_keeps_best_of_overlapping_boxes_per_class():
+    boxes, scores, classes = arrays(
+        [[0, 0, 10, 10], [1, 1, 11, 11], [0, 0, 10, 10], [50, 50, 60, 60]],
+        [0.6, 0.9, 0.8, 0.5],
+        [0, 0, 1, 0]
+    )
+    kept_boxes, kept_scores, kept_classes = nms(boxes, scores, classes, 0.45)
+    # The class 1 box overlaps the winner exactly but is never suppressed by it
+    np.testing.assert_array_equal(kept_scores, np.float32([0.9, 0.8, 0.5]))
+    np.testing.assert_array_equal(kept_classes, [0, 1, 0])
+    np.testing.assert_array_equal(kept_boxes[0], [1, 1, 11, 11])
+
+
+def test_nms_threshold_is_exclusive():
+    # IoU of these two boxes is exactly 0.5
+    boxes, scores, classes = arrays([[0, 0, 30, 10], [10, 0, 40, 10]], [0.9, 0.8], [0, 0])
+    assert len(nms(boxes, scores, classes, 0.5)[0]) == 2
+    assert len(nms(boxes, scores, classes, 0.49)[0]) == 1
+
+
+def test_nms_empty():
+    boxes, scores, classes = arrays(np.zeros((0, 4)), [], [])
+    assert len(nms(boxes, scores, classes, 0.45)[0]) == 0
+
+
+def test_soft_nms_decays_instead_of_removing():
+    boxes, scores, classes = arrays([[0, 0, 10, 10], [0, 0, 10, 9], [30, 30, 40, 40]], [0.9, 0.8, 0.7], [0, 0, 0])
+    _, kept_scores, _ = soft_nms(boxes, scores, classes, 0.3, score_threshold=0.01)
+    assert len(kept_scores) == 3
+    iou = 0.9
+    np.testing.assert_allclose(sorted(kept_scores, reverse=True), [0.9, 0.7, 0.8 * np.exp(-iou ** 2 / 0.5)], rtol=1e-5)
+
+
+def test_soft_nms_drops_boxes_decayed_below_threshold():
+    boxes, scores, classes = arrays([[0, 0, 10, 10], [0, 0, 10, 10]], [0.9, 0.3], [0, 0])
+    _, kept_scores, _ = soft_nms(boxes, scores, classes, 0.3, score_threshold=0.25)
+    np.testing.assert_allclose(kept_scores, [0.9])
+
+
+def test_soft_nms_leaves_low_overlap_alone():
+    boxes, scores, classes = arrays([[0, 0, 10, 10], [8, 0, 18, 10]], [0.9, 0.8], [0, 0])
+    _, kept_scores, _ = soft_nms(boxes, scores, classes, 0.3, score_threshold=0.0)
+    np.testing.assert_allclose(kept_scores, [0.9, 0.8], rtol=1e-6)
+
+
+def test_wbf_averages_overlapping_boxes_by_score():
+    boxes, scores, classes = arrays([[0, 0, 10, 10], [2, 2, 12, 12]], [0.75, 0.25], [0, 0])
+    fused, fused_scores, fused_classes = weighted_box_fusion(boxes, scores, classes, 0.3)
+    np.testing.assert_allclose(fused, [[0.5, 0.5, 10.5, 10.5]])
+    np.testing.assert_allclose(fused_scores, [0.75])
+    np.testing.assert_array_equal(fused_classes, [0])
+
+
+def test_wbf_keeps_classes_apart():
+    boxes, scores, classes = arrays([[0, 0, 10, 10], [0, 0, 10, 10]], [0.9, 0.8], [0, 1])
+    fused, _, fused_classes = weighted_box_fusion(boxes, scores, classes, 0.3)
+    assert len(fused) == 2
+    assert sorted(fused_classes) == [0, 1]
+
+
+def test_wbf_joins_an_object_split_by_a_tile_seam():
+    # One object spanning x 80-140; the left tile ends at x = 120 and the right one starts at 100.
+    # Each tile sees part of it, and the two parts overlap too little by IoU (0.31).
+    boxes, scores, classes = arrays([[80, 10, 120, 50], [100, 12, 140, 48]], [0.9, 0.6], [0, 0])
+    truncated = np.array([[False, False, True, False], [True, False, False, False]])
+    assert len(weighted_box_fusion(boxes, scores, classes, 0.4)[0]) == 2
+
+    fused, fused_scores, _ = weighted_box_fusion(boxes, scores, classes, 0.4, truncated)
+    assert len(fused) == 1
+    x1, y1, x2, y2 = fused[0]
+    # Cut sides do not pull the fused box inwards: each comes from the half where it is a real edge
+    assert (x1, x2) == (80, 140)
+    assert y1 == pytest.approx((10 * 0.9 + 12 * 0.6) / 1.5)
+    assert y2 == pytest.approx((50 * 0.9 + 48 * 0.6) / 1.5)
+    assert fused_scores[0] == pytest.approx(0.9)
+
+
+def test_wbf_uses_outermost_edge_when_every_member_is_cut():
+    boxes, scores, classes = arrays([[0, 0, 100, 10], [0, 0, 98, 10]], [0.9, 0.6], [0, 0])
+    truncated = np.array([[False, False, True, False], [False, False, True, False]])
+    fused, _, _ = weighted_box_fusion(boxes, scores, classes, 0.3, truncated)
+    assert fused[0, 2] == 100
+
+
+def test_tile_border_flags_ignore_image_borders():
+    boxes = np.array([[0, 0, 20, 20], [101, 101, 150, 150], [150, 150, 200, 200]], np.float32)
+    # Interior tile: left and top at 100, right and bottom on the image border
+    flags = tile_border_flags(boxes, (100, 100, 200, 200), height=200, width=200)
+    np.testing.assert_array_equal(flags, [
+        [True, True, False, False],
+        [True, True, False, False],
+        [False, False, False, False],
+    ])
+    # Top-left tile of a larger image: only the right and bottom edges are interior
+    flags = tile_border_flags(boxes, (0, 0, 200, 200), height=400, width=400)
+    np.testing.assert_array_equal(flags[:, :2], False)
+    np.testing.assert_array_equal(flags[2], [False, False, True, True])
+
+
+def test_merge_detections_dispatch():
+    boxes, scores, classes = arrays([[0, 0, 10, 10], [1, 1, 11, 11]], [0.9, 0.8], [0, 0])
+    for strategy in ('nms', 'wbf'):
+        assert len(merge_detections(boxes, scores, classes, strategy)[0]) == 1
+    assert len(merge_detections(boxes, scores, classes, 'soft_nms', score_threshold=0.0)[0]) == 2
+    with pytest.raises(ValueError):
+        merge_detections(boxes, scores, classes, 'mean')
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from app.services.predict import RawPredictions, TiledPredictor
+from app.services.tiling import TilingPolicy, grid_tiles, to_original
+from app.utils.image_info import ImageInfo
+
+
+def raw_predictions(boxes, image_shape):
+    boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+    return RawPredictions(
+        boxes, np.full(len(boxes), 0.9, np.float32), np.zeros(len(boxes), np.float32),
+        np.zeros((len(boxes), 4), bool), 640, 0.2, 0.25, image_shape
+    )
+
+
+@pytest.mark.parametrize("height, width", [(100, 100), (640, 640), (641, 640), (3000, 4000), (1080, 1920)])
+def test_grid_tiles_matches_predictor_grid(height, width):
+    predictor = TiledPredictor.__new__(TiledPredictor)
+    predictor.tile_size, predictor.overlap = 640, 0.2
+    assert grid_tiles(height, width, 640, 0.2) == len(predictor.tile_grid(height, width))
+
+
+def test_no_budget_keeps_full_resolution():
+    plan = TilingPolicy().plan(ImageInfo(4000, 3000, 'jpeg'), 640, 0.2)
+    assert plan.full_resolution
+    assert plan.tile_budget is None
+    assert plan.decode_factor == 1
+    assert plan.tiles == grid_tiles(4000, 3000, 640, 0.2)
+
+
+@pytest.mark.parametrize("budget", [4, 12, 30, 47])
+def test_budget_picks_largest_scale_that_fits(budget):
+    plan = TilingPolicy(min_scale=0.1).plan(ImageInfo(4000, 3000, 'png'), 640, 0.2, budget)
+    assert plan.tiles <= budget
+    # A slightly larger scale would no longer fit
+    height, width = plan.working_shape
+    assert grid_tiles(round(height * 1.02), round(width * 1.02), 640, 0.2) > budget
+    assert plan.scale == pytest.approx(width / 3000)
+
+
+def test_budget_never_goes_below_min_scale():
+    plan = TilingPolicy(min_scale=0.25).plan(ImageInfo(4000, 3000, 'png'), 640, 0.2, budget=1)
+    assert plan.working_shape == (1000, 750)
+    assert plan.tiles > 1  # over budget rather than too small to detect anything
+
+
+def test_reduced_jpeg_decode_only_when_still_large_enough():
+    policy = TilingPolicy(min_scale=0.1)
+    plan = policy.plan(ImageInfo(4000, 3000, 'jpeg'), 640, 0.2, budget=1)
+    assert plan.decode_factor == 4
+    assert 3000 / plan.decode_factor >= plan.working_shape[1]
+    assert policy.plan(ImageInfo(4000, 3000, 'png'), 640, 0.2, budget=1).decode_factor == 1
+
+
+def test_tile_budget_takes_the_tighter_limit():
+    policy = TilingPolicy(max_tiles=100)
+    assert policy.tile_budget() == 100
+    assert policy.tile_budget(max_tiles=20) == 20
+    assert policy.tile_budget(latency_budget_ms=500, seconds_per_tile=0.05) == 10
+    assert policy.tile_budget(max_tiles=5, latency_budget_ms=500, seconds_per_tile=0.05) == 5
+    assert TilingPolicy().tile_budget() is None
+
+
+def test_fit_resizes_to_working_shape():
+    policy = TilingPolicy()
+    plan = policy.plan(ImageInfo(400, 300, 'png'), 64, 0.2, budget=4)
+    image = np.zeros((400, 300, 3), np.uint8)
+    assert policy.fit(image, plan).shape[:2] == plan.working_shape
+
+
+def test_to_original_scales_boxes_back():
+    plan = TilingPolicy(min_scale=0.1).plan(ImageInfo(2000, 3000, 'png'), 640, 0.2, budget=2)
+    sy = plan.working_shape[0] / 2000
+    sx = plan.working_shape[1] / 3000
+    raw = raw_predictions([[10 * sx, 20 * sy, 110 * sx, 220 * sy]], plan.working_shape)
+
+    mapped = to_original(raw, plan)
+    np.testing.assert_allclose(mapped.boxes, [[10, 20, 110, 220]], rtol=1e-4)
+    assert mapped.image_shape == (2000, 3000)
+    assert mapped.working_shape == plan.working_shape
+    # The input is left untouched
+    assert raw.boxes[0, 2] == pytest.approx(110 * sx)
+
+
+def test_to_original_is_a_no_op_at_full_resolution():
+    plan = TilingPolicy().plan(ImageInfo(500, 500, 'png'), 640, 0.2)
+    raw = raw_predictions([[1, 2, 3, 4]], (500, 500))
+    assert to_original(raw, plan) is raw
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+
+from app.services.timeseries import HOUR, MINUTE, RAW, RAW_DTYPE, Buckets, MetricSeries, RingSeries, TimeSeriesStore
+
+CAPACITIES = {RAW.name: 100, MINUTE.name: 10, HOUR.name: 100}
+
+
+def raw_rows(t):
+    rows = np.empty(len(t), RAW_DTYPE)
+    rows['t'] = t
+    rows['value'] = np.asarray(t) * 10
+    return rows
+
+
+def test_ring_wraps_and_keeps_time_order():
+    ring = RingSeries(RAW_DTYPE, 5)
+    ring.append(raw_rows([0, 1, 2]))
+    assert ring.holds(0)
+    ring.append(raw_rows([3, 4, 5, 6]))
+
+    assert ring.size == 5
+    assert ring.last()['t'] == 6
+    assert not ring.holds(1)
+    assert ring.holds(2)
+    np.testing.assert_array_equal(ring.window(0, 100)['t'], [2, 3, 4, 5, 6])
+    np.testing.assert_array_equal(ring.window(3, 6)['t'], [3, 4, 5])
+
+
+def test_append_longer_than_capacity_keeps_the_newest():
+    ring = RingSeries(RAW_DTYPE, 4)
+    ring.append(raw_rows(np.arange(10.0)))
+    np.testing.assert_array_equal(ring.window(0, 100)['t'], [6, 7, 8, 9])
+
+
+def test_memory_mapped_ring_recovers_its_head(tmp_path):
+    path = str(tmp_path / "series.npy")
+    ring = RingSeries(RAW_DTYPE, 5, path)
+    ring.append(raw_rows([0.0, 1.0, 2.0]))
+    ring.append(raw_rows(np.arange(3.0, 8.0)))
+    ring.flush()
+    del ring
+
+    reopened = RingSeries(RAW_DTYPE, 5, path)
+    assert (reopened.size, reopened.head) == (5, 3)
+    np.testing.assert_array_equal(reopened.window(0, 100)['t'], [3, 4, 5, 6, 7])
+    reopened.append(raw_rows([8.0]))
+    np.testing.assert_array_equal(reopened.window(0, 100)['t'], [4, 5, 6, 7, 8])
+
+
+def test_resizing_a_memory_mapped_ring_keeps_the_newest_rows(tmp_path):
+    path = str(tmp_path / "series.npy")
+    ring = RingSeries(RAW_DTYPE, 5, path)
+    ring.append(raw_rows(np.arange(7.0)))
+    ring.flush()
+    del ring
+
+    smaller = RingSeries(RAW_DTYPE, 3, path)
+    np.testing.assert_array_equal(smaller.window(0, 100)['t'], [4, 5, 6])
+    assert smaller.last()['t'] == 6
+
+
+def test_reduce_aligns_buckets_to_the_step():
+    buckets = Buckets.of(RAW, raw_rows([0, 30, 59, 60, 150])).reduce(60)
+    np.testing.assert_array_equal(buckets.t, [0, 60, 120])
+    np.testing.assert_array_equal(buckets.count, [3, 1, 1])
+    np.testing.assert_array_equal(buckets.min, [0, 600, 1500])
+    np.testing.assert_array_equal(buckets.max, [590, 600, 1500])
+    np.testing.assert_allclose(buckets.mean, [890 / 3, 600, 1500])
+
+
+def test_ingest_rolls_up_across_calls():
+    series = MetricSeries("temperature", CAPACITIES)
+    series.ingest(np.array([0.0, 30.0]), np.array([1.0, 3.0]))
+    series.ingest(np.array([45.0, 70.0]), np.array([5.0, 7.0]))
+
+    minutes = series.buckets(MINUTE, 0, 3600)
+    np.testing.assert_array_equal(minutes.t, [0, 60])
+    np.testing.assert_array_equal(minutes.count, [3, 1])
+    np.testing.assert_array_equal(minutes.min, [1, 7])
+    np.testing.assert_array_equal(minutes.max, [5, 7])
+    hours = series.buckets(HOUR, 0, 3600)
+    np.testing.assert_array_equal(hours.count, [4])
+    np.testing.assert_allclose(hours.mean, [4.0])
+
+
+def test_ingest_drops_readings_older_than_the_newest():
+    series = MetricSeries("temperature", CAPACITIES)
+    assert series.ingest(np.array([100.0, 50.0]), np.array([1.0, 2.0])) == 2
+    assert series.ingest(np.array([40.0, 100.0, 120.0, np.nan]), np.array([1.0, 2.0, 3.0, 4.0])) == 2
+    assert series.latest() == (120.0, 3.0)
+
+
+@pytest.fixture
+def wrapped():
+    """Three hours of readings every 30 s: raw keeps the last 50 min, minutes the last 10."""
+    series = MetricSeries("temperature", CAPACITIES)
+    t = np.arange(0, 3 * 3600, 30.0)
+    series.ingest(t, np.ones_like(t))
+    return series, t[-1] + 1
+
+
+def test_query_picks_the_finest_level_that_reaches_back(wrapped):
+    series, end = wrapped
+    resolution, buckets = series.query(end - 600, end)
+    assert resolution == RAW.name
+    assert len(buckets.t) == 20
+    assert series.query(end - 2 * 3600, end)[0] == HOUR.name
+    # Too many raw points for max_points
+    assert series.query(end - 480, end, max_points=10)[0] == MINUTE.name
+
+
+def test_query_with_step_reduces_the_coarsest_fine_enough_level(wrapped):
+    series, end = wrapped
+    resolution, buckets = series.query(end - 480, end, step=120)
+    assert resolution == "120s"
+    # Minute buckets are included whole: 10260 is the one the window starts in
+    np.testing.assert_array_equal(buckets.t, [10200, 10320, 10440, 10560, 10680])
+    assert buckets.count.sum() == 18
+
+
+def test_query_with_step_falls_back_when_the_level_has_wrapped(wrapped):
+    series, end = wrapped
+    # Raw readings no longer reach back 100 minutes and minutes only keep 10; hours still do
+    resolution, buckets = series.query(end - 6000, end, step=30)
+    assert resolution == "3600s"
+    np.testing.assert_array_equal(buckets.t, [3600, 7200])
+    assert buckets.count.sum() == 240
+
+
+def test_aggregate_uses_the_finest_level_holding_start(wrapped):
+    series, end = wrapped
+    buckets = series.aggregate(end - 600, end)
+    assert buckets.count[0] == 20
+    assert series.aggregate(0, end).count[0] == 360
+    empty = series.aggregate(end + 10, end + 20)
+    assert empty.count[0] == 0 and np.isnan(empty.min[0])
+
+
+def test_store_creates_series_on_first_use(tmp_path):
+    store = TimeSeriesStore(CAPACITIES, str(tmp_path))
+    series = store.series("humidity")
+    assert store.series("humidity") is series
+    series.ingest(np.array([1.0]), np.array([50.0]))
+    store.flush()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["humidity.1h.npy", "humidity.1m.npy", "humidity.raw.npy"]
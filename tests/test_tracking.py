@@ -0,0 +1,126 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.services.tracking import IoUTracker, iou_matrix
+from app.services.video import prefetch
+
+
+def detection(box, confidence=0.9, original_class="Cf_r_spot", severity="High"):
+    return {
+        "class": f"{original_class} description",
+        "original_class": original_class,
+        "confidence": confidence,
+        "bbox": [float(v) for v in box],
+        "severity": severity
+    }
+
+
+def test_iou_matrix():
+    a = np.float32([[0, 0, 10, 10], [20, 20, 30, 30]])
+    b = np.float32([[0, 0, 10, 10], [5, 0, 15, 10]])
+    np.testing.assert_allclose(iou_matrix(a, b), [[1, 1 / 3], [0, 0]], rtol=1e-6)
+
+
+def test_overlapping_detections_extend_one_track_per_object():
+    tracker = IoUTracker(iou_threshold=0.3)
+    tracker.update(0, [detection([0, 0, 10, 10]), detection([100, 100, 110, 110])])
+    tracker.update(1, [detection([101, 101, 111, 111]), detection([1, 0, 11, 10])])
+    tracks = tracker.tracks()
+    assert [track.hits for track in tracks] == [2, 2]
+    np.testing.assert_array_equal(tracks[0].box, [1, 0, 11, 10])
+    np.testing.assert_array_equal(tracks[1].box, [101, 101, 111, 111])
+
+
+def test_unmatched_detection_starts_a_new_track():
+    tracker = IoUTracker(iou_threshold=0.3)
+    tracker.update(0, [detection([0, 0, 10, 10])])
+    tracker.update(1, [detection([50, 50, 60, 60])])
+    assert [track.track_id for track in tracker.tracks()] == [1, 2]
+
+
+def test_velocity_predicts_moving_box():
+    tracker = IoUTracker(iou_threshold=0.3)
+    for frame in range(3):
+        tracker.update(frame, [detection([4 * frame, 0, 4 * frame + 10, 10])])
+    # Smoothed velocity after moving 4 px twice: 0.5 * 2 + 0.5 * 4
+    np.testing.assert_allclose(tracker.active[0].predicted_box(3), [11, 0, 21, 10])
+    # Overlaps the last box by IoU 0.18, the predicted one by 0.43
+    tracker.update(3, [detection([15, 0, 25, 10])])
+    assert len(tracker.tracks()) == 1
+    assert tracker.tracks()[0].hits == 4
+
+
+def test_track_ends_after_max_missed_updates():
+    tracker = IoUTracker(iou_threshold=0.3, max_missed=2)
+    tracker.update(0, [detection([0, 0, 10, 10])])
+    tracker.update(1, [])
+    tracker.update(2, [])
+    assert len(tracker.active) == 1
+    tracker.update(3, [])
+    assert not tracker.active
+    assert len(tracker.finished) == 1
+    # The object reappearing after its track ended is a new track
+    tracker.update(4, [detection([0, 0, 10, 10])])
+    assert [track.track_id for track in tracker.tracks()] == [1, 2]
+
+
+def test_summary_takes_class_by_confidence_vote_and_best_of_that_class():
+    tracker = IoUTracker(iou_threshold=0.3)
+    tracker.update(0, [detection([0, 0, 10, 10], 0.6, "Cf_r_spot", "Low")])
+    tracker.update(1, [detection([0, 0, 10, 10], 0.95, "Cf_blk_rot", "High")])
+    tracker.update(2, [detection([1, 0, 11, 10], 0.7, "Cf_r_spot", "Medium")])
+    (summary,) = tracker.summaries(fps=10)
+    # 0.6 + 0.7 outvotes the single 0.95, whose severity and box must not leak in
+    assert summary["original_class"] == "Cf_r_spot"
+    assert summary["class"] == "Cf_r_spot description"
+    assert summary["confidence"] == 0.7
+    assert summary["severity"] == "Medium"
+    assert summary["best_frame"] == 2
+    assert summary["bbox"] == [1, 0, 11, 10]
+    assert summary["mean_confidence"] == pytest.approx(0.75)
+    assert (summary["first_seen"], summary["last_seen"]) == (0, 0.2)
+    assert summary["frames_detected"] == 3
+
+
+def test_summaries_skip_tracks_below_min_hits():
+    tracker = IoUTracker(iou_threshold=0.3)
+    tracker.update(0, [detection([0, 0, 10, 10]), detection([50, 50, 60, 60])])
+    tracker.update(1, [detection([0, 0, 10, 10])])
+    assert [summary["track_id"] for summary in tracker.summaries(min_hits=2)] == [1]
+    assert tracker.summaries()[0]["first_seen"] is None
+
+
+def test_prefetch_yields_items_in_order():
+    assert list(prefetch(iter(range(20)), depth=3)) == list(range(20))
+
+
+def test_prefetch_raises_producer_error_after_earlier_items():
+    def items():
+        yield 1
+        yield 2
+        raise ValueError("bad frame")
+
+    seen = []
+    with pytest.raises(ValueError, match="bad frame"):
+        for item in prefetch(items(), depth=2):
+            seen.append(item)
+    assert seen == [1, 2]
+
+
+def test_prefetch_stops_producer_when_consumer_stops():
+    produced = []
+
+    def items():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+
+    threads = threading.active_count()
+    iterator = prefetch(items(), depth=2)
+    assert next(iterator) == 0
+    iterator.close()
+    # The producer thread was joined, having read at most a few items past the queue
+    assert threading.active_count() == threads
+    assert len(produced) < 10